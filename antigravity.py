@@ -1,7 +1,92 @@
-
 import asyncio
+import json
+import os
 import random
-from playwright.async_api import async_playwright
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+try:
+    from playwright.async_api import async_playwright
+except ImportError:
+    # The install check and pool bookkeeping below work without it; launching a browser does not
+    async_playwright = None
+
+# Browsers are installed next to the app so hosted deployments (Streamlit Cloud) can find them
+BROWSERS_PATH = os.path.join(os.getcwd(), ".playwright")
+INSTALL_MARKER = ".chromium-installed.json"
+
+# Context pool limits (see ContextPool). Contexts stay open, and logged in, between tasks
+MIN_CONTEXTS = int(os.getenv("BOOKMARK_MIN_CONTEXTS", "2"))
+MAX_CONTEXTS = int(os.getenv("BOOKMARK_MAX_CONTEXTS", "8"))
+# Idle contexts beyond MIN_CONTEXTS are closed after this long
+CONTEXT_IDLE_TTL = 15 * 60
+# Long-lived pages leak memory on ad-heavy sites: a page is replaced after this many submissions,
+# a whole context after CONTEXT_MAX_USES
+PAGE_MAX_USES = int(os.getenv("BOOKMARK_PAGE_MAX_USES", "25"))
+CONTEXT_MAX_USES = int(os.getenv("BOOKMARK_CONTEXT_MAX_USES", "500"))
+# Pages are also replaced after every submission while the browser process tree is over this (0 = off)
+PAGE_RECYCLE_RSS_MB = float(os.getenv("BOOKMARK_PAGE_RECYCLE_RSS_MB", "0"))
+# process_tree_rss() walks /proc, so the pool samples it at most this often
+RSS_SAMPLE_INTERVAL = 2.0
+
+_install_lock = threading.Lock()
+_install_status = {"state": "not_checked", "detail": "", "checked_at": None}
+
+def _launch_args(proxy=None):
+    launch_args = []
+    if proxy:
+        launch_args.append(f"--proxy-server={proxy}")
+    return launch_args
+
+def _children(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The ppid is the second field after the parenthesized command name
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+def process_tree_rss(pid=None):
+    """
+    Resident memory (bytes) of a process and all its descendants - here Python plus the
+    Playwright driver and every Chromium process. psutil is used when installed.
+    """
+    pid = pid or os.getpid()
+    try:
+        import psutil  # optional
+        root = psutil.Process(pid)
+        total = 0
+        for process in [root] + root.children(recursive=True):
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    except ImportError:
+        pass
+
+    if not os.path.isdir("/proc"):
+        return 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm", "r") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+        pending.extend(_children(current))
+    return total
 
 class AntigravityWrapper:
     def __init__(self):
@@ -12,8 +97,8 @@ class AntigravityWrapper:
         """
         Launches the browser with optional proxy and random user-agent.
         """
-        self._playwright = await async_playwright().start()
-        
+        self._playwright = await _start_playwright()
+
         # Random User Agent List
         user_agents = [
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -21,14 +106,10 @@ class AntigravityWrapper:
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
              "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
         ]
-        
-        launch_args = []
-        if proxy:
-            launch_args.append(f"--proxy-server={proxy}")
 
         self._browser = await self._playwright.chromium.launch(
             headless=headless,
-            args=launch_args
+            args=_launch_args(proxy)
         )
         return self._browser
 
@@ -43,7 +124,518 @@ class AntigravityWrapper:
         finally:
             pass
 
+class PooledContext:
+    """
+    A context lent out by ContextPool, with submission counts for it and its pages.
+    """
+    def __init__(self, pool, key, context, label=None):
+        self.pool = pool
+        self.key = key
+        self.context = context
+        # Display name / cost key of what runs in it, e.g. the site
+        self.label = label
+        # True once it went back to the pool after a run, i.e. it is logged in
+        self.warm = False
+        # The BlockingProfile whose routes are installed on the context
+        self.blocking = None
+        self.uses = 0
+        self.released_at = None
+        self._pages = {}
+        self._idle_pages = []
+        self._recycle = set()
+
+    def open_pages(self):
+        return sum(1 for page in self._pages if not page.is_closed())
+
+    def recycle_pages(self):
+        """
+        Replaces every open page the next time it is used (frees what the pages leaked).
+        """
+        self._recycle = {page for page in self._pages if not page.is_closed()}
+
+    async def page(self):
+        """
+        An idle page of this context, or a new one.
+        """
+        while self._idle_pages:
+            page = self._idle_pages.pop()
+            if not page.is_closed():
+                return page
+        page = await self.context.new_page()
+        self._pages[page] = 0
+        return page
+
+    async def used(self, page):
+        """
+        Counts one submission on the page. Returns the page to go on with: the same one, or a
+        new one when it reached the pool's page_max_uses, memory is over budget or it crashed.
+        """
+        self.uses += 1
+        self._pages[page] = self._pages.get(page, 0) + 1
+        if (not page.is_closed() and page not in self._recycle
+                and self._pages[page] < self.pool.page_max_uses and not self.pool.over_memory()):
+            return page
+        self._recycle.discard(page)
+        self._pages.pop(page, None)
+        self.pool.stats["pages_recycled"] += 1
+        try:
+            await page.close()
+        except Exception:
+            pass
+        return await self.page()
+
+    async def _park_pages(self, keep):
+        # Keeps `keep` open pages for the next run and closes the rest
+        pages = [page for page in self._pages if not page.is_closed()]
+        for page in pages[keep:]:
+            self._pages.pop(page, None)
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self._idle_pages = pages[:keep]
+
+class ContextPool:
+    """
+    Browser contexts kept open between tasks, one warm (logged-in) context per key - a site
+    and its login - with their pages. At most max_size contexts are open at once (acquire
+    waits, or closes the least recently used idle one); idle ones beyond min_size are closed
+    after idle_ttl. Pages are replaced after page_max_uses submissions or while the process
+    tree is over max_rss_mb; contexts after context_max_uses or when their browser died.
+    Use from one event loop.
+    """
+    def __init__(self, new_context, min_size=MIN_CONTEXTS, max_size=MAX_CONTEXTS, page_max_uses=PAGE_MAX_USES,
+                 context_max_uses=CONTEXT_MAX_USES, idle_ttl=CONTEXT_IDLE_TTL, max_rss_mb=PAGE_RECYCLE_RSS_MB, idle_pages=1):
+        self._new_context = new_context
+        self.min_size = min_size
+        self.max_size = max(1, max_size)
+        self.page_max_uses = max(1, page_max_uses)
+        self.context_max_uses = context_max_uses
+        self.idle_ttl = idle_ttl
+        self.max_rss_mb = max_rss_mb
+        self.idle_pages = idle_pages
+        self._idle = {}
+        self._busy = set()
+        self._creating = 0
+        self._changed = None
+        self._closed = False
+        self._rss = (0.0, 0)
+        self.stats = {"created": 0, "reused": 0, "closed": 0, "pages_recycled": 0}
+
+    def over_memory(self):
+        if not self.max_rss_mb:
+            return False
+        sampled_at, rss = self._rss
+        now = time.monotonic()
+        if now - sampled_at > RSS_SAMPLE_INTERVAL:
+            rss = process_tree_rss()
+            self._rss = (now, rss)
+        return rss > self.max_rss_mb * 1_000_000
+
+    def _healthy(self, pooled):
+        browser = getattr(pooled.context, "browser", None)
+        if browser is not None and not browser.is_connected():
+            return False
+        return not self.context_max_uses or pooled.uses < self.context_max_uses
+
+    async def _close(self, pooled):
+        self.stats["closed"] += 1
+        try:
+            await pooled.context.close()
+        except Exception:
+            pass
+
+    async def _trim(self):
+        now = time.monotonic()
+        for pooled in sorted(self._idle.values(), key=lambda pooled: pooled.released_at):
+            if len(self._idle) <= self.min_size or now - pooled.released_at < self.idle_ttl:
+                break
+            del self._idle[pooled.key]
+            await self._close(pooled)
+
+    async def acquire(self, key, label=None, **context_options):
+        """
+        The warm context for key when a healthy one is idle, else a new one made with
+        context_options (e.g. storage_state). Check .warm to know whether it is logged in.
+        """
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        async with self._changed:
+            while True:
+                pooled = self._idle.pop(key, None)
+                if pooled is not None:
+                    if self._healthy(pooled):
+                        self._busy.add(pooled)
+                        self.stats["reused"] += 1
+                        return pooled
+                    await self._close(pooled)
+                    continue
+                if len(self._busy) + len(self._idle) + self._creating < self.max_size:
+                    break
+                if self._idle:
+                    # Make room: the least recently used idle context goes
+                    oldest = min(self._idle.values(), key=lambda pooled: pooled.released_at)
+                    del self._idle[oldest.key]
+                    await self._close(oldest)
+                    continue
+                await self._changed.wait()
+            self._creating += 1
+
+        try:
+            context = await self._new_context(**context_options)
+        finally:
+            async with self._changed:
+                self._creating -= 1
+                self._changed.notify_all()
+        pooled = PooledContext(self, key, context, label)
+        self._busy.add(pooled)
+        self.stats["created"] += 1
+        return pooled
+
+    async def release(self, pooled, keep=True):
+        """
+        Gives a context back: it stays open (with one idle page) for the next acquire of its
+        key, or is closed with keep=False, e.g. after an error left it in an unknown state.
+        """
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        async with self._changed:
+            self._busy.discard(pooled)
+            if keep and not self._closed and self._healthy(pooled) and pooled.key not in self._idle:
+                await pooled._park_pages(self.idle_pages)
+                pooled.warm = True
+                pooled.released_at = time.monotonic()
+                self._idle[pooled.key] = pooled
+            else:
+                await self._close(pooled)
+            await self._trim()
+            self._changed.notify_all()
+
+    def busy(self):
+        return len(self._busy)
+
+    def heaviest(self, weight):
+        """
+        The busy context with the largest weight(pooled), or None.
+        """
+        return max(self._busy, key=weight, default=None)
+
+    async def close_idle(self):
+        """
+        Closes every idle context now (memory pressure); returns how many.
+        """
+        idle, self._idle = list(self._idle.values()), {}
+        for pooled in idle:
+            await self._close(pooled)
+        return len(idle)
+
+    async def close(self):
+        """
+        Closes the idle contexts; contexts still lent out are closed when released.
+        """
+        idle, self._idle = list(self._idle.values()), {}
+        self._closed = True
+        for pooled in idle:
+            await self._close(pooled)
+
+    def summary(self):
+        return (f"Contexts: {self.stats['created']} created, {self.stats['reused']} reused warm, "
+                f"{len(self._idle)} kept; {self.stats['pages_recycled']} pages recycled")
+
+class BrowserManager:
+    """
+    Keeps one Playwright instance and Chromium process alive across batches.
+    Everything runs on a dedicated event-loop thread, so callers from any thread
+    (e.g. successive Streamlit script runs) share the same warm browser.
+    """
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._launch_lock = None
+        self._playwright = None
+        self._browsers = {}
+        self._pools = {}
+
+    def start(self):
+        """
+        Starts the background event-loop thread (idempotent).
+        """
+        with self._thread_lock:
+            if self._thread and self._thread.is_alive():
+                return
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _serve():
+                asyncio.set_event_loop(loop)
+                ready.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=_serve, name="antigravity-browser", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            self._launch_lock = None
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the browser thread and returns a concurrent.futures.Future.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro, timeout=None):
+        """
+        Runs a coroutine on the browser thread and blocks until it finishes.
+        """
+        return self.submit(coro).result(timeout)
+
+    def _check_loop(self):
+        if self._loop is None or asyncio.get_running_loop() is not self._loop:
+            raise RuntimeError("BrowserManager objects can only be used from coroutines passed to submit()/run()")
+
+    async def get_browser(self, headless=False, proxy=None):
+        """
+        Returns the shared browser for this launch configuration, relaunching it if it crashed.
+        """
+        self._check_loop()
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+
+        async with self._launch_lock:
+            key = (headless, proxy)
+            browser = self._browsers.get(key)
+            if browser is not None and browser.is_connected():
+                return browser
+
+            if browser is not None:
+                print("♻️ Shared browser disconnected, relaunching...")
+                self._browsers.pop(key, None)
+
+            if self._playwright is None:
+                self._playwright = await _start_playwright()
+
+            try:
+                browser = await self._playwright.chromium.launch(headless=headless, args=_launch_args(proxy))
+            except Exception:
+                # The driver itself may have died with the browser; start it again once
+                await self._stop_playwright()
+                self._playwright = await _start_playwright()
+                browser = await self._playwright.chromium.launch(headless=headless, args=_launch_args(proxy))
+
+            self._browsers[key] = browser
+            return browser
+
+    async def new_context(self, headless=False, proxy=None, **context_options):
+        """
+        Hands out a fresh context on the shared browser. Callers own (and close) the context.
+        """
+        browser = await self.get_browser(headless=headless, proxy=proxy)
+        try:
+            return await browser.new_context(**context_options)
+        except Exception:
+            if browser.is_connected():
+                raise
+            # Crashed between the health check and use
+            browser = await self.get_browser(headless=headless, proxy=proxy)
+            return await browser.new_context(**context_options)
+
+    def context_pool(self, headless=False, proxy=None):
+        """
+        The ContextPool of the shared browser for this launch configuration; its contexts
+        stay warm from one batch to the next. Only for coroutines passed to submit()/run().
+        """
+        key = (headless, proxy)
+        if key not in self._pools:
+            async def new_context(**context_options):
+                return await self.new_context(headless=headless, proxy=proxy, **context_options)
+            self._pools[key] = ContextPool(new_context)
+        return self._pools[key]
+
+    async def _stop_playwright(self):
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+    async def _close_all(self):
+        for pool in self._pools.values():
+            await pool.close()
+        self._pools.clear()
+        for browser in list(self._browsers.values()):
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        self._browsers.clear()
+        await self._stop_playwright()
+
+    def shutdown(self):
+        """
+        Closes every shared browser and stops the background thread.
+        """
+        with self._thread_lock:
+            if not (self._thread and self._thread.is_alive()):
+                return
+            asyncio.run_coroutine_threadsafe(self._close_all(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._thread = None
+
+async def _start_playwright():
+    if async_playwright is None:
+        raise RuntimeError("Playwright is not installed: pip install -r requirements.txt")
+    return await async_playwright().start()
+
+def _playwright_version():
+    try:
+        from importlib.metadata import version
+        return version("playwright")
+    except Exception:
+        return "unknown"
+
+def _has_chromium(browsers_path):
+    try:
+        return any(name.startswith("chromium") for name in os.listdir(browsers_path))
+    except OSError:
+        return False
+
+def install_status():
+    """
+    Returns a copy of the last browser install check: state is one of
+    not_checked, cached, installed or failed.
+    """
+    return dict(_install_status)
+
+def ensure_browsers_installed(browsers_path=BROWSERS_PATH, force=False):
+    """
+    Runs `playwright install chromium` at most once per process, and skips it entirely
+    when the marker in browsers_path shows this Playwright version was already installed.
+    A failed install is not retried on every Streamlit rerun; pass force=True to try again.
+    """
+    os.environ["PLAYWRIGHT_BROWSERS_PATH"] = browsers_path
+
+    with _install_lock:
+        if _install_status["state"] in ("cached", "installed", "failed") and not force:
+            return install_status()
+
+        marker_path = os.path.join(browsers_path, INSTALL_MARKER)
+        version = _playwright_version()
+
+        if not force and _has_chromium(browsers_path):
+            try:
+                with open(marker_path, "r", encoding="utf-8") as f:
+                    marker = json.load(f)
+            except (OSError, ValueError):
+                marker = {}
+            if marker.get("playwright") == version:
+                _install_status.update(state="cached", detail=f"Chromium ready (playwright {version})", checked_at=time.time())
+                return install_status()
+
+        try:
+            print(f"Installing Playwright browsers to {browsers_path}...")
+            subprocess.run([sys.executable, "-m", "playwright", "install", "chromium"], check=True)
+            os.makedirs(browsers_path, exist_ok=True)
+            with open(marker_path, "w", encoding="utf-8") as f:
+                json.dump({"playwright": version, "installed_at": time.time()}, f)
+            _install_status.update(state="installed", detail=f"Chromium installed (playwright {version})", checked_at=time.time())
+        except Exception as e:
+            print(f"⚠️ Failed to auto-install Playwright browsers: {e}")
+            _install_status.update(state="failed", detail=str(e), checked_at=time.time())
+
+        return install_status()
+
+# Resource types the submission forms never need
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "ping"}
+
+# Ad, tracking and analytics hosts seen on the bookmarking sites; matched as hostname substrings
+BLOCKED_HOST_PATTERNS = [
+    "googlesyndication.com", "doubleclick.net", "googleadservices.com", "adservice.google.",
+    "google-analytics.com", "googletagmanager.com", "googletagservices.com",
+    "facebook.net", "facebook.com/tr", "hotjar.com", "clarity.ms", "scorecardresearch.com",
+    "quantserve.com", "amazon-adsystem.com", "taboola.com", "outbrain.com", "adnxs.com",
+    "criteo.", "pubmatic.com", "rubiconproject.com", "statcounter.com", "histats.com",
+    "addthis.com", "sharethis.com", "disqus.com", "mc.yandex.ru",
+]
+
+# Always allowed, whatever the rules above say (Cloudflare challenges must run to reach the form)
+ALLOWED_HOST_PATTERNS = ["challenges.cloudflare.com", "/cdn-cgi/"]
+
+# Aborted requests are never downloaded, so savings are estimated from typical sizes
+ESTIMATED_BYTES = {"image": 40_000, "media": 400_000, "font": 35_000, "script": 30_000, "ping": 500}
+DEFAULT_ESTIMATED_BYTES = 10_000
+
+class BlockingProfile:
+    """
+    Request-routing rules for submission contexts: aborts heavy resource types and
+    ad/analytics hosts, with per-site allowlists, and counts what was saved.
+    """
+    def __init__(self, resource_types=None, host_patterns=None, allow_patterns=None, site_allowlists=None):
+        self.resource_types = set(BLOCKED_RESOURCE_TYPES if resource_types is None else resource_types)
+        self.host_patterns = list(BLOCKED_HOST_PATTERNS if host_patterns is None else host_patterns)
+        self.allow_patterns = list(ALLOWED_HOST_PATTERNS if allow_patterns is None else allow_patterns)
+        # {"abookmarking.com": ["cdn.example.com", "script"]} - hostname/URL substrings or resource types
+        self.site_allowlists = dict(site_allowlists or {})
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"blocked_requests": 0, "allowed_requests": 0, "estimated_bytes_saved": 0, "blocked_by_type": {}}
+
+    def allowlist_for(self, site_url):
+        host = urlparse(site_url).netloc.lower().replace("www.", "")
+        return self.allow_patterns + self.site_allowlists.get(host, [])
+
+    def should_block(self, url, resource_type, allowlist):
+        if resource_type in allowlist or any(pattern in url for pattern in allowlist):
+            return False
+        if resource_type in self.resource_types:
+            return True
+        host_and_path = url.split("://", 1)[-1].lower()
+        return any(pattern in host_and_path for pattern in self.host_patterns)
+
+    def _count(self, resource_type, blocked):
+        if not blocked:
+            self.stats["allowed_requests"] += 1
+            return
+        self.stats["blocked_requests"] += 1
+        self.stats["estimated_bytes_saved"] += ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+        by_type = self.stats["blocked_by_type"]
+        by_type[resource_type] = by_type.get(resource_type, 0) + 1
+
+    async def apply(self, context, site_url):
+        """
+        Installs the rules on a context. Everything not blocked continues untouched.
+        """
+        allowlist = self.allowlist_for(site_url)
+
+        async def handle(route):
+            request = route.request
+            blocked = self.should_block(request.url, request.resource_type, allowlist)
+            self._count(request.resource_type, blocked)
+            try:
+                if blocked:
+                    await route.abort()
+                else:
+                    await route.continue_()
+            except Exception:
+                # The page was closed while the request was in flight
+                pass
+
+        await context.route("**/*", handle)
+
+    def summary(self):
+        saved_mb = self.stats["estimated_bytes_saved"] / 1_000_000
+        return f"Blocked {self.stats['blocked_requests']} requests (~{saved_mb:.1f} MB), allowed {self.stats['allowed_requests']}"
+
 # Create a singleton instance to emulate the module-level access pattern
 _instance = AntigravityWrapper()
 launch = _instance.launch
 run = _instance.run
+
+# Process-wide browser kept warm across batches
+manager = BrowserManager()
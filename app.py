@@ -3,26 +3,38 @@ import streamlit as st
 import asyncio
 import os
 import traceback
-from bot import run_batch_submission, setup_credentials
+import antigravity as ag
+import events
+import history
+import ingest
+import job_store as jobs
+import memory
+import ratelimit
+import record
+import site_profiles
+from job_store import JobStore, batch_id_for
+from bot import run_batch_submission, run_stored_batch, setup_credentials
 import threading
 import sys
+from concurrent.futures import wait
 
 # Fix for Windows asyncio loop with Playwright
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 # Ensure Playwright Browsers are Installed (Critical for Streamlit Cloud)
+# Streamlit re-runs this script on every interaction; the installer only does work once
 if sys.platform != "win32":
-    try:
-        import subprocess
-        os.environ["PLAYWRIGHT_BROWSERS_PATH"] = os.path.join(os.getcwd(), ".playwright")
-        subprocess.run([sys.executable, "-m", "playwright", "install", "chromium"], check=True)
-    except Exception as e:
-        print(f"⚠️ Failed to auto-install Playwright browsers: {e}")
+    ag.ensure_browsers_installed()
 
 # Configuration
 st.set_page_config(page_title="Bookmarking Panel", page_icon="🚀", layout="wide")
 
+@st.cache_resource
+def get_job_store():
+    # One SQLite connection per server process; batches survive tab closes and restarts
+    return JobStore()
+
 # ==========================================
 # CUSTOM CSS & STYLING (FLUSH LEFT FIX)
 # ==========================================
@@ -374,19 +386,8 @@ with st.sidebar:
     default_user = "jetski_tester_02"
     default_pass = "TesterPassword123!"
     
-    supported_sites = [
-        "https://www.abookmarking.com",
-        "https://www.social-bookmarkingsites.com",
-        "https://www.pbookmarking.com",
-        "https://www.freebookmarkingsite.com",
-        "https://www.free-socialbookmarking.com",
-        "https://www.newsocialbookmarkingsite.com",
-        "https://www.bookmarkingfree.com",
-        "https://www.rbookmarking.com",
-        "https://www.ybookmarking.com",
-        "https://www.fastbookmarkings.com/",
-        "http://www.letsdobookmark.com/"
-    ]
+    # Platforms, their URLs and form selectors are defined in site_profiles.json
+    supported_sites = site_profiles.supported_sites()
     
     site_settings = {}
     
@@ -433,7 +434,38 @@ with st.sidebar:
     st.markdown(SIDEBAR_BROWSER_SETTINGS_HTML, unsafe_allow_html=True)
     
     headless = st.checkbox("🖥️ Headless Mode (Background)", value=False, help="Run browser in background without UI")
+    max_concurrent_sites = st.slider("🔀 Sites in Parallel", min_value=1, max_value=len(supported_sites), value=3, help="How many platforms are processed at the same time")
+    max_pages_per_site = st.slider("📑 Links in Parallel per Site", min_value=1, max_value=5, value=2, help="How many links are submitted at the same time on one platform (tabs share the login)")
+    room = memory.governor.suggested_pages()
+    if room is not None:
+        st.caption(f"🧠 Memory budget {memory.governor.budget_mb:,.0f} MB: room for about {room} more pages")
+        if max_concurrent_sites * max_pages_per_site > room:
+            st.caption("⚠️ More pages than fit in memory: sites will wait for memory and fewer tabs are opened")
+    reuse_sessions = st.checkbox("🍪 Reuse Saved Logins", value=True, help="Skip the login step while a previous session for the same account is still valid")
+    adaptive_pacing = st.checkbox("🚦 Adaptive Pacing", value=True, help="Space out requests per site and slow down automatically on timeouts, lost logins and Cloudflare checks")
+    check_links = st.checkbox("🔎 Check Links First", value=True, help="Fetch every link once before opening any site: dead links are dropped and the page's own title, description and keywords are submitted")
+    record_flows = st.checkbox("⏺️ Record One Submission per Site", value=False, help=f"Save the traffic of the first successful submission on each site to {record.RECORD_DIR}/ so `python record.py` can derive a browser-free HTTP flow")
+    use_worker = st.checkbox("👷 Run in Background Worker", value=False, help="Queue the batch for `python -m bot worker` instead of running it inside this page")
     
+    install_state = ag.install_status()
+    if install_state["state"] == "failed":
+        st.caption(f"⚠️ Browser install failed: {install_state['detail']}")
+        # The failure is kept for the whole process; only this button runs the installer again
+        if st.button("🔁 Retry Browser Install"):
+            with st.spinner("Installing Chromium..."):
+                ag.ensure_browsers_installed(force=True)
+            st.rerun()
+    elif install_state["state"] != "not_checked":
+        st.caption(f"✅ {install_state['detail']}")
+
+    # Pace learned by inline batches of this server process
+    pacing = ratelimit.limiters.snapshot()
+    if pacing:
+        with st.expander("🚦 Current Site Pacing"):
+            for key, stats in pacing.items():
+                throttled = sum(stats["throttles"].values())
+                st.caption(f"**{key}**: {stats['rate']:.2f} req/s, {stats['window']} in flight max, {throttled} slow-downs")
+
     st.markdown(SIDEBAR_NOTE_HTML, unsafe_allow_html=True)
 
 
@@ -451,6 +483,10 @@ with col1:
         placeholder="https://example.com/page1\nhttps://example.com/page2\nhttps://mysite.com/blog-post\n...",
         label_visibility="collapsed"
     )
+    links_file = st.file_uploader(
+        "Or upload a list", type=["txt", "csv", "xml", "gz"],
+        help="One link per line, a CSV with a url column, or a sitemap (gzipped too). Large files are streamed into the queue in chunks and submission starts with the first chunk."
+    )
     
     st.markdown(PRO_TIP_HTML, unsafe_allow_html=True)
 
@@ -459,6 +495,7 @@ with col2:
     
     start_btn = st.button("🚀 Start Submission", type="primary", use_container_width=True)
     stop_btn = st.button("🛑 Stop / Clear", type="secondary", use_container_width=True)
+    st.button("🔄 Refresh Status", use_container_width=True)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
@@ -467,6 +504,7 @@ with col2:
     st.markdown("<div style='margin-top: 0.5rem;'></div>", unsafe_allow_html=True)
     status_log = st.empty()
     progress_bar = st.progress(0)
+    status_table = st.empty()
     
     st.markdown(TIME_ESTIMATE_HTML, unsafe_allow_html=True)
 
@@ -516,42 +554,122 @@ if start_btn:
     if not site_configs:
         st.error("Please enable at least one site and provide credentials!")
     else:
-        urls = [url.strip() for url in links_input.split('\n') if url.strip()]
-        
-        if not urls:
+        site_urls = [site['url'] for site in site_configs]
+        worker_options = {
+            "max_pages_per_site": max_pages_per_site,
+            "use_session_cache": reuse_sessions,
+            "rate_limit": adaptive_pacing,
+            "record_dir": record.RECORD_DIR if record_flows else None,
+            "check_links": check_links
+        }
+        if links_file is not None:
+            # Uploaded lists are streamed into the job store, never held in memory as a whole
+            urls = None
+            batch_id = ingest.source_batch_id(links_file, site_urls)
+        else:
+            # The same link pasted twice (or with tracking parameters) is submitted once
+            urls = history.unique(url.strip() for url in links_input.split('\n') if url.strip())
+            batch_id = batch_id_for(urls, site_urls)
+        st.session_state["batch_id"] = batch_id
+
+        if urls is not None and not urls:
             st.warning("No URLs provided.")
+        elif use_worker and urls is None:
+            # Workers claim the batch as soon as the first chunk is in
+            _, stats = ingest.ingest(links_file, get_job_store(), site_configs, batch_id, worker_options,
+                                     on_chunk=lambda stats: status_log.write(f"📥 {stats}"))
+            st.info(f"📥 Batch {batch_id} queued from {links_file.name}: {stats}. A worker started with `python -m bot worker` will pick it up; use 🔄 Refresh Status to follow it.")
+        elif use_worker:
+            get_job_store().enqueue_batch(urls, site_configs, worker_options, batch_id=batch_id)
+            st.info(f"📥 Batch {batch_id} queued ({len(urls)} links × {len(site_configs)} sites). A worker started with `python -m bot worker` will pick it up; use 🔄 Refresh Status to follow it.")
         else:
-            status_log.write(f"Preparing to submit {len(urls)} links to {len(site_configs)} sites...")
+            if urls is None:
+                status_log.write(f"Reading {links_file.name} and submitting as links come in...")
+            else:
+                status_log.write(f"Preparing to submit {len(urls)} links to {len(site_configs)} sites...")
             try:
                 log_container = st.container()
                 
-                async def run_process():
-                    def update_progress(current, total, message):
-                        progress_bar.progress(current / total)
-                        status_log.write(f"**[{current}/{total}]** {message}")
-
-                    is_headless = headless
-                    if sys.platform != "win32":
-                         is_headless = True
-                         st.toast("☁️ Cloud Environment detected: Forcing Headless Mode", icon="ℹ️")
+                # Progress is produced on the shared browser thread and rendered here, because
+                # Streamlit elements can only be updated from the script thread. The bot only
+                # stores the latest message and publishes to events.bus; this loop redraws on
+                # its own schedule, so a slow browser tab never holds up the submissions.
+                latest = {}
+                board = events.SiteBoard(events.bus, batch_id)
+
+                def update_progress(current, total, message):
+                    latest["progress"] = (current, total, message)
+
+                is_headless = headless
+                if sys.platform != "win32":
+                     is_headless = True
+                     st.toast("☁️ Cloud Environment detected: Forcing Headless Mode", icon="ℹ️")
+
+                if urls is None:
+                    # The batch exists (and cannot finish) before the first chunk is read
+                    get_job_store().enqueue_batch([], site_configs, worker_options, batch_id, state=jobs.INGESTING)
+                    threading.Thread(
+                        target=ingest.ingest, args=(links_file, get_job_store(), site_configs, batch_id, worker_options), daemon=True
+                    ).start()
 
-                    await run_batch_submission(
+                async def run_process():
+                    options = dict(
+                        headless=is_headless,
+                        progress_callback=update_progress,
+                        max_concurrent_sites=max_concurrent_sites,
+                        max_pages_per_site=max_pages_per_site,
+                        use_session_cache=reuse_sessions,
+                        use_shared_browser=True,
+                        rate_limit=adaptive_pacing,
+                        record_dir=record.RECORD_DIR if record_flows else None,
+                        check_links=check_links,
+                    )
+                    if urls is None:
+                        return await run_stored_batch(get_job_store(), batch_id, site_configs, **options)
+                    return await run_batch_submission(
                         urls=urls, 
                         site_configs=site_configs,
-                        headless=is_headless,
-                        progress_callback=update_progress
+                        job_store=get_job_store(),
+                        batch_id=batch_id,
+                        **options
                     )
                 
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(run_process())
-                finally:
-                    loop.close()
-                st.success("Batch Submission Cycle Complete!")
+                # The browser stays warm between batches on ag.manager's event-loop thread
+                future = ag.manager.submit(run_process())
+                while True:
+                    finished = future.done()
+                    if board.update() or finished:
+                        status_table.dataframe(board.rows(), hide_index=True, use_container_width=True)
+                    if "progress" in latest:
+                        current, total, message = latest["progress"]
+                        progress_bar.progress(min(1.0, current / total) if total else 0.0)
+                        status_log.write(f"**[{current}/{total}]** {message}")
+                    if finished:
+                        break
+                    wait([future], timeout=events.REFRESH_INTERVAL)
+                batch_id = future.result()
+                batch_status = get_job_store().batch_status(batch_id)
+                st.success(f"Batch Submission Cycle Complete! {batch_status['done']}/{batch_status['total']} submitted, {batch_status['failed']} failed, {batch_status['deferred']} deferred, {batch_status['skipped']} skipped as already submitted (batch {batch_id})")
             except Exception as e:
                 st.error(f"An error occurred: {e}")
                 st.code(traceback.format_exc())
 
+# Status of the last batch started from this browser session (inline or queued for a worker)
+if not start_btn and "batch_id" in st.session_state:
+    batch_status = get_job_store().batch_status(st.session_state["batch_id"])
+    if batch_status["total"]:
+        finished = batch_status["done"] + batch_status["failed"] + batch_status["skipped"]
+        progress_bar.progress(finished / batch_status["total"])
+        status_log.write(
+            f"**Batch {st.session_state['batch_id']}** ({batch_status['state']}): "
+            f"{batch_status['done']} done, {batch_status['failed']} failed, {batch_status['deferred']} deferred (site failing), "
+            f"{batch_status['skipped']} skipped (already submitted), "
+            f"{batch_status['pending'] + batch_status['running']} remaining of {batch_status['total']}"
+        )
+
 if stop_btn:
+    # Actually stops the batch: the bot checks for cancellation before every URL
+    if "batch_id" in st.session_state:
+        get_job_store().cancel_batch(st.session_state.pop("batch_id"))
+        st.toast("🛑 Batch cancelled", icon="🛑")
     st.rerun()
@@ -3,6 +3,7 @@ import streamlit as st
 import asyncio
 import os
 import traceback
+import antigravity as ag
 from bot import run_batch_submission, setup_credentials
 import threading
 import sys
@@ -12,14 +13,9 @@ if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 # Ensure Playwright Browsers are Installed (Critical for Streamlit Cloud)
+# Streamlit re-runs this script on every interaction; the installer only does work once
 if sys.platform != "win32":
-    try:
-        import subprocess
-        os.environ["PLAYWRIGHT_BROWSERS_PATH"] = os.path.join(os.getcwd(), ".playwright")
-        print(f"Installing Playwright browsers to {os.environ['PLAYWRIGHT_BROWSERS_PATH']}...")
-        subprocess.run([sys.executable, "-m", "playwright", "install", "chromium"], check=True)
-    except Exception as e:
-        print(f"⚠️ Failed to auto-install Playwright browsers: {e}")
+    ag.ensure_browsers_installed()
 
 # Configuration
 st.set_page_config(page_title="Bookmarking Panel", page_icon="🚀", layout="wide")
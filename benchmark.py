@@ -0,0 +1,185 @@
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import antigravity as ag
+import bot
+import mock_site
+import shard
+import site_profiles
+import tracing
+
+class MemorySampler:
+    """
+    Samples ag.process_tree_rss() on a background thread and keeps the peak.
+    """
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, ag.process_tree_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, name="memory-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def write_profiles(sites, engine):
+    """
+    Temporary site_profiles file listing the mock sites, driven by the given engine.
+    """
+    with open(site_profiles.PROFILES_PATH, "r", encoding="utf-8") as f:
+        defaults = json.load(f)["defaults"]
+    spec = {"defaults": defaults, "sites": [
+        {"url": site.url, "engine": engine, "http_flow": mock_site.HTTP_FLOW} for site in sites
+    ]}
+    fd, path = tempfile.mkstemp(prefix="bench-profiles-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(spec, f)
+    return path
+
+def run_scenario(url_count, site_count, max_concurrent_sites, max_pages_per_site, site_options=None,
+                 headless=True, block_resources=True, engine="browser", processes=1, pacing=False):
+    """
+    Submits url_count URLs to site_count fresh mock sites and returns the measurements.
+    Every scenario logs in from scratch (fresh sites, no session cache).
+    processes > 1 shards the sites across that many worker processes (see shard.py).
+    pacing: keep the per-site AIMD limiter on (bot's default). Off by default, so the numbers
+    are engine and concurrency throughput rather than the limiter's ramp-up from 1 req/s.
+    """
+    sites = mock_site.start_sites(site_count, **(site_options or {}))
+    urls = [f"https://example.com/articles/{i}" for i in range(url_count)]
+    configs = [{"url": site.url, "username": "bench", "password": "bench"} for site in sites]
+
+    fd, trace_path = tempfile.mkstemp(prefix="bench-trace-", suffix=".jsonl")
+    os.close(fd)
+    profiles_path, site_profiles.PROFILES_PATH = site_profiles.PROFILES_PATH, write_profiles(sites, engine)
+    # Worker processes read the profiles path from the environment
+    profiles_env = os.environ.get("BOOKMARK_SITE_PROFILES")
+    os.environ["BOOKMARK_SITE_PROFILES"] = site_profiles.PROFILES_PATH
+    options = dict(
+        headless=headless, max_concurrent_sites=max_concurrent_sites, max_pages_per_site=max_pages_per_site,
+        use_session_cache=False, block_resources=block_resources, trace_file=trace_path, rate_limit=pacing,
+        # The example.com links are not real pages
+        check_links=False
+    )
+    try:
+        with MemorySampler() as memory:
+            started = time.perf_counter()
+            if processes > 1:
+                shard.run_sharded_batch(urls, configs, processes=processes, **options)
+            else:
+                ag.manager.run(bot.run_batch_submission(urls, configs, use_shared_browser=True, **options))
+            elapsed = time.perf_counter() - started
+
+        # Per-step latency across every site of the scenario
+        records = [dict(record, site="*") for record in tracing.load(trace_path)]
+        steps = {step: stats for (_, step), stats in tracing.summarize(records).items()}
+    finally:
+        for site in sites:
+            site.stop()
+        os.remove(trace_path)
+        os.remove(site_profiles.PROFILES_PATH)
+        site_profiles.PROFILES_PATH = profiles_path
+        if profiles_env is None:
+            os.environ.pop("BOOKMARK_SITE_PROFILES", None)
+        else:
+            os.environ["BOOKMARK_SITE_PROFILES"] = profiles_env
+
+    accepted = sum(site.stats["accepted"] for site in sites)
+    return {
+        "urls": url_count,
+        "sites": site_count,
+        "concurrency": f"{max_concurrent_sites}x{max_pages_per_site}",
+        "engine": engine,
+        "processes": processes,
+        "pacing": pacing,
+        "tasks": url_count * site_count,
+        "accepted": accepted,
+        "failed": sum(site.stats["failed"] for site in sites),
+        "logins": sum(site.stats["logins"] for site in sites),
+        "seconds": round(elapsed, 2),
+        "submissions_per_sec": round(accepted / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(memory.peak / 1_000_000, 1),
+        "steps": steps,
+    }
+
+def format_results(results):
+    lines = [f"{'engine':>7} {'procs':>5} {'pacing':>6} {'urls':>6} {'sites':>5} {'conc':>6} {'ok':>6} {'fail':>5} {'login':>5} {'secs':>8} {'sub/s':>7} {'rss MB':>8}"]
+    for r in results:
+        lines.append(
+            f"{r['engine']:>7} {r['processes']:>5} {'on' if r['pacing'] else 'off':>6} {r['urls']:>6} {r['sites']:>5} {r['concurrency']:>6} {r['accepted']:>6} {r['failed']:>5} {r['logins']:>5} "
+            f"{r['seconds']:>8.2f} {r['submissions_per_sec']:>7.2f} {r['peak_rss_mb']:>8.1f}"
+        )
+    for r in results:
+        lines.append("")
+        lines.append(f"Step latency (s) - {r['engine']} x{r['processes']}, {r['urls']} URLs x {r['sites']} sites @ {r['concurrency']}")
+        lines.append(f"  {'step':<24} {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7}")
+        for step, stats in sorted(r["steps"].items(), key=lambda item: item[1]["total"], reverse=True):
+            lines.append(f"  {step:<24} {stats['count']:>6} {stats['p50']:>7.3f} {stats['p95']:>7.3f} {stats['p99']:>7.3f}")
+    return "\n".join(lines)
+
+def _concurrency(value):
+    """
+    "2x4" -> (2 concurrent sites, 4 pages per site); "3" -> (3, 1).
+    """
+    sites, _, pages = value.lower().partition("x")
+    return int(sites), int(pages or 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python benchmark.py", description="End-to-end bot benchmark against local mock sites")
+    parser.add_argument("--urls", type=int, nargs="+", default=[10, 50], help="URL counts to try")
+    parser.add_argument("--sites", type=int, nargs="+", default=[1, 3], help="site counts to try")
+    parser.add_argument("--concurrency", type=_concurrency, nargs="+", default=[(1, 1), (3, 2)],
+                        help="SITESxPAGES settings to try, e.g. 1x1 3x2")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every mock request")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--reveal-failure-rate", type=float, default=0.0)
+    parser.add_argument("--expire-every", type=int, default=None, help="force a re-login after this many submissions")
+    parser.add_argument("--engine", nargs="+", choices=["browser", "http"], default=["browser"],
+                        help="submission engines to compare (http needs httpx)")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1],
+                        help="worker process counts to try (sites are sharded across them)")
+    parser.add_argument("--headful", action="store_true")
+    parser.add_argument("--no-blocking", action="store_true", help="do not install the request-blocking routes")
+    parser.add_argument("--pacing", action="store_true",
+                        help="keep the adaptive per-site pacing on (off by default: it measures the limiter's ramp-up, not throughput)")
+    parser.add_argument("--json", help="also write the raw results to this file")
+    args = parser.parse_args(argv)
+
+    site_options = {
+        "latency": args.latency, "jitter": args.jitter, "failure_rate": args.failure_rate,
+        "reveal_failure_rate": args.reveal_failure_rate, "expire_every": args.expire_every,
+    }
+    results = []
+    try:
+        scenarios = itertools.product(args.engine, args.processes, args.urls, args.sites, args.concurrency)
+        for engine, processes, url_count, site_count, (concurrent_sites, pages) in scenarios:
+            print(f"🏁 {engine} x{processes}: {url_count} URLs x {site_count} sites @ {concurrent_sites}x{pages}...")
+            results.append(run_scenario(
+                url_count, site_count, concurrent_sites, pages, site_options, headless=not args.headful,
+                block_resources=not args.no_blocking, engine=engine, processes=processes, pacing=args.pacing
+            ))
+    finally:
+        ag.manager.shutdown()
+
+    print(format_results(results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,31 @@
 
 import antigravity as ag
+import broker as brokers
+import circuit
+import events
+import history
+import http_engine
+import job_store as jobs
+import memory
+import prefetch
+import ratelimit
+import record
+import retry
+import session_cache
+import site_profiles
+import tracing
+import waits
 import random
+import argparse
 import asyncio
+import inspect
+import json
 import os
-from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+import re
+import socket
+import time
+from contextlib import asynccontextmanager
+from retry import PlaywrightTimeoutError
 import sys
 
 # Fix for Windows asyncio loop with Playwright
@@ -14,237 +36,1196 @@ if sys.platform == "win32":
 USERNAME = ""
 PASSWORD = ""
 
+# Timeouts also print the page's HTML when set; serializing the whole DOM costs CPU on busy runs
+DEBUG_DUMPS = os.getenv("BOOKMARK_DEBUG_DUMPS") == "1"
+
+# Job-store loops wait this long (doubling up to NO_PROGRESS_MAX_WAIT) after a pass that finished no task
+NO_PROGRESS_WAIT = 5.0
+NO_PROGRESS_MAX_WAIT = 5 * 60.0
+
 def setup_credentials(user, pwd):
     global USERNAME, PASSWORD
     USERNAME = user
     PASSWORD = pwd
 
-async def run_batch_submission(urls, site_configs, headless=False, progress_callback=None):
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+class BatchProgress:
+    """
+    Shared step counter so concurrent site tasks report into one progress_callback.
+    """
+    def __init__(self, total_steps, progress_callback=None):
+        self.total_steps = total_steps
+        self.current = 0
+        self._callback = progress_callback
+
+    def advance(self):
+        # Capped: a link handed from the HTTP engine to the browser starts over there
+        self.current = min(self.current + 1, self.total_steps)
+        return self.current
+
+    def report(self, message):
+        if self._callback:
+            self._callback(self.current, self.total_steps, message)
+
+async def run_batch_submission(urls, site_configs, headless=False, progress_callback=None, max_concurrent_sites=1, max_pages_per_site=1, use_session_cache=True, use_shared_browser=False, block_resources=True, job_store=None, batch_id=None, worker_id=None, trace_file=None, rate_limit=True, retry_policy=None, circuit_breaker=True, record_dir=None, skip_submitted=True, max_urls_per_site=None, check_links=True, reuse_contexts=True, memory_governor=True):
     """
     Runs the bot for a list of URLs across multiple sites.
     site_configs: list of dicts -> [{'url': '...', 'username': '...', 'password': '...'}, ...]
+    max_concurrent_sites: how many sites are processed at the same time (1 = one after another).
+    max_pages_per_site: how many URLs are submitted in parallel on one site (pages share the login).
+    use_session_cache: start from a saved login (storage_state) instead of logging in every batch.
+    use_shared_browser: take contexts from the warm ag.manager browser instead of launching one.
+        The coroutine must then be scheduled with ag.manager.submit()/run().
+    block_resources: abort images, fonts, ads and analytics requests (see ag.BlockingProfile).
+    job_store: a job_store.JobStore that records every (URL, site) task; tasks already done in
+        this batch are skipped, so an interrupted batch resumes where it stopped.
+    batch_id: id of the batch to create or resume (derived from urls + sites by default).
+    worker_id: name under which sites of the batch are claimed in the job store, so a
+        background worker never works on the same site at the same time.
+    trace_file: append one JSON line per step (site, URL, timings) to this file for
+        `python tracing.py summarize`; defaults to $BOOKMARK_TRACE_FILE, off when unset.
+    rate_limit: pace navigations and submits per site and adapt the pace (and the links in
+        flight) to timeouts, login redirects and challenge pages (see ratelimit.DomainLimiter).
+    retry_policy: retry.RetryPolicy deciding which failed URLs are requeued and after how long
+        (default budgets when None; retry.NO_RETRY to fail on the first error).
+    circuit_breaker: stop sending a site work after repeated failures at the same step and
+        defer its remaining links, probing again after a cooldown (see circuit.CircuitBreaker).
+    record_dir: capture the network traffic of the first successful browser submission on
+        each site to <record_dir>/<site>.har for `python record.py` (see record_site_session).
+    skip_submitted: with a job_store, skip links the job store's history says were already
+        submitted to a site within its resubmit window (profile "resubmit_after_days").
+    Repeated links (same history.normalize_url key) are only submitted once.
+    max_urls_per_site: with a job_store, work on at most this many pending links per site in
+        this call; the rest stay pending for the next call (see run_stored_batch).
+    check_links: fetch every link once before any site is opened (see prefetch.py): dead links
+        (404/410, unreachable host) fail for all sites up front, and the page's title,
+        description and keywords fill the details form.
+    reuse_contexts: take site contexts and pages from an ag.ContextPool, which recycles pages
+        after a number of submissions; with use_shared_browser a site's logged-in context
+        stays warm for the next batch, so it is not logged in to again.
+    memory_governor: keep the browser under memory.governor's budget ($BOOKMARK_MEMORY_BUDGET_MB,
+        else most of the free memory): sites wait for memory before opening a context, extra
+        pages per site are only opened while they fit, and pooled contexts are shed when over it.
+    Returns the batch id when a job_store is used.
     """
     print("🚀 Launching Antigravity Bot Batch...")
-    
-    # Launch Browser
-    browser = await ag.launch(headless=headless)
-    context = await browser.new_context(
-        viewport={'width': 1280, 'height': 800},
-        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+    urls = history.unique(urls)
+
+    claimed_sites = []
+    if job_store:
+        worker_id = worker_id or f"inline-{os.getpid()}-{random.randrange(16 ** 6):06x}"
+        if batch_id is None or job_store.batch_state(batch_id) in (None, jobs.FINISHED, jobs.CANCELLED):
+            # New batch, or the same links submitted again: (re)start it (a finished one from scratch, see create_batch)
+            batch_id = job_store.create_batch(urls, [site['url'] for site in site_configs], batch_id)
+
+        for site in site_configs:
+            if job_store.claim(batch_id, site['url'], worker_id):
+                job_store.recover(batch_id, site['url'])
+                claimed_sites.append(site)
+            else:
+                print(f"⏭️ {site['url']} is already being processed by another worker, skipping.")
+        site_configs = claimed_sites
+
+        work = {site['url']: job_store.pending_urls(batch_id, site['url'], max_urls_per_site) for site in site_configs}
+        if skip_submitted:
+            # Only this call's links are checked, so chunked runs never rescan the whole batch
+            for site in site_configs:
+                window = history.resubmit_after(site_profiles.get_profile(site['url']))
+                skipped = set(job_store.skip_submitted(batch_id, site['url'], window, work[site['url']]))
+                if skipped:
+                    since = "ever" if window is None else f"in the last {window / 86400:g} days"
+                    print(f"⏭️ {site['url']}: skipping {len(skipped)} links already submitted {since}")
+                    work[site['url']] = [url for url in work[site['url']] if url not in skipped]
+        status = job_store.batch_status(batch_id)
+        if status["done"]:
+            print(f"📦 Resuming batch {batch_id}: {status['done']}/{status['total']} tasks already done")
+    else:
+        work = {site['url']: list(urls) for site in site_configs}
+
+    browser = None
+    pool = None
+    tracer = tracing.open_tracer(trace_file)
+    try:
+        # Sites with nothing left to do are not even logged in to
+        site_configs = [site for site in site_configs if work[site['url']]]
+        if not site_configs:
+            print("✅ Nothing left to submit in this batch.")
+            return batch_id
+
+        metadata = {}
+        if check_links:
+            metadata = await check_batch_links(work, job_store, batch_id)
+            site_configs = [site for site in site_configs if work[site['url']]]
+            if not site_configs:
+                print("✅ No live links left to submit in this batch.")
+                return batch_id
+
+        if use_shared_browser:
+            # The shared browser outlives the batch; only our contexts are closed
+            async def new_context(**options):
+                return await ag.manager.new_context(headless=headless, **options)
+            if reuse_contexts:
+                pool = ag.manager.context_pool(headless)
+        else:
+            # Launch Browser
+            browser = await ag.launch(headless=headless)
+            new_context = browser.new_context
+            if reuse_contexts:
+                pool = ag.ContextPool(new_context)
+        if pool and max_concurrent_sites > pool.max_size:
+            print(f"⚠️ At most {pool.max_size} contexts are open at once (BOOKMARK_MAX_CONTEXTS); "
+                  f"sites beyond that wait for a free one")
+
+        progress = BatchProgress(sum(len(work[site['url']]) for site in site_configs), progress_callback)
+        cache = session_cache.cache if use_session_cache else None
+        governor = memory.governor if memory_governor else None
+        blocking = ag.BlockingProfile(site_allowlists=site_profiles.allowlists()) if block_resources else None
+        semaphore = asyncio.Semaphore(max(1, max_concurrent_sites))
+
+        async def run_site(site):
+            async with semaphore:
+                await run_site_session(
+                    new_context, site, work[site['url']], progress, max_pages=max_pages_per_site,
+                    cache=cache, blocking=blocking, job_store=job_store, batch_id=batch_id, tracer=tracer,
+                    rate_limit=rate_limit, retry_policy=retry_policy, circuit_breaker=circuit_breaker,
+                    record_dir=record_dir, metadata=metadata, pool=pool, governor=governor
+                )
+
+        # Each site runs as its own task; wall-clock time is bounded by the slowest site
+        await asyncio.gather(*(run_site(site) for site in site_configs))
+
+        if blocking:
+            print(f"🧹 {blocking.summary()}")
+            progress.report(f"🧹 {blocking.summary()}")
+        if pool:
+            print(f"🏊 {pool.summary()}")
+        if governor:
+            print(f"🧠 {governor.summary()}")
+
+    finally:
+        if browser:
+            if pool:
+                await pool.close()
+            await browser.close()
+        tracer.close()
+        if job_store:
+            for site in claimed_sites:
+                job_store.release_claim(batch_id, site['url'])
+            job_store.finish_if_complete(batch_id)
+        print("Bot session ended.")
+
+    return batch_id
+
+async def check_batch_links(work, job_store=None, batch_id=None):
+    """
+    Prefetches every link of the batch once, however many sites it goes to. Dead links are
+    removed from `work` (and recorded as failed for each site); returns {url: prefetch.Metadata}.
+    """
+    urls = list(dict.fromkeys(url for site_urls in work.values() for url in site_urls))
+    print(f"🔎 Checking {len(urls)} links...")
+    started = time.perf_counter()
+    metadata = await prefetch.prefetch(urls, cache=prefetch.default_cache())
+    dead = prefetch.dead_links(metadata)
+    for site_url, site_urls in work.items():
+        if job_store:
+            for url in site_urls:
+                if url in dead:
+                    job_store.mark_failed(batch_id, url, site_url, f"dead link: {prefetch.describe(metadata[url])}")
+        work[site_url] = [url for url in site_urls if url not in dead]
+    for url in dead:
+        print(f"💀 Dropping {url}: {prefetch.describe(metadata[url])}")
+    print(f"🔎 Checked {len(urls)} links in {time.perf_counter() - started:.1f}s: {len(dead)} dead")
+    return metadata
+
+class SiteSession:
+    """
+    Per-site state shared by every page (or HTTP slot) working on that site.
+    """
+    def __init__(self, site, context, url_count, cache=None, job_store=None, batch_id=None, tracer=None, rate_limit=True, circuit_breaker=True, metadata=None):
+        self.site_url = site['url']
+        self.username = site['username']
+        self.password = site['password']
+        self.context = context
+        self.url_count = url_count
+        self.cache = cache
+        self.job_store = job_store
+        self.batch_id = batch_id
+        # prefetch.Metadata by link, for the details form
+        self.metadata = metadata or {}
+
+        # URLs, selectors, timeouts and steps for this site (site_profiles.json)
+        self.profile = site_profiles.get_profile(self.site_url)
+
+        # Clean base URL for display
+        self.display_name = self.site_url.replace("https://www.", "").replace("http://", "").split("/")[0]
+        self.login_url = self.profile.login_url
+        self.submit_url = self.profile.submit_url
+
+        # Only one page re-authenticates at a time; the others pick up the new cookies
+        self.login_lock = asyncio.Lock()
+        self.logins = 0
+        self.started = 0
+        self.last_success = None
+
+        # Time spent on each step across every page of this session; every step is also traced
+        self.waits = waits.WaitTimer()
+        self.tracer = tracer or tracing.NullTracer()
+
+        # Learned pace for this site, shared with every other batch in the process
+        self.limiter = ratelimit.limiters.get(self.profile.key, **self.profile.rate_limit) if rate_limit else ratelimit.Unlimited()
+        # Likewise for the site's circuit breaker
+        self.breaker = circuit.breakers.get(self.profile.key, **self.profile.circuit_breaker) if circuit_breaker else None
+
+        # Structured progress for the UI (events.bus); publishing never waits on a reader
+        self.events = events.bus
+        self.publish(events.SESSION, count=url_count)
+
+    def publish(self, status, url=None, step=None, duration=None, count=None):
+        self.events.publish(self.batch_id, self.profile.key, status, url, step, duration, count)
+
+    @asynccontextmanager
+    async def step(self, name, target_url=None, **fields):
+        """
+        Times one step of the flow into the session WaitTimer and the trace file.
+        """
+        started = time.perf_counter()
+        status = events.ERROR
+        try:
+            async with self.tracer.span(name, self.profile.key, target_url, **fields):
+                yield
+            status = events.STEP
+        finally:
+            elapsed = time.perf_counter() - started
+            self.waits.add(name, elapsed)
+            self.publish(status, target_url, name, elapsed)
+
+    async def pace(self, target_url=None):
+        """
+        Waits for this site's next paced slot; call before each navigation or submit.
+        """
+        delay = self.limiter.reserve()
+        if delay > 0:
+            async with self.step("rate_wait", target_url):
+                await asyncio.sleep(delay)
+
+    def check_response(self, response):
+        """
+        Backs the site off when a navigation came back rate limited or challenged.
+        """
+        reason = ratelimit.throttle_reason(response)
+        if reason:
+            self.limiter.throttle(reason, ratelimit.retry_after(response))
+        return reason
+
+    async def remember_login(self, page):
+        """
+        Caches the session once the page has actually left the login form.
+        """
+        if self.cache and "login" not in page.url:
+            await self.cache.save(self.context, self.site_url, self.username)
+
+    def forget_login(self):
+        if self.cache:
+            self.cache.invalidate(self.site_url, self.username)
+
+    def record_start(self, target_url):
+        if self.job_store:
+            self.job_store.mark_running(self.batch_id, target_url, self.site_url)
+            # Doubles as the heartbeat that keeps our claim on this site from going stale
+            self.job_store.touch_claim(self.batch_id, self.site_url)
+
+    def is_cancelled(self):
+        return bool(self.job_store) and self.job_store.is_cancelled(self.batch_id)
+
+    def record_result(self, target_url, error=None):
+        self.publish(events.DONE if error is None else events.FAILED, target_url)
+        if error is None:
+            self.limiter.success()
+            self.last_success = target_url
+        if not self.job_store:
+            return
+        if error is None:
+            self.job_store.mark_done(self.batch_id, target_url, self.site_url)
+        else:
+            self.job_store.mark_failed(self.batch_id, target_url, self.site_url, error)
+
+    def record_retry(self, target_url, error):
+        self.publish(events.RETRY, target_url)
+        # Pending again, so an interrupted batch also picks the retry up on resume
+        if self.job_store:
+            self.job_store.mark_retry(self.batch_id, target_url, self.site_url, error)
+
+    def record_deferred(self, urls, reason):
+        if urls:
+            self.publish(events.DEFERRED, count=len(urls))
+        if self.job_store and urls:
+            self.job_store.defer(self.batch_id, self.site_url, urls, reason)
+
+    def record_session_failure(self, urls, error):
+        """
+        The whole session failed (login page down, no context): counts against the site's
+        circuit breaker and defers its links, so loops over the job store do not take them
+        straight back.
+        """
+        if self.breaker:
+            self.breaker.record_failure("session")
+        self.record_deferred(urls, f"session failed: {str(error)[:200]}")
+
+    def credentials(self):
+        return {"username": self.username, "password": self.password}
+
+    def values(self, target_url):
+        return submission_values(target_url, self.metadata.get(target_url))
+
+    async def log_in(self, page):
+        """
+        Fills and submits the login form the page is currently showing.
+        """
+        await run_steps(page, self.profile.login_steps, self.credentials())
+
+    def log_summary(self):
+        print(f"⏱️ [{self.display_name}] Time by step: {self.waits.summary() or 'none'}")
+        print(f"🚦 [{self.display_name}] Pacing: {self.limiter.summary()}")
+
+async def select_category(page, selector, mapping, timeout):
+    """
+    Picks the category from the options actually on the page, so a missing label costs
+    one lookup instead of a select_option timeout. mapping: {"label"|"value"|"index", "fallback_index"}.
+    """
+    options = await page.eval_on_selector_all(
+        f"{selector} option", "opts => opts.map(o => [o.value, o.textContent.trim()])"
     )
-    
+    choice = None
+    if "label" in mapping:
+        choice = next((i for i, (_, label) in enumerate(options) if label == mapping["label"]), None)
+    if choice is None and "value" in mapping:
+        choice = next((i for i, (value, _) in enumerate(options) if value == str(mapping["value"])), None)
+    if choice is None and "index" in mapping and mapping["index"] < len(options):
+        choice = mapping["index"]
+    if choice is None:
+        fallback = mapping.get("fallback_index", 1)
+        choice = fallback if fallback < len(options) else min(1, len(options) - 1)
+    if choice < 0:
+        raise Exception(f"No options found for {selector}")
+    await page.select_option(selector, index=choice, timeout=timeout)
+
+async def run_step(page, step, values):
+    """
+    Executes one compiled site_profiles.Step. Optional steps may fail silently.
+    """
     try:
-        total_steps = len(urls) * len(site_configs)
-        global_step = 0
-        
-        for site_idx, site in enumerate(site_configs):
-            site_url = site['url']
-            username = site['username']
-            password = site['password']
-            
-            # Clean base URL for display
-            display_name = site_url.replace("https://www.", "").replace("http://", "").split("/")[0]
-
-            print(f"🌍 Starting submission for site: {display_name}")
-            
-            # Open a new page for each site to ensure fresh state or just clear cookies if preferred
-            # Reusing context but new page
-            page = await context.new_page()
-            
-            try:
-                # --- LOGIN ---
-                if progress_callback: progress_callback(global_step, total_steps, f"Authenticating on {display_name}...")
-                
-                login_url = f"{site_url.rstrip('/')}/login"
-                submit_url = f"{site_url.rstrip('/')}/submit"
-                
-                await page.goto(login_url)
-                
-                # Check if actually on login page or already logged in
+        if step.action == "fill":
+            await page.fill(step.selector, step.value.format(**values), timeout=step.timeout)
+        elif step.action == "click":
+            await page.click(step.selector, timeout=step.timeout)
+        elif step.action == "select":
+            await select_category(page, step.selector, step.value, step.timeout)
+        else:
+            raise ValueError(f"Unknown step action: {step.action}")
+    except Exception:
+        if not step.optional:
+            raise
+
+async def run_steps(page, steps, values):
+    for step in steps:
+        await run_step(page, step, values)
+
+async def run_site_session(new_context, site, urls, progress, max_pages=1, cache=None, blocking=None, job_store=None, batch_id=None, tracer=None, rate_limit=True, retry_policy=None, circuit_breaker=True, record_dir=None, metadata=None, pool=None, governor=None):
+    """
+    Logs in to a single site and submits every URL, using a dedicated browser context
+    (from the pool when given; a warm one is already logged in).
+    Up to max_pages pages share the logged-in context and work through process_urls().
+    With a session cache the context starts from the saved login and /login is skipped.
+    Profiles with "engine": "http" are submitted with plain requests (run_http_session);
+    the browser only takes over the links left when the site answers with a bot check.
+    With record_dir the first link is submitted in a recording context (record_site_session).
+    """
+    session = SiteSession(site, None, len(urls), cache=cache, job_store=job_store, batch_id=batch_id, tracer=tracer, rate_limit=rate_limit,
+                          circuit_breaker=circuit_breaker, metadata=metadata)
+    display_name = session.display_name
+
+    print(f"🌍 Starting submission for site: {display_name}")
+    retry_policy = retry_policy or retry.RetryPolicy()
+
+    if session.breaker and session.breaker.retry_in() > retry_policy.max_breaker_wait:
+        # Still failing from an earlier batch: do not even log in
+        message = f"⛔ [{display_name}] Circuit {session.breaker.describe()} - deferring {len(urls)} links"
+        print(message)
+        progress.report(message)
+        session.record_deferred(urls, f"circuit {session.breaker.describe()}")
+        return
+
+    try:
+        if record_dir:
+            urls = await record_site_session(new_context, session, urls, progress, record_dir, blocking=blocking, retry_policy=retry_policy)
+        elif session.profile.engine == "http":
+            if not session.profile.http_flow:
+                print(f"⚠️ [{display_name}] engine is http but the profile has no http_flow, using the browser")
+            elif not http_engine.available():
+                print(f"❌ [{display_name}] engine is http but httpx is not installed (pip install -r requirements.txt), using the browser")
+                progress.report(f"❌ [{display_name}] httpx is missing - the HTTP engine is off, using the browser")
+            else:
+                try:
+                    urls = await run_http_session(session, urls, progress, max_connections=max_pages, retry_policy=retry_policy)
+                except Exception as e:
+                    print(f"❌ Error during HTTP session for {display_name}: {e}")
+                    session.record_session_failure(urls, e)
+                    urls = []
+                if urls:
+                    print(f"🧩 [{display_name}] Switching to the browser for the remaining {len(urls)} links")
+                    progress.report(f"🧩 [{display_name}] Bot check on the fast path - continuing in the browser")
+
+        if urls:
+            cached_state = cache.load(site['url'], site['username']) if cache else None
+            await run_browser_session(new_context, session, urls, progress, max_pages=max_pages, blocking=blocking,
+                                      retry_policy=retry_policy, cached_state=cached_state, pool=pool, governor=governor)
+    finally:
+        session.log_summary()
+        if governor:
+            print(f"🧠 [{display_name}] Memory: {governor.describe_site(session.profile.key)}")
+
+async def run_browser_session(new_context, session, urls, progress, max_pages=1, blocking=None, retry_policy=None,
+                              cached_state=None, stop_after=None, pool=None, governor=None, **context_options):
+    """
+    Submits urls with Playwright pages sharing one context (extra context_options are passed
+    to new_context, e.g. record_har_path). Returns the URLs not done when stop_after ended the run.
+    With a pool (and no context_options) the context comes from the pool and goes back to it
+    afterwards, and pages are swapped for fresh ones as the pool's recycling limits say.
+    With a memory governor the context waits for memory and extra pages are opened only while they fit.
+    """
+    display_name = session.display_name
+
+    # Each site gets its own context so cookies never leak between concurrent sessions
+    options = dict(viewport={'width': 1280, 'height': 800}, user_agent=DEFAULT_USER_AGENT, storage_state=cached_state)
+    pooled = None
+    if governor:
+        await governor.admit(session.profile.key, busy=pool.busy() if pool else 0)
+    if pool is not None and not context_options:
+        pooled = await pool.acquire((session.site_url, session.username), label=session.profile.key, **options)
+        context = pooled.context
+    else:
+        context = await new_context(**options, **context_options)
+    session.context = context
+    keep = False
+
+    try:
+        if pooled is not None and pooled.blocking is not blocking:
+            if pooled.blocking is not None:
+                # Routes of an earlier batch: they would keep blocking (and counting) for a batch
+                # that asked for different rules, or for none at all
+                await context.unroute("**/*")
+            pooled.blocking = None
+        if blocking and (pooled is None or pooled.blocking is not blocking):
+            await blocking.apply(context, session.site_url)
+            if pooled is not None:
+                pooled.blocking = blocking
+        page = await pooled.page() if pooled else await context.new_page()
+
+        # --- LOGIN ---
+        if pooled is not None and pooled.warm:
+            # Logged in by an earlier batch; an expired session is caught like a cached one
+            print(f"♻️ Reusing the warm context for {display_name}")
+            should_login = False
+        elif cached_state:
+            # An expired session is caught by the login-redirect check in submit_url
+            print(f"♻️ Reusing cached session for {display_name}")
+            should_login = False
+        else:
+            progress.report(f"Authenticating on {display_name}...")
+
+            await session.pace()
+            async with session.step("login_page"):
+                session.check_response(await page.goto(session.login_url))
+
+                # Check if actually on login page or already logged in (redirected away)
                 try:
-                    await page.wait_for_selector("input[name='username']", timeout=5000)
-                    should_login = True
+                    if "login" in page.url:
+                        await page.wait_for_selector(session.profile.selectors["username"], timeout=session.profile.timeouts["login_form"])
+                        should_login = True
+                    else:
+                        should_login = False
                 except:
                     should_login = False
-                    
-                if should_login:
-                    print(f"🔒 Logging in to {display_name}...")
-                    await page.fill("input[name='username']", username)
-                    await page.fill("input[name='password']", password)
-                    await page.click("button[type='submit'], input[type='submit'], .btn-primary")
-                    
-                    # Wait for navigation to dashboard or home
+
+        if should_login:
+            print(f"🔒 Logging in to {display_name}...")
+            async with session.step("login"):
+                await session.log_in(page)
+
+            # Done as soon as we leave the login form (dashboard, /user/... or home)
+            try:
+                async with session.step("login_redirect"):
+                    await page.wait_for_url(lambda u: "login" not in u, timeout=session.profile.timeouts["login_redirect"])
+            except Exception:
+                print(f"⚠️ Still on the login page of {display_name}, continuing anyway...")
+
+            print("✅ Login assumed successful.")
+            await session.remember_login(page)
+
+        # --- PROCESS URLS ---
+        # The login page becomes the first worker; extra pages are opened only if there is work for them
+        pages = [page]
+        for _ in range(min(max(1, max_pages), len(urls)) - 1):
+            if governor and not governor.try_admit(session.profile.key):
+                print(f"🧠 [{display_name}] Not enough memory for more pages, using {len(pages)}")
+                break
+            pages.append(await pooled.page() if pooled else await context.new_page())
+        submitted = 0
+
+        async def submit_with_page(slot, target_url, attempt):
+            nonlocal submitted
+            failure = await submit_url(pages[slot], session, target_url, progress, attempt)
+            submitted += 1
+            if governor:
+                if submitted % memory.MEASURE_EVERY == 1:
+                    await governor.measure(session.profile.key, pages[slot])
+                if pool is not None:
+                    await governor.relieve(pool)
+            if pooled is not None:
+                pages[slot] = await pooled.used(pages[slot])
+            return failure
+
+        left = await process_urls(session, urls, progress, list(range(len(pages))), submit_with_page, retry_policy, stop_after=stop_after)
+        keep = True
+        return left
+
+    except Exception as e:
+        print(f"❌ Error during site session for {display_name}: {e}")
+        # Links already finished keep their status; the rest wait for a later run
+        session.record_session_failure(urls, e)
+        return []
+    finally:
+        if pooled is not None:
+            await pool.release(pooled, keep=keep)
+        else:
+            # Also writes the HAR file of a recording context
+            await context.close()
+
+def recording_name(profile):
+    """
+    File name stem for a site's recording: "127.0.0.1:8000" -> "127.0.0.1_8000".
+    """
+    return re.sub(r"[^\w.-]", "_", profile.key)
+
+async def record_site_session(new_context, session, urls, progress, record_dir, blocking=None, retry_policy=None):
+    """
+    Logs in from scratch and submits one link at a time in a context that records a HAR
+    (response bodies embedded, so CSRF tokens can be traced), stopping at the first success.
+    Writes <record_dir>/<site>.har and <site>.json (the values that were submitted, for
+    record.py to turn back into placeholders). Returns the links left for the normal session.
+    """
+    display_name = session.display_name
+    os.makedirs(record_dir, exist_ok=True)
+    stem = os.path.join(record_dir, recording_name(session.profile))
+
+    print(f"⏺️ [{display_name}] Recording the first submission to {stem}.har")
+    progress.report(f"⏺️ [{display_name}] Recording one submission...")
+    left = await run_browser_session(
+        new_context, session, urls, progress, max_pages=1, blocking=blocking, retry_policy=retry_policy,
+        stop_after=1, record_har_path=f"{stem}.har", record_har_content="embed"
+    )
+
+    submitted = session.last_success
+    if submitted is None:
+        print(f"⚠️ [{display_name}] No successful submission, nothing recorded")
+        return left
+    with open(f"{stem}.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "site_url": session.site_url,
+            "login_url": session.login_url,
+            "submit_url": session.submit_url,
+            "username": session.username,
+            "values": session.values(submitted),
+            "recorded_at": time.time(),
+        }, f, indent=2)
+    print(f"⏺️ [{display_name}] Recorded {submitted} - derive the flow with: python record.py {stem}.har")
+    return left
+
+async def process_urls(session, urls, progress, workers, submit_one, retry_policy=None, hand_off=(), stop_after=None):
+    """
+    Works through urls with every worker (a page, or an HTTP slot) pulling from one
+    retry.RetryScheduler: failed URLs are requeued at the back according to retry_policy,
+    and while the site's circuit breaker is open nothing is submitted and the links are deferred.
+    submit_one(worker, target_url, attempt) returns None on success or a retry.Failure.
+    A failure whose kind is in hand_off stops the run, as does the stop_after-th success;
+    the URLs not done are then returned.
+    """
+    display_name = session.display_name
+
+    def on_breaker(breaker):
+        icon = {circuit.OPEN: "⛔", circuit.HALF_OPEN: "🟡", circuit.CLOSED: "🟢"}[breaker.state]
+        message = f"{icon} [{display_name}] Circuit {breaker.describe()}"
+        print(message)
+        progress.report(message)
+        if breaker.state == circuit.OPEN:
+            session.record_deferred(scheduler.remaining(), f"circuit {breaker.describe()}")
+
+    scheduler = retry.RetryScheduler(urls, retry_policy, session.breaker, on_breaker)
+    succeeded = 0
+
+    async def work(worker):
+        nonlocal succeeded
+        while True:
+            target_url = await scheduler.next()
+            if target_url is None:
+                return
+            if session.is_cancelled():
+                scheduler.hand_back(target_url)
+                scheduler.stop("cancelled")
+                progress.report(f"🛑 [{display_name}] Batch cancelled, stopping.")
+                return
+            # The in-flight window shrinks when the site pushes back
+            await session.limiter.acquire()
+            try:
+                failure = await submit_one(worker, target_url, scheduler.attempt(target_url))
+            finally:
+                session.limiter.release()
+
+            if failure is not None and failure.kind in hand_off:
+                scheduler.hand_back(target_url)
+                scheduler.stop(failure.kind)
+                return
+
+            decision, delay = scheduler.done(target_url, failure)
+            if failure is None:
+                session.record_result(target_url)
+                succeeded += 1
+                if stop_after and succeeded >= stop_after:
+                    scheduler.stop(retry.SATISFIED)
+                    return
+                continue
+            error = f"{failure.kind} at {failure.step}: {failure.message}"
+            if decision == retry.RETRY:
+                print(f"🔁 [{display_name}] {failure.kind} at {failure.step}, retrying {target_url} in {delay:.0f}s")
+                progress.report(f"🔁 [{display_name}] {failure.kind.replace('_', ' ')} - will retry in {delay:.0f}s")
+                session.record_retry(target_url, error)
+            else:
+                session.record_result(target_url, error)
+
+    tasks = [asyncio.ensure_future(work(worker)) for worker in workers]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        # A page that raised stops the others before the caller closes the context under them
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # A probe never reported (a page that raised) must not hold the site's breaker half-open
+        scheduler.release_probe()
+
+    if scheduler.stopped == retry.BREAKER_OPEN:
+        left = scheduler.remaining()
+        session.record_deferred(left, f"circuit {session.breaker.describe()}")
+        print(f"⛔ [{display_name}] Circuit still open, stopping; {len(left)} links deferred for a later run")
+        progress.report(f"⛔ [{display_name}] Circuit open - {len(left)} links deferred for a later run")
+    if scheduler.stopped in hand_off or scheduler.stopped == retry.SATISFIED:
+        return scheduler.remaining()
+    return []
+
+async def run_http_session(session, urls, progress, max_connections=1, retry_policy=None):
+    """
+    Submits through http_engine (pooled HTTP client, no page) with up to max_connections
+    submissions in flight. Returns the URLs the browser has to take over after a bot check.
+    """
+    display_name = session.display_name
+    engine = http_engine.HttpSiteEngine(session.profile, session.site_url, DEFAULT_USER_AGENT, max_connections=max(1, max_connections))
+    try:
+        progress.report(f"Authenticating on {display_name} (HTTP)...")
+        try:
+            async with session.step("login"):
+                await engine.log_in(session.credentials(), session)
+        except Exception as e:
+            # Bot check or a login flow that no longer matches the site: the browser copes with both
+            print(f"⚠️ [{display_name}] HTTP login failed, using the browser: {e}")
+            return list(urls)
+        print(f"⚡ [{display_name}] Logged in over HTTP")
+
+        async def submit_over_http(slot, target_url, attempt):
+            return await submit_url_http(engine, session, target_url, progress, attempt)
+
+        slots = range(min(max(1, max_connections), len(urls)))
+        return await process_urls(session, urls, progress, slots, submit_over_http, retry_policy, hand_off=(retry.CHALLENGE,))
+    finally:
+        await engine.close()
+
+# Shorter page descriptions get the link appended to meet the sites' minimum lengths
+MIN_DESCRIPTION = 60
+
+def submission_values(target_url, metadata=None):
+    """
+    Template values for the details form. With the link's prefetch.Metadata the page's
+    own title, meta description and keywords are used where it has them.
+    """
+    # Tags - Use domain keyword
+    try:
+        domain_keyword = target_url.split('/')[2].replace('www.', '').split('.')[0]
+    except IndexError:
+        domain_keyword = ""
+
+    values = {
+        "url": target_url,
+        # Use the URL itself as the title and description
+        "title": target_url,
+        # Description - Use the URL repeated to ensure it meets any length requirements
+        "description": f"{target_url} - {target_url}",
+        "tags": domain_keyword,
+    }
+    if metadata is not None:
+        if metadata.title:
+            values["title"] = metadata.title[:200]
+        if metadata.description:
+            description = metadata.description[:1000]
+            values["description"] = description if len(description) >= MIN_DESCRIPTION else f"{description} - {target_url}"
+        if metadata.keywords:
+            values["tags"] = ", ".join(metadata.keywords[:5])
+    return values
+
+def start_submission(session, target_url, progress, attempt):
+    """
+    Progress and job-store bookkeeping for one attempt; returns the URL's number in this session.
+    """
+    if attempt == 1:
+        progress.advance()
+        session.started += 1
+        progress.report(f"[{session.display_name}] Processing: {target_url}")
+    else:
+        progress.report(f"[{session.display_name}] Retrying ({attempt}): {target_url}")
+    session.record_start(target_url)
+    return session.started
+
+async def submit_url(page, session, target_url, progress, attempt=1):
+    """
+    Walks one URL through the site's submit flow (by default /submit -> #checkUrl ->
+    #articleTitle -> #submit, see site_profiles.json).
+    Failures are reported and swallowed so the remaining URLs keep going.
+    Returns None when the submission went through, otherwise the classified retry.Failure.
+    """
+    display_name = session.display_name
+    submit_url = session.submit_url
+    sel = session.profile.selectors
+    timeouts = session.profile.timeouts
+
+    local_step = start_submission(session, target_url, progress, attempt)
+
+    # step: short name of the current step (as traced), used to classify failures
+    step, step_description = "start", "Starting"
+    try:
+        # Phase 1: URL
+        step, step_description = "goto_submit", f"Navigating to Submit Page ({display_name})"
+        print(f"🔗 [{local_step}/{session.url_count}] {step_description}...")
+        await session.pace(target_url)
+        async with session.step("goto_submit", target_url):
+            response = await page.goto(submit_url, wait_until="domcontentloaded")
+        throttled = session.check_response(response)
+        if throttled:
+            print(f"🚦 [{display_name}] Site answered {response.status} ({throttled}), slowing down")
+        elif response is not None and response.status >= 500:
+            raise retry.SubmissionError(retry.SITE_DOWN, f"Submit page answered HTTP {response.status}")
+
+        # Whichever shows up first: the submit form, or a login form (session lost).
+        # Also covers Cloudflare/browser checks, which resolve into one of the two.
+        step, step_description = "submit_form", f"Waiting for Submit Form ({sel['check_url']}) or Login Redirect"
+        async with session.step("submit_form", target_url):
+            matched = await waits.race_selectors(page, [sel["check_url"], sel["username"]], timeout=timeouts["submit_form"])
+
+        # Check for Login Redirect (Robust Check)
+        is_login_page = "login" in page.url or matched == sel["username"]
+
+        if is_login_page:
+            # Frequent session loss is one of the signs of going too fast
+            session.limiter.throttle("login_redirect")
+            waited = session.login_lock.locked()
+            async with session.login_lock:
+                if waited:
+                    # Another page just re-authenticated; retry with the refreshed cookies
+                    await session.pace(target_url)
+                    await page.goto(submit_url)
+                    is_login_page = "login" in page.url or await page.locator(sel["username"]).count() > 0
+
+                if is_login_page:
+                    step, step_description = "relogin_form", "Re-authenticating"
+                    print("🔒 Session lost. Re-logging...")
+                    session.forget_login()
+                    # wait for full load
+                    await page.wait_for_selector(sel["username"], timeout=timeouts["relogin_form"])
+                    async with session.step("relogin", target_url):
+                        await session.log_in(page)
+
+                    step, step_description = "login_redirect", "Waiting for Post-Login Redirect"
                     try:
-                        await page.wait_for_url("**/user/**", timeout=15000)
-                    except Exception:
-                        await asyncio.sleep(3)
-                        
-                    print("✅ Login assumed successful.")
-                
-                # --- PROCESS URLS ---
-                for i, target_url in enumerate(urls):
-                    global_step += 1
-                    local_step = i + 1
-                    
-                    if progress_callback: progress_callback(global_step, total_steps, f"[{display_name}] Processing: {target_url}")
-                    
+                        # Wait for either /user/* OR just not being on /login
+                        async with session.step("login_redirect", target_url):
+                            await page.wait_for_url(lambda u: "login" not in u and "submit" not in u, timeout=timeouts["login_redirect"])
+                    except:
+                        print("⚠️ Login redirect wait timed out, proceeding to force navigation...")
+
+                    print("✅ Re-logged in (assumed). Navigating back to submit...")
+                    await session.remember_login(page)
+                    step, step_description = "relogin", "Navigating to Submit Page (Retry)"
+                    await session.pace(target_url)
+                    await page.goto(submit_url)
+                    if "login" in page.url:
+                        raise retry.SubmissionError(retry.SESSION_LOST, "Still on the login page after re-authenticating")
+
+        # Step 1: Input URL
+        step, step_description = "fill_check_url", f"Waiting for URL Input Field ({sel['check_url']})"
+        async with session.step("fill_check_url", target_url):
+            await page.wait_for_selector(sel["check_url"], state='visible', timeout=timeouts["submit_form"])
+            await page.fill(sel["check_url"], target_url)
+
+        # Click Continue and Wait for Phase 2
+        step, step_description = "reveal_form", "Clicking Continue and Waiting for Form"
+        print("➡️ Clicking Continue...")
+
+        form_visible = False
+        for attempt in range(session.profile.continue_attempts):
+            async with session.step("continue_click", target_url, attempt=attempt + 1):
+                if await page.locator(sel["continue_button"]).count() > 0:
+                     await page.click(sel["continue_button"])
+                else:
+                     await page.click(sel["continue_fallback"])
+
+            try:
+                # Returns the moment the details form is revealed; retry the click straight away otherwise
+                async with session.step("reveal_form", target_url, attempt=attempt + 1):
+                    await page.wait_for_selector(sel["title"], state='visible', timeout=timeouts["reveal_form"])
+                form_visible = True
+                break
+            except PlaywrightTimeoutError:
+                print(f"⚠️ Attempt {attempt+1}: Form didn't appear. Retrying click...")
+
+        if not form_visible:
+            # Capture screenshot for debug
+            try:
+                safe_name = "".join([c for c in target_url if c.isalnum()])[:20]
+                await page.screenshot(path=f"debug_fail_{safe_name}.png")
+            except: pass
+            raise retry.SubmissionError(retry.FORM_NOT_REVEALED, "Failed to reveal Level 2 form after multiple clicks")
+
+        print("✅ Article Details form visible.")
+
+        # Phase 2: Details - title, category, description, tags, then save (site_profiles details_steps)
+        print("💾 Filling and Saving Details...")
+        values = session.values(target_url)
+        for details_step in session.profile.details_steps:
+            step, step_description = details_step.name, f"Filling Article Details ({details_step.name})"
+            async with session.step(details_step.name, target_url):
+                await run_step(page, details_step, values)
+
+        # Phase 3: Final Submit - New Page / Section
+        step, step_description = "final_submit_button", "Waiting for Final Submit Button"
+        print("⏳ Waiting for Final Submit Button...")
+        async with session.step("final_submit_button", target_url):
+            await page.wait_for_selector(sel["final_submit"], state='visible', timeout=timeouts["final_submit_button"])
+
+        # Submitting - wait for the site's answer to the POST (or the navigation it causes)
+        # rather than network idle, which trackers on these pages can keep busy for 15s
+        step, step_description = "confirmation", "Clicking Final Submit and Waiting for Confirmation"
+        await session.pace(target_url)
+        async with session.step("confirmation", target_url):
+            response = await waits.click_and_wait_for_submit(page, sel["final_submit"], session.site_url, timeout=timeouts["confirmation"])
+        print("✅ Clicked Final Submit")
+        # Only a 2xx/3xx answer (or a plain navigation) counts; an error page is not a submission
+        if response is not None:
+            session.check_response(response)
+            error = retry.status_failure(response.status, "confirmation", "Final submit")
+            if error is not None:
+                raise error
+        print(f"🎉 Successfully Submitted: {target_url}")
+        return None
+
+    except PlaywrightTimeoutError as e:
+        print(f"TIMEOUT during: {step_description}")
+        session.limiter.throttle("timeout")
+        # Try to screenshot
+        try:
+            safe_name = "".join([c for c in target_url if c.isalnum()])[:20]
+            await page.screenshot(path=f"timeout_{safe_name}.png")
+            print(f"📸 Screenshot saved to timeout_{safe_name}.png")
+
+            # Debug Page Content
+            title = await page.title()
+            print(f"📄 Page Title: {title}")
+            if DEBUG_DUMPS:
+                content = await page.content()
+                print(f"📄 Page Content Snippet: {content[:500]}...")
+        except: pass
+
+        progress.report(f"⚠️ [{display_name}] Timeout during **{step_description}**")
+        return retry.classify(e, step)
+    except Exception as e:
+        print(f"Error on {target_url}: {e}")
+        progress.report(f"❌ [{display_name}] Error: {str(e)}")
+        return retry.classify(e, step)
+
+async def submit_url_http(engine, session, target_url, progress, attempt=1):
+    """
+    submit_url for the HTTP engine: replays the profile's submit flow with the URL's values.
+    Returns None on success, otherwise the classified retry.Failure (kind "challenge" hands
+    the site over to the browser).
+    """
+    display_name = session.display_name
+    local_step = start_submission(session, target_url, progress, attempt)
+    print(f"⚡ [{local_step}/{session.url_count}] {display_name}: {target_url}")
+    logins = session.logins
+    try:
+        await engine.submit(session.values(target_url), session, target_url)
+        print(f"🎉 Successfully Submitted: {target_url}")
+        return None
+    except http_engine.ChallengeDetected as e:
+        print(f"🧩 [{display_name}] {e}")
+        session.limiter.throttle("challenge")
+        return retry.Failure(retry.CHALLENGE, e.step, str(e))
+    except Exception as e:
+        failure = retry.classify(e, "http_submit")
+        print(f"Error on {target_url}: {failure.message}")
+        progress.report(f"❌ [{display_name}] {failure.kind.replace('_', ' ')} at {failure.step}")
+        if failure.kind == retry.TIMEOUT:
+            session.limiter.throttle("timeout")
+        elif failure.kind == retry.SESSION_LOST:
+            session.limiter.throttle("login_redirect")
+            # One slot logs in again; the others' retries go out with its new cookies
+            async with session.login_lock:
+                if session.logins == logins:
                     try:
-                        # Phase 1: URL
-                        step_description = f"Navigating to Submit Page ({display_name})"
-                        print(f"🔗 [{local_step}/{len(urls)}] {step_description}...")
-                        await page.goto(submit_url)
-                        
-                        # Wait for potential Cloudflare or browser check
-                        step_description = "Waiting for Network Idle"
-                        try:
-                            await page.wait_for_load_state('networkidle', timeout=15000)
-                        except Exception:
-                            print("⚠️ Network idle timed out, continuing anyway...")
-                        
-                        # Check for Login Redirect (Robust Check)
-                        is_login_page = "login" in page.url
-                        if not is_login_page:
-                            try:
-                                 # Quick check if username field is present
-                                 await page.wait_for_selector("input[name='username']", state="visible", timeout=2000)
-                                 is_login_page = True
-                            except: pass
-        
-                        if is_login_page:
-                            step_description = "Re-authenticating"
-                            print("🔒 Session lost. Re-logging...")
-                            # wait for full load
-                            await page.wait_for_selector("input[name='username']", timeout=10000)
-                            await page.fill("input[name='username']", username)
-                            await page.fill("input[name='password']", password)
-                            await page.click("button[type='submit'], .btn-primary")
-                            
-                            step_description = "Waiting for Post-Login Redirect"
-                            try:
-                                # Wait for either /user/* OR just not being on /login
-                                await page.wait_for_url(lambda u: "login" not in u and "submit" not in u, timeout=15000)
-                            except:
-                                print("⚠️ Login redirect wait timed out, proceeding to force navigation...")
-                            
-                            print("✅ Re-logged in (assumed). Navigating back to submit...")
-                            step_description = "Navigating to Submit Page (Retry)"
-                            await page.goto(submit_url)
-                        
-                        # Step 1: Input URL
-                        step_description = "Waiting for URL Input Field (#checkUrl)"
-                        await page.wait_for_selector("#checkUrl", state='visible', timeout=15000)
-                        await page.fill('#checkUrl', target_url)
-                        
-                        # Click Continue and Wait for Phase 2
-                        step_description = "Clicking Continue and Waiting for Form"
-                        print("➡️ Clicking Continue...")
-                        
-                        form_visible = False
-                        for attempt in range(3):
-                            if await page.locator(".checkUrl").count() > 0:
-                                 await page.click('.checkUrl')
-                            else:
-                                 await page.click('input[value="Continue"]')
-                            
-                            try:
-                                # Short wait to see if it worked
-                                await page.wait_for_selector('#articleTitle', state='visible', timeout=8000)
-                                form_visible = True
-                                break
-                            except PlaywrightTimeoutError:
-                                print(f"⚠️ Attempt {attempt+1}: Form didn't appear. Retrying click...")
-                                await asyncio.sleep(2)
-                        
-                        if not form_visible:
-                            # Capture screenshot for debug
-                            try:
-                                safe_name = "".join([c for c in target_url if c.isalnum()])[:20]
-                                await page.screenshot(path=f"debug_fail_{safe_name}.png")
-                            except: pass
-                            raise Exception("Failed to reveal Level 2 form after multiple clicks")
-                        
-                        print("✅ Article Details form visible.")
-
-                        # Phase 2: Details
-                        step_description = "Filling Article Details"
-                        
-                        # Use the URL itself as the title and description
-                        title = target_url
-                        await page.fill('#articleTitle', title)
-
-                        # Category - attempt to select 'News' by label or value
-                        try:
-                            # Try selecting by label "News" first, then value if known (often '4' was news before)
-                            await page.select_option('#category', label='News')
-                        except:
-                            try:
-                                # Fallback to index if label fails (finding 'News' usually in top 5)
-                                # Assuming previous index 4 was News, checking if that persists
-                                await page.select_option('#category', index=4)
-                            except:
-                                # Last resort fallback
-                                await page.select_option('#category', index=1)
-
-                        # Description - Use the URL repeated to ensure it meets any length requirements
-                        desc = f"{target_url} - {target_url}"
-                        await page.fill('#description', desc)
-                        
-                        # Tags - Use domain keyword
-                        try:
-                            domain_keyword = target_url.split('/')[2].replace('www.', '').split('.')[0]
-                            await page.fill('#tags', domain_keyword)
-                        except: pass
-                        
-                        # Submit Phase 2
-                        step_description = "Saving Details"
-                        print("💾 Saving Details...")
-                        await page.click('.saveChanges')
-
-                        # Phase 3: Final Submit - New Page / Section
-                        step_description = "Waiting for Final Submit Button"
-                        print("⏳ Waiting for Final Submit Button...")
-                        await page.wait_for_selector('#submit', state='visible', timeout=30000)
-                        
-                        # Submitting
-                        step_description = "Clicking Final Submit"
-                        await page.click('#submit')
-                        print("✅ Clicked Final Submit")
-                        
-                        # Wait for success confirmation or navigation
-                        step_description = "Waiting for Success Confirmation"
-                        await page.wait_for_load_state('networkidle', timeout=15000)
-                        print(f"🎉 Successfully Submitted: {target_url}")
-
-                    except PlaywrightTimeoutError as e:
-                        print(f"TIMEOUT during: {step_description}")
-                        # Try to screenshot
-                        try:
-                            safe_name = "".join([c for c in target_url if c.isalnum()])[:20]
-                            await page.screenshot(path=f"timeout_{safe_name}.png")
-                            print(f"📸 Screenshot saved to timeout_{safe_name}.png")
-                            
-                            # Debug Page Content
-                            title = await page.title()
-                            content = await page.content()
-                            print(f"📄 Page Title: {title}")
-                            print(f"📄 Page Content Snippet: {content[:500]}...")
-                        except: pass
-                        
-                        if progress_callback: progress_callback(global_step, total_steps, f"⚠️ Timeout during **{step_description}**, skipping...")
-                    except Exception as e:
-                        print(f"Error on {target_url}: {e}")
-                        if progress_callback: progress_callback(global_step, total_steps, f"❌ Error: {str(e)}")
-            
+                        await engine.log_in(session.credentials(), session)
+                        session.logins += 1
+                    except Exception as login_error:
+                        print(f"⚠️ [{display_name}] HTTP re-login failed: {login_error}")
+        return failure
+
+def no_progress_wait(idle_passes):
+    """
+    Seconds to wait after `idle_passes` passes in a row that finished no link.
+    """
+    return min(NO_PROGRESS_MAX_WAIT, NO_PROGRESS_WAIT * 2 ** (idle_passes - 1))
+
+async def run_worker(store, worker_id=None, headless=True, poll_interval=2.0, concurrency=1, once=False, trace_file=None):
+    """
+    Background worker: claims (batch, site) work queued with JobStore.enqueue_batch and runs it.
+    Several worker processes can share one job database; each site is only worked on by one.
+    Must run on ag.manager's thread (contexts come from the shared browser).
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    print(f"👷 Worker {worker_id} waiting for jobs in {store.path}...")
+
+    async def claim_loop(slot):
+        idle_passes = 0
+        while True:
+            claimed = store.claim_site(f"{worker_id}-{slot}")
+            if claimed is None:
+                if once:
+                    return
+                await asyncio.sleep(poll_interval)
+                continue
+
+            batch_id, site_url = claimed
+            # The links come from the job store a chunk at a time, however large the batch
+            batch_sites, options = store.batch_config(batch_id)
+            site = next((config for config in batch_sites if config['url'] == site_url), None)
+            if site is None or store.is_cancelled(batch_id):
+                store.release_claim(batch_id, site_url)
+                continue
+
+            print(f"👷 [{slot}] Batch {batch_id}: submitting to {site_url}")
+            finished_before = store.finished_tasks(batch_id, site_url)
+            try:
+                await run_batch_submission(
+                    [], [site], headless=headless, use_shared_browser=True,
+                    job_store=store, batch_id=batch_id, worker_id=f"{worker_id}-{slot}",
+                    trace_file=trace_file, max_urls_per_site=jobs.WORK_CHUNK, **options
+                )
+            except Exception as e:
+                print(f"❌ Worker job {batch_id} / {site_url} failed: {e}")
+                store.release_claim(batch_id, site_url)
+
+            # A site that keeps failing before any link is finished is not claimed again straight away
+            idle_passes = 0 if store.finished_tasks(batch_id, site_url) > finished_before else idle_passes + 1
+            if idle_passes:
+                await asyncio.sleep(no_progress_wait(idle_passes))
+
+    await asyncio.gather(*(claim_loop(slot) for slot in range(max(1, concurrency))))
+
+# run_batch_submission arguments the broker worker sets itself; task options cannot override them
+WORKER_SET_OPTIONS = {"urls", "site_configs", "headless", "progress_callback", "use_shared_browser", "job_store", "batch_id", "worker_id", "trace_file"}
+
+def lease_options(options):
+    """
+    Splits a leased task's options into the run_batch_submission keyword arguments it may
+    set and the keys that are dropped (unknown to this version, or set by the worker).
+    """
+    allowed = set(inspect.signature(run_batch_submission).parameters) - WORKER_SET_OPTIONS
+    accepted = {key: value for key, value in options.items() if key in allowed}
+    return accepted, sorted(set(options) - set(accepted))
+
+async def run_broker_worker(broker, store, worker_id=None, headless=True, poll_interval=2.0, concurrency=1, once=False,
+                            trace_file=None, lease_size=brokers.LEASE_SIZE, lease_ttl=brokers.LEASE_TTL):
+    """
+    Distributed worker: leases the tasks of one site at a time from a broker (see broker.py),
+    submits them with run_batch_submission and acknowledges each one. The lease is kept alive
+    by a heartbeat while the site runs. `store` is this machine's job store; it keeps the
+    outcome of every leased link and the submission history.
+    Must run on ag.manager's thread (contexts come from the shared browser).
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    print(f"👷 Worker {worker_id} leasing tasks from {type(broker).__name__}...")
+
+    async def keep_lease(lease_id):
+        while True:
+            await asyncio.sleep(lease_ttl / 3)
+            if not broker.heartbeat(lease_id, lease_ttl):
+                print(f"⚠️ Lease {lease_id} expired; its links may go to another worker")
+
+    async def lease_loop(slot):
+        name = f"{worker_id}-{slot}"
+        idle_passes = 0
+        while True:
+            tasks = broker.lease(name, lease_size, lease_ttl)
+            if not tasks:
+                if once:
+                    return
+                await asyncio.sleep(poll_interval)
+                continue
+
+            lease_id, first = tasks[0].lease_id, tasks[0]
+            try:
+                username, password = brokers.resolve_credentials(first.credentials_ref)
+            except (KeyError, OSError, ValueError) as e:
+                print(f"❌ No credentials for {first.site_url} ({first.credentials_ref}): {e}")
+                for task in tasks:
+                    broker.fail(lease_id, task.task_id, f"credentials {first.credentials_ref}: {e}")
+                broker.end_lease(lease_id)
+                continue
+
+            site = {"url": first.site_url, "username": username, "password": password}
+            options, dropped = lease_options(first.options)
+            if dropped:
+                print(f"⚠️ Lease {lease_id}: ignoring options run_batch_submission does not take from a task: {', '.join(dropped)}")
+            # Local bookkeeping for this lease only; deleted below once the broker has the outcome
+            batch_id = f"lease-{lease_id}"
+            print(f"👷 [{slot}] Lease {lease_id}: {len(tasks)} links for {first.site_url}")
+            heartbeat = asyncio.create_task(keep_lease(lease_id))
+            try:
+                await run_batch_submission(
+                    [task.url for task in tasks], [site], headless=headless, use_shared_browser=True,
+                    job_store=store, batch_id=batch_id, worker_id=name, trace_file=trace_file, **options
+                )
             except Exception as e:
-                print(f"❌ Error during site session for {display_name}: {e}")
+                print(f"❌ Lease {lease_id} / {first.site_url} failed: {e}")
             finally:
-                await page.close()
+                heartbeat.cancel()
 
-    finally:
-        await browser.close()
-        print("Bot session ended.")
+            # Repeated links were only submitted once: they share the outcome of their twin
+            results = {history.normalize_url(url): result for url, result in store.task_results(batch_id, first.site_url).items()}
+            # The history keeps what was submitted; the tasks would pile up one batch per lease
+            store.delete_batch(batch_id)
+            retry_later, retry_now = [], []
+            for task in tasks:
+                status, error = results.get(history.normalize_url(task.url), (jobs.PENDING, None))
+                if status in (jobs.DONE, jobs.SKIPPED):
+                    broker.ack(lease_id, task.task_id)
+                elif status == jobs.FAILED:
+                    broker.fail(lease_id, task.task_id, error)
+                elif status == jobs.DEFERRED:
+                    retry_later.append(task.task_id)
+                else:
+                    retry_now.append(task.task_id)
+            # Deferred links wait out the site's circuit breaker on whichever worker leases them next
+            broker.release(lease_id, retry_later, delay=jobs.DEFERRED_RETRY_AFTER)
+            # Links left pending by a run that finished none of them are not leased again straight away
+            idle_passes = idle_passes + 1 if len(retry_later) + len(retry_now) == len(tasks) else 0
+            broker.release(lease_id, retry_now, delay=no_progress_wait(idle_passes) if idle_passes else 0.0)
+            broker.end_lease(lease_id)
+
+    await asyncio.gather(*(lease_loop(slot) for slot in range(max(1, concurrency))))
+
+async def run_stored_batch(store, batch_id, site_configs, chunk=jobs.WORK_CHUNK, poll_interval=1.0, **options):
+    """
+    Submits a batch that lives in the job store (e.g. one still being filled by ingest.py)
+    inline, `chunk` links per site at a time, until its ingestion is over and nothing is pending.
+    Extra options are passed to run_batch_submission. Passes that finish no link (every
+    site failing) are spaced out with no_progress_wait().
+    """
+    idle_passes = 0
+    while True:
+        before = store.batch_status(batch_id)
+        await run_batch_submission([], site_configs, job_store=store, batch_id=batch_id, max_urls_per_site=chunk, **options)
+        status = store.batch_status(batch_id)
+        if status["state"] in (jobs.FINISHED, jobs.CANCELLED):
+            return batch_id
+        if not status[jobs.PENDING]:
+            if status["state"] != jobs.INGESTING:
+                return batch_id
+            # Caught up with the file: wait for the next chunk
+            await asyncio.sleep(poll_interval)
+
+        # A pass that had links to work on and finished none of them (sites failing) is idle
+        had_work = before[jobs.PENDING] + before[jobs.RUNNING] + before[jobs.DEFERRED]
+        finished = [counts[jobs.DONE] + counts[jobs.FAILED] + counts[jobs.SKIPPED] for counts in (before, status)]
+        idle_passes = idle_passes + 1 if had_work and finished[1] == finished[0] else 0
+        if idle_passes:
+            print(f"⏳ No link finished in the last pass, waiting {no_progress_wait(idle_passes):.0f}s")
+            await asyncio.sleep(no_progress_wait(idle_passes))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bot", description="Antigravity bookmarking bot")
+    commands = parser.add_subparsers(dest="command")
+
+    worker = commands.add_parser("worker", help="run queued batches from the job database")
+    worker.add_argument("--db", default=jobs.JOBS_DB_PATH, help="job database path (default: %(default)s)")
+    worker.add_argument("--concurrency", type=int, default=1, help="sites processed at the same time by this worker")
+    worker.add_argument("--poll", type=float, default=2.0, help="seconds between queue polls when idle")
+    worker.add_argument("--headful", action="store_true", help="show the browser window")
+    worker.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    worker.add_argument("--trace", default=tracing.TRACE_FILE, help="append per-step timings to this JSONL file")
+    worker.add_argument("--broker", help="lease tasks from this broker (e.g. file:///mnt/shared/queue; sqlite: is one machine only, see broker.py) "
+                                         "instead of claiming batches from --db")
+    worker.add_argument("--lease-size", type=int, default=brokers.LEASE_SIZE, help="links leased at a time with --broker")
+
+    recorder = commands.add_parser("record", help="record one browser submission per site for record.py")
+    recorder.add_argument("url", help="link to submit while recording")
+    recorder.add_argument("--site", action="append", required=True, help="site URL (repeatable)")
+    recorder.add_argument("--username", default=os.getenv("BOOKMARK_USER"), required=not os.getenv("BOOKMARK_USER"))
+    recorder.add_argument("--password", default=os.getenv("BOOKMARK_PASS"), required=not os.getenv("BOOKMARK_PASS"))
+    recorder.add_argument("--out", default=record.RECORD_DIR, help="directory for the HAR files (default: %(default)s)")
+    recorder.add_argument("--headful", action="store_true", help="show the browser window")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        configs = [{"url": site, "username": args.username, "password": args.password} for site in args.site]
+        # A fresh login, so the recording covers the login flow too
+        ag.run(run_batch_submission([args.url], configs, headless=not args.headful, use_session_cache=False, record_dir=args.out))
+        return
+
+    if args.command == "worker":
+        store = jobs.JobStore(args.db)
+        broker = brokers.open_broker(args.broker) if args.broker else None
+        if broker:
+            future = ag.manager.submit(run_broker_worker(
+                broker, store, headless=not args.headful, poll_interval=args.poll,
+                concurrency=args.concurrency, once=args.once, trace_file=args.trace, lease_size=args.lease_size
+            ))
+        else:
+            future = ag.manager.submit(run_worker(
+                store, headless=not args.headful, poll_interval=args.poll,
+                concurrency=args.concurrency, once=args.once, trace_file=args.trace
+            ))
+        try:
+            future.result()
+        except KeyboardInterrupt:
+            print("👋 Worker stopping...")
+            future.cancel()
+        finally:
+            ag.manager.shutdown()
+            store.close()
+            if broker:
+                broker.close()
+        return
 
-if __name__ == "__main__":
     # Test execution
     test_urls = [
         "https://curtiscenter.math.ucla.edu/wp-content/uploads/ninja-forms/76/1/Official-Apps-Guide4.pdf",
@@ -259,3 +1240,6 @@ if __name__ == "__main__":
     
     # print("Running in HEADFUL mode for debugging...")
     ag.run(run_batch_submission(test_urls, test_configs, headless=True))
+
+if __name__ == "__main__":
+    main()
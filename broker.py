@@ -0,0 +1,528 @@
+"""
+Task broker for running the bot on several machines.
+
+    python broker.py publish links.txt --site https://www.abookmarking.com --credentials env:BOOKMARK
+    python -m bot worker --broker file:///mnt/shared/bookmark_queue       # on every machine
+    python broker.py status
+
+A coordinator publishes (URL, site, credentials-ref) tasks. Workers lease the tasks of one
+site at a time, heartbeat while they submit them, and then acknowledge each one (done,
+failed, or released for later). A worker that stops heartbeating loses its lease, and its
+tasks go back to the queue. Credentials never go through the broker: a credentials ref
+such as "env:BOOKMARK" is resolved on the worker (see resolve_credentials).
+
+Brokers are looked up by scheme in BROKERS. "file:" works on a disk every machine mounts;
+"sqlite:" is for the workers of a single machine (testing), as SQLite's WAL mode needs
+shared memory on one host and does not work over a network filesystem. A networked broker
+only has to implement the Broker methods.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+# Where workers and the coordinator find the broker, e.g. file:///mnt/shared/queue (several machines)
+# or sqlite:///srv/broker.db (one machine)
+BROKER_URL = os.getenv("BOOKMARK_BROKER", f"sqlite:///{os.path.join(os.getcwd(), 'bookmark_broker.db')}")
+
+# Tasks handed out per lease (all for the same site, so the worker logs in once)
+LEASE_SIZE = 50
+
+# A lease not renewed by a heartbeat for this long is presumed dead and its tasks requeued
+LEASE_TTL = 120.0
+
+# A task whose lease expired this many times is failed instead of requeued again
+MAX_LEASE_ATTEMPTS = 3
+
+# Task states
+READY = "ready"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+Task = namedtuple("Task", ["task_id", "url", "site_url", "credentials_ref", "options", "attempts", "lease_id"])
+
+def task_id_for(url, site_url):
+    """
+    Same link, same site -> same task: publishing a list twice does not queue it twice.
+    """
+    return hashlib.sha1(f"{site_url.rstrip('/').lower()}|{url}".encode("utf-8")).hexdigest()[:20]
+
+def resolve_credentials(ref):
+    """
+    (username, password) for a credentials ref, looked up on the worker:
+    "env:NAME" reads $NAME_USER / $NAME_PASS; "file:/path/creds.json#key" reads
+    {"key": {"username": ..., "password": ...}} from a file on the worker.
+    Raises KeyError (or OSError for an unreadable file) when they are missing.
+    """
+    kind, _, value = ref.partition(":")
+    if kind == "env":
+        return os.environ[f"{value}_USER"], os.environ[f"{value}_PASS"]
+    if kind == "file":
+        path, _, key = value.partition("#")
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)[key]
+        return entry["username"], entry["password"]
+    raise KeyError(f"unknown credentials ref {ref!r}")
+
+class Broker:
+    """
+    What the coordinator and the workers need from a broker.
+    """
+    def publish(self, urls, site_url, credentials_ref, options=None):
+        """
+        Queues one task per link for the site; returns how many were new.
+        """
+        raise NotImplementedError
+
+    def lease(self, worker, limit=LEASE_SIZE, ttl=LEASE_TTL):
+        """
+        Up to `limit` ready tasks of one site that no other lease is working on, all with
+        the same lease_id; [] when there is nothing to do. Expired leases are requeued first.
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, lease_id, ttl=LEASE_TTL):
+        """
+        Extends a lease; False when it already expired (its tasks may be with another worker).
+        """
+        raise NotImplementedError
+
+    def ack(self, lease_id, task_id):
+        raise NotImplementedError
+
+    def fail(self, lease_id, task_id, error):
+        raise NotImplementedError
+
+    def release(self, lease_id, task_ids, delay=0.0):
+        """
+        Puts leased tasks back, ready again after `delay` seconds; their attempts are not counted.
+        """
+        raise NotImplementedError
+
+    def end_lease(self, lease_id):
+        """
+        Closes a lease; tasks it still holds are released.
+        """
+        raise NotImplementedError
+
+    def requeue_expired(self):
+        """
+        Requeues the tasks of expired leases (failing those that expired too often); returns how many.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """
+        Task counts by state plus the open leases, e.g. {"ready": 10, "leased": 50, ..., "leases": 1}.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+BROKER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    site_url TEXT NOT NULL,
+    credentials_ref TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'ready',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_id TEXT,
+    available_at REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_broker_tasks_state ON tasks (state, site_url);
+CREATE INDEX IF NOT EXISTS idx_broker_tasks_lease ON tasks (lease_id);
+CREATE TABLE IF NOT EXISTS leases (
+    lease_id TEXT PRIMARY KEY,
+    worker TEXT NOT NULL,
+    site_url TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+class SqliteBroker(Broker):
+    """
+    Broker in one SQLite (WAL) database, shared by the processes of one machine. Never put
+    it on a network filesystem: WAL needs shared memory on one host (use FileBroker there).
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(BROKER_SCHEMA)
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def publish(self, urls, site_url, credentials_ref, options=None):
+        now = time.time()
+        options = json.dumps(options or {}, sort_keys=True)
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO tasks (task_id, url, site_url, credentials_ref, options, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((task_id_for(url, site_url), url, site_url, credentials_ref, options, now, now) for url in urls)
+            )
+            return self._conn.total_changes - before
+
+    def _requeue_expired(self, now):
+        expired = [row["lease_id"] for row in self._conn.execute("SELECT lease_id FROM leases WHERE expires_at < ?", (now,))]
+        requeued = 0
+        for lease_id in expired:
+            self._conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END, "
+                "error = CASE WHEN attempts + 1 >= ? THEN 'lease expired too often' ELSE error END, "
+                "attempts = attempts + 1, lease_id = NULL, updated_at = ? WHERE lease_id = ? AND state = ?",
+                (MAX_LEASE_ATTEMPTS, FAILED, READY, MAX_LEASE_ATTEMPTS, now, lease_id, LEASED)
+            )
+            requeued += self._conn.execute("SELECT changes()").fetchone()[0]
+            self._conn.execute("DELETE FROM leases WHERE lease_id = ?", (lease_id,))
+        return requeued
+
+    def requeue_expired(self):
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            return self._requeue_expired(time.time())
+
+    def lease(self, worker, limit=LEASE_SIZE, ttl=LEASE_TTL):
+        now = time.time()
+        with self._lock, self._conn:
+            # Take the write lock up front so two workers cannot lease the same site
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._requeue_expired(now)
+            group = self._conn.execute(
+                "SELECT site_url, credentials_ref, options FROM tasks "
+                "WHERE state = ? AND available_at <= ? AND site_url NOT IN (SELECT site_url FROM leases) "
+                "ORDER BY created_at LIMIT 1",
+                (READY, now)
+            ).fetchone()
+            if group is None:
+                return []
+            lease_id = uuid.uuid4().hex[:16]
+            rows = self._conn.execute(
+                "SELECT * FROM tasks WHERE state = ? AND available_at <= ? AND site_url = ? AND credentials_ref = ? "
+                "AND options = ? ORDER BY created_at, task_id LIMIT ?",
+                (READY, now, group["site_url"], group["credentials_ref"], group["options"], limit)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE tasks SET state = ?, lease_id = ?, updated_at = ? WHERE task_id = ?",
+                ((LEASED, lease_id, now, row["task_id"]) for row in rows)
+            )
+            self._conn.execute(
+                "INSERT INTO leases (lease_id, worker, site_url, expires_at) VALUES (?, ?, ?, ?)",
+                (lease_id, worker, group["site_url"], now + ttl)
+            )
+        return [Task(row["task_id"], row["url"], row["site_url"], row["credentials_ref"],
+                     json.loads(row["options"]), row["attempts"], lease_id) for row in rows]
+
+    def heartbeat(self, lease_id, ttl=LEASE_TTL):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE leases SET expires_at = ? WHERE lease_id = ?", (time.time() + ttl, lease_id))
+            return self._conn.execute("SELECT changes()").fetchone()[0] == 1
+
+    def _settle(self, lease_id, task_id, state, error=None, available_at=0.0):
+        self._execute(
+            "UPDATE tasks SET state = ?, error = ?, lease_id = NULL, available_at = ?, updated_at = ? "
+            "WHERE task_id = ? AND lease_id = ? AND state = ?",
+            (state, error, available_at, time.time(), task_id, lease_id, LEASED)
+        )
+
+    def ack(self, lease_id, task_id):
+        self._settle(lease_id, task_id, DONE)
+
+    def fail(self, lease_id, task_id, error):
+        self._settle(lease_id, task_id, FAILED, str(error)[:500])
+
+    def release(self, lease_id, task_ids, delay=0.0):
+        for task_id in task_ids:
+            self._settle(lease_id, task_id, READY, available_at=time.time() + delay)
+
+    def end_lease(self, lease_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET state = ?, lease_id = NULL, updated_at = ? WHERE lease_id = ? AND state = ?",
+                (READY, time.time(), lease_id, LEASED)
+            )
+            self._conn.execute("DELETE FROM leases WHERE lease_id = ?", (lease_id,))
+
+    def stats(self):
+        counts = {READY: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update({row["state"]: row["n"] for row in self._execute("SELECT state, COUNT(*) AS n FROM tasks GROUP BY state")})
+        counts["leases"] = self._execute("SELECT COUNT(*) AS n FROM leases")[0]["n"]
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class FileBroker(Broker):
+    """
+    Broker in a directory (one JSON file per task), for a disk several machines mount:
+
+        ready/<group>/<task_id>.json    waiting; one group per (site, credentials ref, options)
+        leased/<lease_id>/<task_id>.json
+        leases/<lease_id>.json          worker, site and expiry of each lease
+        done/, failed/
+
+    Every change happens under a lock file, so the lease/requeue logic stays simple.
+    """
+    # A lock file older than this was left behind by a crashed process
+    LOCK_STALE_AFTER = 30.0
+
+    def __init__(self, root):
+        self.root = root
+        for name in ("ready", "leased", "leases", DONE, FAILED):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+        self._lock_path = os.path.join(root, ".lock")
+        self._thread_lock = threading.Lock()
+
+    def _locked(self):
+        broker = self
+
+        class _Lock:
+            def __enter__(self):
+                broker._thread_lock.acquire()
+                while True:
+                    try:
+                        os.close(os.open(broker._lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                        return
+                    except FileExistsError:
+                        try:
+                            if time.time() - os.path.getmtime(broker._lock_path) > broker.LOCK_STALE_AFTER:
+                                os.remove(broker._lock_path)
+                                continue
+                        except OSError:
+                            continue
+                        time.sleep(0.01)
+
+            def __exit__(self, *exc):
+                try:
+                    os.remove(broker._lock_path)
+                finally:
+                    broker._thread_lock.release()
+
+        return _Lock()
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    @staticmethod
+    def _read(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _move(self, source, target, **changes):
+        data = self._read(source)
+        data.update(changes, updated_at=time.time())
+        self._write(target, data)
+        os.remove(source)
+
+    def _exists(self, task_id):
+        name = f"{task_id}.json"
+        return (os.path.exists(self._path(DONE, name)) or os.path.exists(self._path(FAILED, name))
+                or bool(glob.glob(self._path("ready", "*", name))) or bool(glob.glob(self._path("leased", "*", name))))
+
+    def publish(self, urls, site_url, credentials_ref, options=None):
+        options = options or {}
+        group = hashlib.sha1(json.dumps([site_url, credentials_ref, options], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        os.makedirs(self._path("ready", group), exist_ok=True)
+        now = time.time()
+        added = 0
+        with self._locked():
+            for url in urls:
+                task_id = task_id_for(url, site_url)
+                if self._exists(task_id):
+                    continue
+                self._write(self._path("ready", group, f"{task_id}.json"), {
+                    "task_id": task_id, "url": url, "site_url": site_url, "credentials_ref": credentials_ref,
+                    "options": options, "attempts": 0, "available_at": 0, "error": None,
+                    "created_at": now, "updated_at": now,
+                })
+                added += 1
+        return added
+
+    def _requeue_expired(self, now):
+        requeued = 0
+        for lease_path in glob.glob(self._path("leases", "*.json")):
+            lease = self._read(lease_path)
+            if lease["expires_at"] >= now:
+                continue
+            lease_dir = self._path("leased", lease["lease_id"])
+            for task_path in glob.glob(os.path.join(lease_dir, "*.json")):
+                task = self._read(task_path)
+                attempts = task["attempts"] + 1
+                name = os.path.basename(task_path)
+                if attempts >= MAX_LEASE_ATTEMPTS:
+                    self._move(task_path, self._path(FAILED, name), attempts=attempts, error="lease expired too often")
+                else:
+                    self._move(task_path, self._path("ready", lease["group"], name), attempts=attempts)
+                requeued += 1
+            shutil.rmtree(lease_dir, ignore_errors=True)
+            os.remove(lease_path)
+        return requeued
+
+    def requeue_expired(self):
+        with self._locked():
+            return self._requeue_expired(time.time())
+
+    def lease(self, worker, limit=LEASE_SIZE, ttl=LEASE_TTL):
+        now = time.time()
+        with self._locked():
+            self._requeue_expired(now)
+            busy = {self._read(path)["site_url"] for path in glob.glob(self._path("leases", "*.json"))}
+            for group_dir in sorted(glob.glob(self._path("ready", "*")), key=os.path.getmtime):
+                task_paths = sorted(glob.glob(os.path.join(group_dir, "*.json")))
+                # Every task of a group is for the same site
+                if not task_paths or self._read(task_paths[0])["site_url"] in busy:
+                    continue
+                ready = []
+                for task_path in task_paths:
+                    task = self._read(task_path)
+                    if task["available_at"] <= now:
+                        ready.append((task_path, task))
+                        if len(ready) >= limit:
+                            break
+                if not ready:
+                    continue
+
+                lease_id = uuid.uuid4().hex[:16]
+                os.makedirs(self._path("leased", lease_id))
+                tasks = []
+                for task_path, task in ready:
+                    self._move(task_path, self._path("leased", lease_id, os.path.basename(task_path)))
+                    tasks.append(Task(task["task_id"], task["url"], task["site_url"], task["credentials_ref"],
+                                      task["options"], task["attempts"], lease_id))
+                self._write(self._path("leases", f"{lease_id}.json"), {
+                    "lease_id": lease_id, "worker": worker, "site_url": tasks[0].site_url,
+                    "group": os.path.basename(group_dir), "expires_at": now + ttl,
+                })
+                return tasks
+        return []
+
+    def heartbeat(self, lease_id, ttl=LEASE_TTL):
+        path = self._path("leases", f"{lease_id}.json")
+        with self._locked():
+            if not os.path.exists(path):
+                return False
+            lease = self._read(path)
+            lease["expires_at"] = time.time() + ttl
+            self._write(path, lease)
+            return True
+
+    def _settle(self, lease_id, task_id, target, **changes):
+        source = self._path("leased", lease_id, f"{task_id}.json")
+        with self._locked():
+            if os.path.exists(source):
+                if target == "ready":
+                    group = self._read(self._path("leases", f"{lease_id}.json"))["group"]
+                    self._move(source, self._path("ready", group, f"{task_id}.json"), **changes)
+                else:
+                    self._move(source, self._path(target, f"{task_id}.json"), **changes)
+
+    def ack(self, lease_id, task_id):
+        self._settle(lease_id, task_id, DONE)
+
+    def fail(self, lease_id, task_id, error):
+        self._settle(lease_id, task_id, FAILED, error=str(error)[:500])
+
+    def release(self, lease_id, task_ids, delay=0.0):
+        for task_id in task_ids:
+            self._settle(lease_id, task_id, "ready", available_at=time.time() + delay)
+
+    def end_lease(self, lease_id):
+        lease_path = self._path("leases", f"{lease_id}.json")
+        with self._locked():
+            if not os.path.exists(lease_path):
+                return
+            group = self._read(lease_path)["group"]
+            lease_dir = self._path("leased", lease_id)
+            for task_path in glob.glob(os.path.join(lease_dir, "*.json")):
+                self._move(task_path, self._path("ready", group, os.path.basename(task_path)))
+            shutil.rmtree(lease_dir, ignore_errors=True)
+            os.remove(lease_path)
+
+    def stats(self):
+        return {
+            READY: len(glob.glob(self._path("ready", "*", "*.json"))),
+            LEASED: len(glob.glob(self._path("leased", "*", "*.json"))),
+            DONE: len(glob.glob(self._path(DONE, "*.json"))),
+            FAILED: len(glob.glob(self._path(FAILED, "*.json"))),
+            "leases": len(glob.glob(self._path("leases", "*.json"))),
+        }
+
+# Broker classes by URL scheme; register others (redis:, amqp:, ...) here
+BROKERS = {"sqlite": SqliteBroker, "file": FileBroker}
+
+def open_broker(url=BROKER_URL):
+    """
+    Broker for "sqlite:///path/broker.db", "sqlite:broker.db" or "file:///path/to/queue".
+    """
+    scheme, _, location = url.partition(":")
+    if scheme not in BROKERS:
+        raise ValueError(f"Unknown broker {url!r}, expected one of: {', '.join(f'{name}:' for name in BROKERS)}")
+    if location.startswith("//"):
+        location = location[2:]
+    return BROKERS[scheme](location)
+
+def main(argv=None):
+    import ingest  # only the publish command reads link files
+
+    parser = argparse.ArgumentParser(prog="python broker.py", description="Publish and watch tasks for distributed workers")
+    parser.add_argument("--broker", default=BROKER_URL, help="broker URL (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    publish = commands.add_parser("publish", help="queue a TXT/CSV/sitemap file of links for some sites")
+    publish.add_argument("source", help="file path or http(s) URL of the list")
+    publish.add_argument("--site", action="append", required=True, help="site URL to submit to (repeatable)")
+    publish.add_argument("--credentials", default="env:BOOKMARK",
+                         help="credentials ref the workers resolve, env:NAME or file:/path.json#key (default: %(default)s)")
+    publish.add_argument("--options", default="{}", help="JSON run_batch_submission options, e.g. '{\"max_pages_per_site\": 2}'")
+    commands.add_parser("status", help="task counts by state")
+    commands.add_parser("requeue", help="requeue the tasks of expired leases now")
+    args = parser.parse_args(argv)
+
+    broker = open_broker(args.broker)
+    try:
+        if args.command == "publish":
+            stats = ingest.IngestStats()
+            options = json.loads(args.options)
+            added = 0
+            for chunk in ingest.pipeline(args.source, stats):
+                stats.queued += len(chunk)
+                stats.chunks += 1
+                for site in args.site:
+                    added += broker.publish(chunk, site, args.credentials, options)
+            print(f"📤 Published {added} tasks ({stats})")
+        elif args.command == "requeue":
+            print(f"♻️ Requeued {broker.requeue_expired()} tasks")
+        print(f"📊 {broker.stats()}")
+    finally:
+        broker.close()
+
+if __name__ == "__main__":
+    main()
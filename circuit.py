@@ -0,0 +1,130 @@
+import threading
+import time
+
+# Breaker states
+CLOSED = "closed"        # normal operation
+OPEN = "open"            # failing; nothing is sent until the cooldown is over
+HALF_OPEN = "half_open"  # cooldown over; a single probe submission is in flight
+
+# site_profiles.json "circuit_breaker" overrides these per site
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 60.0
+DEFAULT_MAX_COOLDOWN = 15 * 60.0
+
+# A probe not reported back within this long is taken as lost and the next caller probes again
+DEFAULT_PROBE_TIMEOUT = 5 * 60.0
+
+class CircuitBreaker:
+    """
+    Per-site breaker: opens after `failure_threshold` consecutive failures at the same step
+    (a dead site fails at goto_submit, changed markup at one selector), then lets a single
+    probe through once `cooldown` has passed. A failed probe reopens it with twice the cooldown;
+    a probe handed back unused (release_probe) or lost for `probe_timeout` frees the slot again.
+    """
+    def __init__(self, key, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN, max_cooldown=DEFAULT_MAX_COOLDOWN,
+                 probe_timeout=DEFAULT_PROBE_TIMEOUT):
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.failed_step = None
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        True when a submission may start. After the cooldown the first caller gets the probe.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if (self.state == OPEN and now - self.opened_at >= self.cooldown
+                    or self.state == HALF_OPEN and now - self.probe_started >= self.probe_timeout):
+                self.state = HALF_OPEN
+                self.probe_started = now
+                return True
+            return False
+
+    def release_probe(self):
+        """
+        Returns a probe that was never submitted: the breaker is open again with its cooldown
+        already over, so the next allow() hands out a new probe straight away.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+
+    def retry_in(self):
+        """
+        Seconds until the next probe is allowed (0 while one is in flight or when closed).
+        """
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.failed_step = None
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self, step):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                # The probe failed: back off harder
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self._open()
+                return
+            if step == self.failed_step:
+                self.failures += 1
+            else:
+                self.failed_step, self.failures = step, 1
+            if self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def describe(self):
+        if self.state == OPEN:
+            return f"open after {self.failures} failures at {self.failed_step}, probing in {self.retry_in():.0f}s"
+        if self.state == HALF_OPEN:
+            return "half-open, probing"
+        return "closed"
+
+class BreakerRegistry:
+    """
+    One CircuitBreaker per site key for the whole process, so a site that is down
+    stays skipped across batches until a probe gets through.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, key, **settings):
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(key, **settings)
+            return breaker
+
+    def states(self):
+        with self._lock:
+            return {key: breaker.state for key, breaker in self._breakers.items()}
+
+    def reset(self):
+        with self._lock:
+            self._breakers.clear()
+
+breakers = BreakerRegistry()
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+# Events kept in memory; older ones are dropped (a board that fell behind just skips them)
+BUFFER_SIZE = 20_000
+
+# How often the UI redraws the status table, whatever the event rate
+REFRESH_INTERVAL = 1.0
+
+# Event statuses
+SESSION = "session"    # a site run started; count = links in it
+STEP = "step"          # one step of the flow finished (ok) or raised (error)
+ERROR = "error"
+DONE = "done"
+FAILED = "failed"
+RETRY = "retry"
+DEFERRED = "deferred"  # count = links held back by the circuit breaker
+
+Event = namedtuple("Event", ["seq", "time", "batch_id", "site", "url", "step", "status", "duration", "count"])
+
+class EventBus:
+    """
+    Ring buffer of structured progress events. publish() never waits on a reader: the
+    bot's event loop appends and moves on, and readers poll since(seq) at their own pace.
+    """
+    def __init__(self, size=BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def publish(self, batch_id, site, status, url=None, step=None, duration=None, count=None):
+        with self._lock:
+            self._seq += 1
+            self._events.append(Event(self._seq, time.time(), batch_id, site, url, step, status, duration, count))
+
+    def since(self, seq, batch_id=None):
+        """
+        Events after seq (of one batch when batch_id is given), oldest first.
+        """
+        with self._lock:
+            if not self._events or self._events[-1].seq <= seq:
+                return []
+            start = max(0, len(self._events) - (self._events[-1].seq - seq))
+            events = [self._events[i] for i in range(start, len(self._events))]
+        return [event for event in events if batch_id is None or event.batch_id == batch_id]
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+class SiteBoard:
+    """
+    Per-site status of one batch, folded from bus events: counts, current step, links
+    per minute and ETA. Meant for the UI thread; call update() before rows().
+    """
+    def __init__(self, bus, batch_id=None, since=None):
+        self.bus = bus
+        self.batch_id = batch_id
+        self.cursor = bus.last_seq if since is None else since
+        self.sites = {}
+
+    def _site(self, name, at):
+        return self.sites.setdefault(name, {
+            "total": 0, DONE: 0, FAILED: 0, RETRY: 0, DEFERRED: 0,
+            "step": "", "first": at, "last": at,
+        })
+
+    def update(self):
+        events = self.bus.since(self.cursor, self.batch_id)
+        if events:
+            self.cursor = events[-1].seq
+        for event in events:
+            site = self._site(event.site, event.time)
+            site["last"] = event.time
+            if event.status == SESSION:
+                site["total"] += event.count or 0
+            elif event.status in (STEP, ERROR):
+                site["step"] = event.step if event.status == STEP else f"{event.step} ⚠️"
+            elif event.status == DEFERRED:
+                site[DEFERRED] += event.count or 0
+            else:
+                site[event.status] += 1
+        return len(events)
+
+    def rows(self):
+        rows = []
+        now = time.time()
+        for name, site in sorted(self.sites.items()):
+            left = max(0, site["total"] - site[DONE] - site[FAILED] - site[DEFERRED])
+            elapsed = (now if left else site["last"]) - site["first"]
+            per_minute = site[DONE] / elapsed * 60 if elapsed > 0 and site[DONE] else 0.0
+            if not left:
+                eta = "done"
+            elif per_minute:
+                eta = _duration(left / per_minute * 60)
+            else:
+                eta = "…"
+            rows.append({
+                "Site": name,
+                "Done": site[DONE],
+                "Failed": site[FAILED],
+                "Retries": site[RETRY],
+                "Deferred": site[DEFERRED],
+                "Left": left,
+                "Now": site["step"] if left else "",
+                "Links/min": round(per_minute, 1),
+                "ETA": eta,
+            })
+        return rows
+
+    def totals(self):
+        """
+        (finished, total) over every site, for a progress bar.
+        """
+        total = sum(site["total"] for site in self.sites.values())
+        finished = sum(site[DONE] + site[FAILED] + site[DEFERRED] for site in self.sites.values())
+        return min(finished, total), total
+
+def _duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+# Process-wide bus every batch publishes to (filtered by batch_id on the way out)
+bus = EventBus()
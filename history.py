@@ -0,0 +1,58 @@
+import os
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from; they never change the page
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "twclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "ref", "ref_src", "spm",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hsa_")
+
+# A link already submitted to a site is skipped for this many days (site_profiles "resubmit_after_days"
+# overrides it per site; null there means never resubmit)
+RESUBMIT_AFTER_DAYS = float(os.getenv("BOOKMARK_RESUBMIT_AFTER_DAYS", "30"))
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def normalize_url(url):
+    """
+    History key for a link: no scheme (http and https count as one), lowercase host without
+    default port, no trailing slash, fragment or tracking parameters, remaining parameters sorted.
+    "HTTPS://Example.com:443/a/?utm_source=x&b=2&a=1#top" -> "example.com/a?a=1&b=2"
+    A link that does not parse (bad port, broken IPv6 host) is its own key, stripped.
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        port = parts.port
+    except ValueError:
+        return url
+    host = (parts.hostname or "").lower()
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip("/")
+    query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not _is_tracking(name)))
+    return urlunsplit(("", host, path, query, "")).lstrip("/")
+
+def unique(urls):
+    """
+    The links without repeats (same normalized key), first occurrence kept, order preserved.
+    """
+    seen = set()
+    kept = []
+    for url in urls:
+        key = normalize_url(url)
+        if key not in seen:
+            seen.add(key)
+            kept.append(url)
+    return kept
+
+def resubmit_after(profile):
+    """
+    Seconds after which a link may be submitted to this site again; None for never.
+    """
+    days = profile.resubmit_after_days
+    return None if days is None else days * 24 * 3600
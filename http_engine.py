@@ -0,0 +1,229 @@
+import json
+import re
+from contextlib import asynccontextmanager
+from html.parser import HTMLParser
+from urllib.parse import unquote
+import retry
+
+try:
+    import httpx  # optional; only needed for sites with "engine": "http"
+except ImportError:
+    httpx = None
+
+# Landing on a URL containing this means the site sent us back to log in
+LOGIN_MARKER = "login"
+
+# Bot checks only a real browser can get through
+CHALLENGE_MARKERS = ("cf-chl", "challenge-platform", "cf_chl_opt", "Just a moment...", "Checking your browser")
+
+class ChallengeDetected(Exception):
+    """
+    The site answered with a bot check; the browser engine has to take over.
+    """
+    def __init__(self, message, step=None):
+        super().__init__(message)
+        self.step = step
+
+def available():
+    return httpx is not None
+
+class _FieldParser(HTMLParser):
+    """
+    Collects form field values (<input>, <textarea>, selected <option>) and <meta> contents by name.
+    """
+    def __init__(self):
+        super().__init__()
+        self.fields = {}
+        self._textarea = None
+        self._select = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        name = attrs.get("name")
+        if tag == "input" and name:
+            self.fields.setdefault(name, attrs.get("value") or "")
+        elif tag == "meta" and name and "content" in attrs:
+            self.fields.setdefault(name, attrs["content"])
+        elif tag == "textarea" and name:
+            self._textarea = name
+            self.fields.setdefault(name, "")
+        elif tag == "select":
+            self._select = name
+        elif tag == "option" and self._select and "selected" in attrs:
+            self.fields[self._select] = attrs.get("value", "")
+
+    def handle_endtag(self, tag):
+        if tag == "textarea":
+            self._textarea = None
+        elif tag == "select":
+            self._select = None
+
+    def handle_data(self, data):
+        if self._textarea:
+            self.fields[self._textarea] += data
+
+def form_fields(text):
+    """
+    {name: value} of the form fields and meta tags of an HTML page (CSRF tokens included).
+    """
+    parser = _FieldParser()
+    try:
+        parser.feed(text)
+        parser.close()
+    except Exception:
+        pass
+    return parser.fields
+
+def extract(spec, response, fields):
+    """
+    One value from a response. spec is a field/meta name ("_token", "csrf-token"),
+    "re:<pattern>" (first group), "json:<dotted.path>" or "cookie:<name>" (set by this response).
+    """
+    if spec.startswith("cookie:"):
+        value = response.cookies.get(spec[7:])
+        return unquote(value) if value is not None else None
+    if spec.startswith("re:"):
+        match = re.search(spec[3:], response.text)
+        return match.group(1) if match else None
+    if spec.startswith("json:"):
+        try:
+            value = response.json()
+            for part in spec[5:].split("."):
+                value = value[int(part)] if isinstance(value, list) else value[part]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+        return value if isinstance(value, str) else json.dumps(value)
+    return fields.get(spec)
+
+def render(template, values):
+    """
+    Fills str.format placeholders in a (nested) request template.
+    """
+    if isinstance(template, str):
+        return template.format(**values)
+    if isinstance(template, dict):
+        return {key: render(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [render(value, values) for value in template]
+    return template
+
+def is_challenge(response):
+    if response.status_code in (403, 503):
+        headers = response.headers
+        if "cf-mitigated" in headers or "cloudflare" in headers.get("server", "").lower():
+            return True
+    if "html" in response.headers.get("content-type", ""):
+        head = response.text[:20000]
+        return any(marker in head for marker in CHALLENGE_MARKERS)
+    return False
+
+class HttpSiteEngine:
+    """
+    Replays a site's login and submit flows as plain HTTP requests - one pooled client
+    with a cookie jar per site session - instead of driving a page.
+
+    The flows come from the profile's "http_flow" (see record.py for deriving one):
+        {"login": [request, ...], "submit": [request, ...]}
+    where a request is
+        {"name": "check_url", "method": "POST", "path": "/submit",
+         "params": {...}, "form": {...}, "json": {...}, "headers": {...},
+         "extract": {"csrf": "_token"}, "expect_status": [200], "expect_text": "...",
+         "fail_if_url_contains": "login", "fail_as": "form_not_revealed"}
+    fail_as is the retry failure class for unmet expectations (default "other").
+    Strings are str.format templates over {username} {password} / {url} {title}
+    {description} {tags} {category} plus everything extracted by earlier requests.
+    """
+    def __init__(self, profile, site_url, user_agent, max_connections=4, timeout=30.0):
+        if httpx is None:
+            raise RuntimeError("The HTTP engine needs httpx (pip install httpx)")
+        self.profile = profile
+        self.flows = profile.http_flow
+        self.client = httpx.AsyncClient(
+            base_url=site_url.rstrip('/'),
+            headers={"User-Agent": user_agent},
+            follow_redirects=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def log_in(self, credentials, session=None):
+        await self.run("login", credentials, session)
+
+    async def submit(self, values, session=None, target_url=None):
+        return await self.run("submit", values, session, target_url)
+
+    @asynccontextmanager
+    async def _step(self, name, session, target_url):
+        if session is None:
+            yield
+        else:
+            async with session.step(name, target_url):
+                yield
+
+    async def run(self, flow_name, values, session=None, target_url=None):
+        """
+        Sends every request of a flow in order; returns the values (with extracted fields).
+        Raises retry.SubmissionError for classified failures and ChallengeDetected for bot checks.
+        """
+        values = dict(values)
+        requests = self.flows[flow_name]
+        for index, request in enumerate(requests):
+            method = request.get("method", "GET").upper()
+            name = request.get("name") or f"{flow_name}_{index + 1}"
+            step = f"http_{name}"
+
+            # Pacing applies to what the site treats as actions, not to page loads
+            if session is not None and request.get("paced", method != "GET"):
+                await session.pace(target_url)
+
+            async with self._step(step, session, target_url):
+                response = await self._send(step, method, request, values)
+            self._check(step, request, response, flow_name, is_last=index == len(requests) - 1)
+
+            specs = request.get("extract", {})
+            fields = form_fields(response.text) if specs else {}
+            for key, spec in specs.items():
+                value = extract(spec, response, fields)
+                if value is None:
+                    raise retry.SubmissionError(
+                        request.get("fail_as", retry.OTHER), f"{step}: no {spec!r} in the response", step
+                    )
+                values[key] = value
+        return values
+
+    async def _send(self, step, method, request, values):
+        try:
+            return await self.client.request(
+                method,
+                render(request.get("path", "/"), values),
+                params=render(request.get("params"), values),
+                data=render(request.get("form"), values),
+                json=render(request.get("json"), values),
+                headers=render(request.get("headers"), values),
+            )
+        except httpx.TimeoutException as e:
+            raise retry.SubmissionError(retry.TIMEOUT, f"{step}: {type(e).__name__}", step)
+        except httpx.TransportError as e:
+            raise retry.SubmissionError(retry.SITE_DOWN, f"{step}: {e}", step)
+
+    def _check(self, step, request, response, flow_name, is_last):
+        if is_challenge(response):
+            raise ChallengeDetected(f"Bot check at {step} (HTTP {response.status_code})", step)
+
+        # Submit requests (and the final login request) must not end on the login page
+        default_marker = LOGIN_MARKER if flow_name != "login" or is_last else None
+        marker = request.get("fail_if_url_contains", default_marker)
+        if marker and marker in response.url.path:
+            raise retry.SubmissionError(retry.SESSION_LOST, f"{step}: redirected to {response.url.path}", step)
+
+        if response.status_code >= 500:
+            raise retry.SubmissionError(retry.SITE_DOWN, f"{step}: HTTP {response.status_code}", step)
+        kind = request.get("fail_as", retry.OTHER)
+        expected = request.get("expect_status")
+        if expected and response.status_code not in expected:
+            raise retry.SubmissionError(kind, f"{step}: HTTP {response.status_code}", step)
+        if request.get("expect_text") and request["expect_text"] not in response.text:
+            raise retry.SubmissionError(kind, f"{step}: {request['expect_text']!r} not in the response", step)
+
+    async def close(self):
+        await self.client.aclose()
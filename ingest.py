@@ -0,0 +1,293 @@
+"""
+Streams links from large files into the job store, chunk by chunk.
+
+    python ingest.py links.csv.gz --site https://www.abookmarking.com --username me --password secret
+    python ingest.py https://example.com/sitemap.xml --site ... --dry-run
+
+TXT (one link per line), CSV (a url/link/loc column, or the first cell that looks like a link)
+and sitemap XML (sitemap indexes are followed) are read as streams, gzipped or not. Links go
+through a generator pipeline (read -> validate -> dedupe -> chunk) and each chunk is added to
+an "ingesting" batch right away, so workers start submitting long before the file is read.
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import itertools
+import os
+import sys
+import xml.etree.ElementTree as ET
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+import history
+import job_store as jobs
+
+# Links written to the job store per transaction
+CHUNK_SIZE = 1000
+
+# CSV header names that hold the link
+URL_COLUMNS = ("url", "link", "loc", "href", "address")
+
+# Nested sitemap indexes are followed this deep
+MAX_SITEMAP_DEPTH = 3
+
+FORMATS = ("txt", "csv", "sitemap")
+
+class IngestStats:
+    """
+    Running counts of one ingestion.
+    """
+    def __init__(self):
+        self.read = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.queued = 0
+        self.chunks = 0
+
+    def __str__(self):
+        return (f"{self.queued} links queued in {self.chunks} chunks "
+                f"({self.read} read, {self.invalid} invalid, {self.duplicates} duplicates)")
+
+def open_source(source):
+    """
+    Binary stream for a path, an http(s) URL or an open binary file; gzip is unpacked on the fly.
+    """
+    if hasattr(source, "read"):
+        stream = source
+    elif source.startswith(("http://", "https://")):
+        stream = urlopen(Request(source, headers={"User-Agent": "Mozilla/5.0 (bookmark ingest)"}), timeout=60)
+    else:
+        stream = open(source, "rb")
+    stream = io.BufferedReader(stream) if not hasattr(stream, "peek") else stream
+    if stream.peek(2)[:2] == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+def _name(source):
+    name = getattr(source, "name", source if isinstance(source, str) else "")
+    name = urlsplit(name).path if "://" in str(name) else str(name)
+    return name.lower()[:-3] if name.lower().endswith(".gz") else name.lower()
+
+def detect_format(source, stream):
+    """
+    "txt", "csv" or "sitemap", from the file name or else the first bytes.
+    """
+    name = _name(source)
+    for extension, fmt in ((".xml", "sitemap"), (".csv", "csv"), (".txt", "txt")):
+        if name.endswith(extension):
+            return fmt
+    head = stream.peek(2048)[:2048].lstrip().lower() if hasattr(stream, "peek") else b""
+    if head.startswith(b"<?xml") or head.startswith((b"<urlset", b"<sitemapindex")):
+        return "sitemap"
+    first_line = head.split(b"\n", 1)[0]
+    return "csv" if b"," in first_line or b";" in first_line else "txt"
+
+def _text(stream):
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+
+def iter_txt(stream):
+    for line in _text(stream):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+def _looks_like_url(value):
+    return value.startswith(("http://", "https://", "www."))
+
+def iter_csv(stream, column=None):
+    """
+    Links from one column: `column` (name or index), a header named like URL_COLUMNS,
+    or else the first cell of each row that looks like a link.
+    """
+    text = _text(stream)
+    sample = text.buffer.peek(4096)[:4096].decode("utf-8", "replace") if hasattr(text.buffer, "peek") else ""
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    rows = csv.reader(text, dialect)
+    first = next(rows, None)
+    if first is None:
+        return
+
+    index = column if isinstance(column, int) else None
+    header = [cell.strip().lower() for cell in first]
+    if isinstance(column, str):
+        index = header.index(column.lower()) if column.lower() in header else None
+    if index is None:
+        index = next((header.index(name) for name in URL_COLUMNS if name in header), None)
+    if index is None:
+        # No header row: the first row is data
+        rows = itertools.chain([first], rows)
+
+    for row in rows:
+        if index is not None:
+            value = row[index].strip() if index < len(row) else ""
+        else:
+            value = next((cell.strip() for cell in row if _looks_like_url(cell.strip())), "")
+        if value:
+            yield value
+
+def iter_sitemap(stream, depth=0):
+    """
+    <loc> entries of a sitemap, following the child sitemaps of a sitemap index.
+    Parsed incrementally; finished elements are dropped as soon as they are read.
+    """
+    root = None
+    for event, element in ET.iterparse(stream, events=("start", "end")):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if event == "start":
+            if root is None:
+                root = element
+            continue
+        if tag == "loc" and element.text:
+            loc = element.text.strip()
+            if root.tag.endswith("sitemapindex"):
+                if depth < MAX_SITEMAP_DEPTH:
+                    with open_source(loc) as child:
+                        yield from iter_sitemap(child, depth + 1)
+            else:
+                yield loc
+        elif tag in ("url", "sitemap"):
+            element.clear()
+            root.clear()
+
+def iter_urls(source, fmt=None, column=None):
+    """
+    Raw links from a file, URL or binary stream, without reading it all at once.
+    """
+    stream = open_source(source)
+    try:
+        fmt = fmt or detect_format(source, stream)
+        if fmt == "sitemap":
+            yield from iter_sitemap(stream)
+        elif fmt == "csv":
+            yield from iter_csv(stream, column)
+        else:
+            yield from iter_txt(stream)
+    finally:
+        stream.close()
+
+def valid_urls(urls, stats):
+    """
+    Only well-formed http(s) links; bare "www.example.com/..." gets https://.
+    A line urlsplit cannot parse (bad port, broken IPv6 host) is counted as invalid.
+    """
+    for url in urls:
+        stats.read += 1
+        url = url.strip().strip('"\'<>')
+        if url.startswith("www."):
+            url = f"https://{url}"
+        try:
+            parts = urlsplit(url)
+            # Raises for a port that is not a number or out of range
+            parts.port
+        except ValueError:
+            stats.invalid += 1
+            continue
+        if parts.scheme not in ("http", "https") or not parts.hostname or any(c.isspace() for c in url):
+            stats.invalid += 1
+            continue
+        yield url
+
+def unique_urls(urls, stats):
+    """
+    Drops repeats (same history.normalize_url key). Only a 64-bit digest per distinct link
+    is kept (well under 100 bytes each), not the links themselves.
+    """
+    seen = set()
+    for url in urls:
+        digest = int.from_bytes(hashlib.blake2b(history.normalize_url(url).encode("utf-8"), digest_size=8).digest(), "big")
+        if digest in seen:
+            stats.duplicates += 1
+            continue
+        seen.add(digest)
+        yield url
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def pipeline(source, stats, fmt=None, column=None, chunk_size=CHUNK_SIZE):
+    """
+    Chunks of valid, distinct links from a source.
+    """
+    return chunked(unique_urls(valid_urls(iter_urls(source, fmt, column), stats), stats), chunk_size)
+
+def source_batch_id(source, site_urls):
+    """
+    Batch id for a file: the same file (path, size, mtime) to the same sites resumes the batch.
+    """
+    if isinstance(source, str) and os.path.exists(source):
+        info = os.stat(source)
+        identity = f"file:{os.path.abspath(source)}:{info.st_size}:{info.st_mtime}"
+    else:
+        identity = f"source:{getattr(source, 'name', source)}:{getattr(source, 'size', '')}"
+    return jobs.batch_id_for([identity], site_urls)
+
+def ingest(source, store, site_configs, batch_id=None, options=None, fmt=None, column=None, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """
+    Streams a source into a queued batch of the job store and returns (batch_id, stats).
+    The batch stays "ingesting" (claimable, but never finished) until the last chunk is in.
+    on_chunk(stats) is called after every chunk; a cancelled batch stops the ingestion.
+    """
+    site_urls = [site['url'] for site in site_configs]
+    batch_id = batch_id or source_batch_id(source, site_urls)
+    stats = IngestStats()
+    store.enqueue_batch([], site_configs, options, batch_id, state=jobs.INGESTING)
+    try:
+        for chunk in pipeline(source, stats, fmt, column, chunk_size):
+            if store.is_cancelled(batch_id):
+                print(f"🛑 Batch {batch_id} cancelled, ingestion stopped")
+                break
+            store.add_tasks(batch_id, chunk, site_urls)
+            stats.queued += len(chunk)
+            stats.chunks += 1
+            if on_chunk:
+                on_chunk(stats)
+    finally:
+        store.end_ingest(batch_id)
+    return batch_id, stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python ingest.py", description="Queue links from a TXT/CSV/sitemap file (gzip ok) for the workers")
+    parser.add_argument("source", help="file path or http(s) URL of the list")
+    parser.add_argument("--format", choices=FORMATS, help="override the detected format")
+    parser.add_argument("--column", help="CSV column holding the links")
+    parser.add_argument("--site", action="append", default=[], help="site URL to submit to (repeatable)")
+    parser.add_argument("--username", default=os.getenv("BOOKMARK_USER"))
+    parser.add_argument("--password", default=os.getenv("BOOKMARK_PASS"))
+    parser.add_argument("--db", default=jobs.JOBS_DB_PATH, help="job database path (default: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only count the links")
+    args = parser.parse_args(argv)
+    column = int(args.column) if args.column and args.column.isdigit() else args.column
+
+    if args.dry_run:
+        stats = IngestStats()
+        for chunk in pipeline(args.source, stats, args.format, column, args.chunk_size):
+            stats.queued += len(chunk)
+            stats.chunks += 1
+        print(f"📄 {stats}")
+        return
+    if not args.site or not args.username or not args.password:
+        parser.error("--site, --username and --password (or BOOKMARK_USER/BOOKMARK_PASS) are required")
+
+    site_configs = [{"url": site, "username": args.username, "password": args.password} for site in args.site]
+    store = jobs.JobStore(args.db)
+    try:
+        def report(stats):
+            print(f"📥 {stats}", file=sys.stderr)
+        batch_id, stats = ingest(args.source, store, site_configs, fmt=args.format, column=column,
+                                 chunk_size=args.chunk_size, on_chunk=report)
+        print(f"✅ Batch {batch_id}: {stats}. Start `python -m bot worker` to submit them.")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import history
+import site_profiles
+
+# One row per (batch, URL, site) task; survives browser-tab closes and process restarts
+JOBS_DB_PATH = os.getenv("BOOKMARK_JOBS_DB", os.path.join(os.getcwd(), "bookmark_jobs.db"))
+
+# Task states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+DEFERRED = "deferred"  # held back while the site's circuit breaker was open
+SKIPPED = "skipped"    # already submitted to the site recently (see history.py)
+
+# Batch states (RUNNING is shared with tasks)
+QUEUED = "queued"
+INGESTING = "ingesting"  # links still streaming in from a file (ingest.py); workers already start on it
+FINISHED = "finished"
+CANCELLED = "cancelled"
+
+# A worker that has not touched its claim for this long is presumed dead
+CLAIM_STALE_AFTER = 10 * 60
+
+# Deferred tasks become claimable by workers again after this long
+DEFERRED_RETRY_AFTER = 10 * 60
+
+# Links a worker takes per claim of a site; the rest stays pending for its next claim
+WORK_CHUNK = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'running'
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    site_url TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (batch_id, url, site_url)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_batch_site_status ON tasks (batch_id, site_url, status);
+CREATE TABLE IF NOT EXISTS claims (
+    batch_id TEXT NOT NULL,
+    site_url TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    claimed_at REAL NOT NULL,
+    PRIMARY KEY (batch_id, site_url)
+);
+CREATE TABLE IF NOT EXISTS history (
+    url_key TEXT NOT NULL,
+    site_key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    batch_id TEXT,
+    submitted_at REAL NOT NULL,
+    PRIMARY KEY (url_key, site_key)
+);
+"""
+
+def batch_id_for(urls, site_urls):
+    """
+    Deterministic id, so submitting the same links to the same sites again resumes the batch.
+    """
+    digest = hashlib.sha1()
+    for item in sorted(set(site_urls)) + ["|"] + sorted(set(urls)):
+        digest.update(item.encode("utf-8") + b"\n")
+    return digest.hexdigest()[:16]
+
+class JobStore:
+    """
+    SQLite (WAL mode) store of submission tasks with status, attempts and timestamps.
+    """
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        # Databases created before batches had a state column
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(batches)")}
+        if "state" not in columns:
+            self._conn.execute("ALTER TABLE batches ADD COLUMN state TEXT NOT NULL DEFAULT 'running'")
+
+        # Databases created before the history index: seed it from the tasks already done
+        if self._conn.execute("SELECT 1 FROM history LIMIT 1").fetchone() is None:
+            rows = self._conn.execute(
+                "SELECT url, site_url, batch_id, updated_at FROM tasks WHERE status = ?", (DONE,)
+            ).fetchall()
+            self._conn.executemany(
+                "INSERT INTO history (url_key, site_key, url, batch_id, submitted_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (url_key, site_key) DO UPDATE SET submitted_at = MAX(submitted_at, excluded.submitted_at)",
+                ((history.normalize_url(row["url"]), site_profiles.site_key(row["site_url"]), row["url"], row["batch_id"], row["updated_at"])
+                 for row in rows)
+            )
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def create_batch(self, urls, site_urls, batch_id=None, options=None, state=RUNNING):
+        """
+        Registers every (URL, site) task. Existing tasks keep their status, so calling
+        this again for an interrupted batch only adds what is missing. A finished batch
+        created again is a new run of the same links: its tasks go back to pending, and
+        skip_submitted() decides from the history which of them are still recent.
+        """
+        batch_id = batch_id or batch_id_for(urls, site_urls)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, last_error = NULL, updated_at = ? WHERE batch_id = ? AND status IN (?, ?, ?) "
+                "AND EXISTS (SELECT 1 FROM batches WHERE batch_id = ? AND state = ?)",
+                (PENDING, now, batch_id, DONE, SKIPPED, FAILED, batch_id, FINISHED)
+            )
+            self._conn.execute(
+                "INSERT INTO batches (batch_id, created_at, options, state) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (batch_id) DO UPDATE SET state = excluded.state, "
+                "options = CASE WHEN excluded.options != '{}' THEN excluded.options ELSE batches.options END",
+                (batch_id, now, json.dumps(options or {}), state)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO tasks (batch_id, url, site_url, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                ((batch_id, url, site_url, now, now) for site_url in site_urls for url in urls)
+            )
+        return batch_id
+
+    def enqueue_batch(self, urls, site_configs, options=None, batch_id=None, state=QUEUED):
+        """
+        Queues a batch for a background worker (python -m bot worker). The site configs,
+        credentials included, are kept in the local database for the worker to use.
+        """
+        payload = {"site_configs": site_configs, "options": options or {}}
+        return self.create_batch(urls, [site['url'] for site in site_configs], batch_id, payload, state=state)
+
+    def add_tasks(self, batch_id, urls, site_urls):
+        """
+        Adds (URL, site) tasks to an existing batch, e.g. the next chunk of an ingested file.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO tasks (batch_id, url, site_url, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                ((batch_id, url, site_url, now, now) for site_url in site_urls for url in urls)
+            )
+
+    def end_ingest(self, batch_id):
+        """
+        All links of an ingesting batch are in: it can finish once its tasks are done.
+        """
+        self._execute("UPDATE batches SET state = ? WHERE batch_id = ? AND state = ?", (RUNNING, batch_id, INGESTING))
+        self.finish_if_complete(batch_id)
+
+    def batch_job(self, batch_id):
+        """
+        Returns (urls, site_configs, options) for a queued batch.
+        """
+        urls = [row["url"] for row in self._execute(
+            "SELECT url FROM tasks WHERE batch_id = ? GROUP BY url ORDER BY MIN(id)", (batch_id,)
+        )]
+        return (urls,) + self.batch_config(batch_id)
+
+    def batch_config(self, batch_id):
+        """
+        Returns (site_configs, options) for a queued batch, without loading its links.
+        """
+        rows = self._execute("SELECT options FROM batches WHERE batch_id = ?", (batch_id,))
+        payload = json.loads(rows[0]["options"]) if rows else {}
+        return payload.get("site_configs", []), payload.get("options", {})
+
+    def claim_site(self, worker, stale_after=CLAIM_STALE_AFTER, deferred_after=DEFERRED_RETRY_AFTER):
+        """
+        Atomically hands one (batch_id, site_url) with open tasks to a worker, or returns None.
+        Different workers get different sites, so no login is ever done twice in parallel.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            # Take the write lock up front so two worker processes cannot claim the same site
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM claims WHERE claimed_at < ?", (now - stale_after,))
+            row = self._conn.execute(
+                "SELECT t.batch_id, t.site_url FROM tasks t JOIN batches b ON b.batch_id = t.batch_id "
+                "WHERE b.state IN (?, ?, ?) AND (t.status IN (?, ?) OR (t.status = ? AND t.updated_at < ?)) "
+                # Only enqueued batches carry the site configs a worker needs
+                "AND json_extract(b.options, '$.site_configs') IS NOT NULL "
+                "AND NOT EXISTS (SELECT 1 FROM claims c WHERE c.batch_id = t.batch_id AND c.site_url = t.site_url) "
+                "ORDER BY b.created_at, t.id LIMIT 1",
+                (QUEUED, RUNNING, INGESTING, PENDING, RUNNING, DEFERRED, now - deferred_after)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "INSERT INTO claims (batch_id, site_url, worker, claimed_at) VALUES (?, ?, ?, ?)",
+                (row["batch_id"], row["site_url"], worker, now)
+            )
+            self._conn.execute(
+                "UPDATE batches SET state = ? WHERE batch_id = ? AND state = ?", (RUNNING, row["batch_id"], QUEUED)
+            )
+            return row["batch_id"], row["site_url"]
+
+    def claim(self, batch_id, site_url, worker, stale_after=CLAIM_STALE_AFTER):
+        """
+        Claims a specific site of a batch. True if it is (now) ours, False if another worker holds it.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM claims WHERE claimed_at < ?", (now - stale_after,))
+            self._conn.execute(
+                "INSERT OR IGNORE INTO claims (batch_id, site_url, worker, claimed_at) VALUES (?, ?, ?, ?)",
+                (batch_id, site_url, worker, now)
+            )
+            row = self._conn.execute(
+                "SELECT worker FROM claims WHERE batch_id = ? AND site_url = ?", (batch_id, site_url)
+            ).fetchone()
+            return row["worker"] == worker
+
+    def touch_claim(self, batch_id, site_url):
+        self._execute(
+            "UPDATE claims SET claimed_at = ? WHERE batch_id = ? AND site_url = ?", (time.time(), batch_id, site_url)
+        )
+
+    def release_claim(self, batch_id, site_url):
+        self._execute("DELETE FROM claims WHERE batch_id = ? AND site_url = ?", (batch_id, site_url))
+
+    def cancel_batch(self, batch_id):
+        """
+        Stops a batch: workers and running submissions check this before each URL.
+        """
+        self._execute("UPDATE batches SET state = ? WHERE batch_id = ?", (CANCELLED, batch_id))
+
+    def delete_batch(self, batch_id):
+        """
+        Removes a batch with its tasks and claims. The submission history is kept.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tasks WHERE batch_id = ?", (batch_id,))
+            self._conn.execute("DELETE FROM claims WHERE batch_id = ?", (batch_id,))
+            self._conn.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+
+    def batch_state(self, batch_id):
+        rows = self._execute("SELECT state FROM batches WHERE batch_id = ?", (batch_id,))
+        return rows[0]["state"] if rows else None
+
+    def is_cancelled(self, batch_id):
+        return self.batch_state(batch_id) == CANCELLED
+
+    def finish_if_complete(self, batch_id):
+        """
+        Marks the batch finished once no site is claimed and no task is waiting.
+        """
+        self._execute(
+            "UPDATE batches SET state = ? WHERE batch_id = ? AND state IN (?, ?) "
+            "AND NOT EXISTS (SELECT 1 FROM claims WHERE batch_id = ?) "
+            "AND NOT EXISTS (SELECT 1 FROM tasks WHERE batch_id = ? AND status IN (?, ?, ?))",
+            (FINISHED, batch_id, QUEUED, RUNNING, batch_id, batch_id, PENDING, RUNNING, DEFERRED)
+        )
+
+    def recover(self, batch_id, site_url=None):
+        """
+        Tasks left 'running' by a crashed process go back to 'pending'.
+        Pass site_url when other workers may be busy with other sites of the batch.
+        """
+        sql = "UPDATE tasks SET status = ?, updated_at = ? WHERE batch_id = ? AND status = ?"
+        params = (PENDING, time.time(), batch_id, RUNNING)
+        if site_url is not None:
+            sql += " AND site_url = ?"
+            params += (site_url,)
+        self._execute(sql, params)
+
+    def pending_urls(self, batch_id, site_url, limit=None):
+        """
+        URLs for this site that still need work (anything not done or skipped), in insertion order.
+        With a limit only the first `limit` pending (then deferred) tasks are returned and
+        failed ones are left alone, so repeated chunked runs move through the batch.
+        """
+        if limit is None:
+            rows = self._execute(
+                "SELECT url FROM tasks WHERE batch_id = ? AND site_url = ? AND status NOT IN (?, ?) ORDER BY id",
+                (batch_id, site_url, DONE, SKIPPED)
+            )
+        else:
+            rows = self._execute(
+                "SELECT url FROM tasks WHERE batch_id = ? AND site_url = ? AND status IN (?, ?) "
+                "ORDER BY status != ?, id LIMIT ?",
+                (batch_id, site_url, PENDING, DEFERRED, PENDING, limit)
+            )
+        return [row["url"] for row in rows]
+
+    def skip_submitted(self, batch_id, site_url, resubmit_after, urls=None):
+        """
+        Marks the site's unfinished tasks (pending, deferred or failed) whose link (normalized, see history.normalize_url) was
+        submitted to the site within resubmit_after seconds (ever, when None) as skipped.
+        urls: only look at these links (e.g. the chunk pending_urls returned), so chunked runs
+        never rescan the whole site; every pending task of the site when None.
+        Returns the links that were skipped.
+        """
+        site_key = site_profiles.site_key(site_url)
+        since = 0 if resubmit_after is None else time.time() - resubmit_after
+        with self._lock, self._conn:
+            if urls is None:
+                urls = [row["url"] for row in self._conn.execute(
+                    "SELECT url FROM tasks WHERE batch_id = ? AND site_url = ? AND status IN (?, ?, ?)",
+                    (batch_id, site_url, PENDING, DEFERRED, FAILED)
+                )]
+            keys = {}
+            for url in urls:
+                keys.setdefault(history.normalize_url(url), []).append(url)
+
+            seen = []
+            key_list = list(keys)
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                seen += self._conn.execute(
+                    f"SELECT url_key, batch_id, submitted_at FROM history WHERE site_key = ? AND submitted_at >= ? "
+                    f"AND url_key IN ({', '.join('?' * len(chunk))})",
+                    (site_key, since, *chunk)
+                ).fetchall()
+
+            now = time.time()
+            skipped = [
+                (url, f"already submitted {time.strftime('%Y-%m-%d', time.localtime(row['submitted_at']))} (batch {row['batch_id']})")
+                for row in seen for url in keys[row["url_key"]]
+            ]
+            self._conn.executemany(
+                "UPDATE tasks SET status = ?, last_error = ?, updated_at = ? "
+                "WHERE batch_id = ? AND url = ? AND site_url = ? AND status IN (?, ?, ?)",
+                ((SKIPPED, reason, now, batch_id, url, site_url, PENDING, DEFERRED, FAILED) for url, reason in skipped)
+            )
+        return [url for url, _ in skipped]
+
+    def last_submitted(self, url, site_url):
+        """
+        (submitted_at, batch_id) of the link's latest submission to the site, or None.
+        """
+        rows = self._execute(
+            "SELECT submitted_at, batch_id FROM history WHERE url_key = ? AND site_key = ?",
+            (history.normalize_url(url), site_profiles.site_key(site_url))
+        )
+        return (rows[0]["submitted_at"], rows[0]["batch_id"]) if rows else None
+
+    def mark_running(self, batch_id, url, site_url):
+        self._execute(
+            "UPDATE tasks SET status = ?, attempts = attempts + 1, updated_at = ? WHERE batch_id = ? AND url = ? AND site_url = ?",
+            (RUNNING, time.time(), batch_id, url, site_url)
+        )
+
+    def mark_done(self, batch_id, url, site_url):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, last_error = NULL, updated_at = ? WHERE batch_id = ? AND url = ? AND site_url = ?",
+                (DONE, now, batch_id, url, site_url)
+            )
+            self._conn.execute(
+                "INSERT INTO history (url_key, site_key, url, batch_id, submitted_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (url_key, site_key) DO UPDATE SET url = excluded.url, batch_id = excluded.batch_id, "
+                "submitted_at = excluded.submitted_at",
+                (history.normalize_url(url), site_profiles.site_key(site_url), url, batch_id, now)
+            )
+
+    def mark_failed(self, batch_id, url, site_url, error):
+        self._execute(
+            "UPDATE tasks SET status = ?, last_error = ?, updated_at = ? WHERE batch_id = ? AND url = ? AND site_url = ?",
+            (FAILED, str(error)[:500], time.time(), batch_id, url, site_url)
+        )
+
+    def mark_retry(self, batch_id, url, site_url, error):
+        """
+        A failed attempt that will be tried again: back to pending, keeping the error.
+        """
+        self._execute(
+            "UPDATE tasks SET status = ?, last_error = ?, updated_at = ? WHERE batch_id = ? AND url = ? AND site_url = ?",
+            (PENDING, str(error)[:500], time.time(), batch_id, url, site_url)
+        )
+
+    def defer(self, batch_id, site_url, urls, reason):
+        """
+        Holds tasks back while their site is failing; they stay open work of the batch.
+        Tasks already finished (done, failed or skipped) are left alone.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE tasks SET status = ?, last_error = ?, updated_at = ? "
+                "WHERE batch_id = ? AND url = ? AND site_url = ? AND status IN (?, ?, ?)",
+                ((DEFERRED, str(reason)[:500], now, batch_id, url, site_url, PENDING, RUNNING, DEFERRED) for url in urls)
+            )
+
+    def finished_tasks(self, batch_id, site_url=None):
+        """
+        Tasks of the batch (of one site, when given) that are over: done, failed or skipped.
+        """
+        sql = "SELECT COUNT(*) AS n FROM tasks WHERE batch_id = ? AND status IN (?, ?, ?)"
+        params = (batch_id, DONE, FAILED, SKIPPED)
+        if site_url is not None:
+            sql += " AND site_url = ?"
+            params += (site_url,)
+        return self._execute(sql, params)[0]["n"]
+
+    def task_results(self, batch_id, site_url):
+        """
+        {url: (status, last_error)} of the site's tasks in the batch.
+        """
+        rows = self._execute(
+            "SELECT url, status, last_error FROM tasks WHERE batch_id = ? AND site_url = ?", (batch_id, site_url)
+        )
+        return {row["url"]: (row["status"], row["last_error"]) for row in rows}
+
+    def batch_status(self, batch_id):
+        """
+        Task counts by status, e.g. {"pending": 10, "done": 1790, "failed": 3, "total": 1803}.
+        """
+        rows = self._execute(
+            "SELECT status, COUNT(*) AS n FROM tasks WHERE batch_id = ? GROUP BY status", (batch_id,)
+        )
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0, DEFERRED: 0, SKIPPED: 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        counts["total"] = sum(counts.values())
+        counts["state"] = self.batch_state(batch_id)
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
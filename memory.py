@@ -0,0 +1,230 @@
+import asyncio
+import os
+import time
+import antigravity as ag
+
+# Memory the browser process tree may use; unset or 0 means BUDGET_SHARE of what the
+# machine (or container) has available when the process starts
+MEMORY_BUDGET_MB = float(os.getenv("BOOKMARK_MEMORY_BUDGET_MB", "0"))
+BUDGET_SHARE = 0.8
+
+# Above this share of the budget new contexts wait and no extra pages are opened;
+# above SHED_WATER idle contexts are closed and the heaviest one has its pages recycled
+HIGH_WATER = 0.85
+SHED_WATER = 0.95
+
+# ag.process_tree_rss() walks /proc, so it is sampled at most this often
+SAMPLE_INTERVAL = 2.0
+
+# A new context waits at most this long for memory before it is opened anyway
+ADMIT_TIMEOUT = 60.0
+
+# Seconds between two sheds, so the effect of one shows before the next
+SHED_COOLDOWN = 10.0
+
+# A site's pages are measured on their first submission and then every this many
+MEASURE_EVERY = 10
+
+# Cost of one page before a site has been measured, and what a renderer costs on top of
+# the page's JavaScript heap (the part that can be measured from inside the page)
+DEFAULT_PAGE_MB = 80.0
+RENDERER_OVERHEAD_MB = 30.0
+
+_HEAP_SCRIPT = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+
+def _read_int(path):
+    try:
+        with open(path, "r") as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+def _meminfo():
+    info = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                info[name] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return info
+
+def available_memory():
+    """
+    Bytes still available to this process: the container's (cgroup) limit minus its usage
+    when there is one, capped by the machine's MemAvailable. psutil is used without /proc.
+    """
+    available = _meminfo().get("MemAvailable")
+    if available is None:
+        try:
+            import psutil  # optional
+            available = psutil.virtual_memory().available
+        except ImportError:
+            return None
+    for limit_path, usage_path in (("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+                                   ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes")):
+        limit, usage = _read_int(limit_path), _read_int(usage_path)
+        # cgroup v1 reports "no limit" as a huge number
+        if limit and usage is not None and limit < 1 << 60:
+            return min(available, max(0, limit - usage))
+    return available
+
+def default_budget_mb():
+    """
+    BUDGET_SHARE of what the process tree uses now plus what is still available; 0 when unknown.
+    """
+    available = available_memory()
+    if available is None:
+        return 0.0
+    return (ag.process_tree_rss() + available) * BUDGET_SHARE / 1_000_000
+
+class MemoryGovernor:
+    """
+    Keeps the browser process tree under a memory budget: new contexts wait while it is
+    near the budget, extra pages are only opened while they fit, and above SHED_WATER the
+    pool's idle contexts are closed and the heaviest busy one has its pages replaced.
+    Also learns what a page of each site costs (JavaScript heap plus a renderer).
+    """
+    def __init__(self, budget_mb=None, high_water=HIGH_WATER, shed_water=SHED_WATER, sample_interval=SAMPLE_INTERVAL):
+        # Resolved on first use: measuring the machine walks /proc
+        self._budget_mb = budget_mb
+        self.high_water = high_water
+        self.shed_water = shed_water
+        self.sample_interval = sample_interval
+        # Site key -> measured bytes per page (moving average)
+        self.site_costs = {}
+        self._rss = 0
+        self._sampled_at = 0.0
+        # Pages admitted since the last sample, which does not show them yet
+        self._reserved = 0
+        self._shed_at = 0.0
+        self.stats = {"peak_rss": 0, "waits": 0, "waited": 0.0, "pages_denied": 0, "sheds": 0}
+
+    @property
+    def budget_mb(self):
+        if self._budget_mb is None:
+            self._budget_mb = MEMORY_BUDGET_MB or default_budget_mb()
+        return self._budget_mb
+
+    @budget_mb.setter
+    def budget_mb(self, value):
+        self._budget_mb = value
+
+    @property
+    def budget(self):
+        return self.budget_mb * 1_000_000
+
+    def rss(self):
+        now = time.monotonic()
+        if now - self._sampled_at > self.sample_interval:
+            self._rss = ag.process_tree_rss()
+            self._sampled_at = now
+            self._reserved = 0
+            self.stats["peak_rss"] = max(self.stats["peak_rss"], self._rss)
+        return self._rss
+
+    def page_cost(self, site_key):
+        return self.site_costs.get(site_key, DEFAULT_PAGE_MB * 1_000_000)
+
+    def headroom(self):
+        """
+        Bytes left below the high-water mark (negative when over it).
+        """
+        return self.budget * self.high_water - self.rss() - self._reserved
+
+    def suggested_pages(self, site_key=None):
+        """
+        How many more pages fit under the high-water mark (a site's or the average cost); None without a budget.
+        """
+        if not self.budget_mb:
+            return None
+        if site_key is None and self.site_costs:
+            cost = sum(self.site_costs.values()) / len(self.site_costs)
+        else:
+            cost = self.page_cost(site_key)
+        return max(0, int(self.headroom() // cost))
+
+    def try_admit(self, site_key):
+        """
+        True (and the page's cost reserved) when one more page of the site fits.
+        """
+        if not self.budget_mb:
+            return True
+        cost = self.page_cost(site_key)
+        if self.headroom() < cost:
+            self.stats["pages_denied"] += 1
+            return False
+        self._reserved += cost
+        return True
+
+    async def admit(self, site_key, busy, timeout=ADMIT_TIMEOUT):
+        """
+        Waits until a context with one page of the site fits. Does not wait when nothing
+        else is running (`busy` contexts), as nothing would free memory, nor past timeout.
+        """
+        if not self.budget_mb or self.try_admit(site_key) or not busy:
+            return
+        started = time.monotonic()
+        self.stats["waits"] += 1
+        print(f"🧠 Memory at {self.rss() / 1_000_000:.0f}/{self.budget_mb:.0f} MB, waiting before opening {site_key}")
+        while time.monotonic() - started < timeout:
+            await asyncio.sleep(self.sample_interval)
+            if self.try_admit(site_key):
+                break
+        self.stats["waited"] += time.monotonic() - started
+
+    def over_shed_water(self):
+        return bool(self.budget_mb) and self.rss() > self.budget * self.shed_water
+
+    async def relieve(self, pool):
+        """
+        Sheds memory from a ContextPool when over SHED_WATER (at most once per SHED_COOLDOWN).
+        """
+        if self.over_shed_water() and time.monotonic() - self._shed_at > SHED_COOLDOWN:
+            await self.shed(pool)
+
+    async def shed(self, pool):
+        """
+        Frees memory in a ContextPool: closes its idle contexts and marks the busy context
+        with the most estimated page memory for page recycling.
+        """
+        self._shed_at = time.monotonic()
+        self.stats["sheds"] += 1
+        closed = await pool.close_idle()
+        heaviest = pool.heaviest(lambda pooled: self.page_cost(pooled.label) * pooled.open_pages())
+        if heaviest is not None:
+            heaviest.recycle_pages()
+        print(f"🧠 Memory at {self.rss() / 1_000_000:.0f}/{self.budget_mb:.0f} MB: closed {closed} idle contexts"
+              + (f", recycling the pages of {heaviest.label}" if heaviest is not None else ""))
+        # Let the next check see the effect
+        self._sampled_at = 0.0
+
+    async def measure(self, site_key, page):
+        """
+        Samples the page's JavaScript heap into the site's cost per page.
+        """
+        try:
+            heap = await page.evaluate(_HEAP_SCRIPT)
+        except Exception:
+            return
+        if not heap:
+            return
+        cost = heap + RENDERER_OVERHEAD_MB * 1_000_000
+        previous = self.site_costs.get(site_key)
+        self.site_costs[site_key] = cost if previous is None else 0.7 * previous + 0.3 * cost
+
+    def describe_site(self, site_key):
+        cost = self.site_costs.get(site_key)
+        return f"~{cost / 1_000_000:.0f} MB per page" if cost else "not measured"
+
+    def summary(self):
+        if not self.budget_mb:
+            return "Memory: no budget"
+        return (f"Memory: peak {self.stats['peak_rss'] / 1_000_000:.0f} of {self.budget_mb:.0f} MB, "
+                f"{self.stats['waits']} waits ({self.stats['waited']:.1f}s), {self.stats['pages_denied']} extra pages not opened, "
+                f"{self.stats['sheds']} sheds")
+
+# Process-wide governor shared by every batch
+governor = MemoryGovernor()
@@ -0,0 +1,316 @@
+import argparse
+import html
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+# Local stand-in for the bookmarking sites: same paths and selectors as the
+# site_profiles.json defaults, so bot.py runs against it without a profile entry.
+
+LOGIN_PAGE = """<!doctype html>
+<html><head><title>Login - {name}</title></head><body>
+<h1>Login</h1>
+<form method="post" action="/login">
+  <input type="text" name="username" placeholder="Username">
+  <input type="password" name="password" placeholder="Password">
+  <button type="submit" class="btn-primary">Login</button>
+</form>
+</body></html>"""
+
+DASHBOARD_PAGE = """<!doctype html>
+<html><head><title>{user} - {name}</title></head><body>
+<h1>Welcome {user}</h1><a href="/submit">Submit a story</a>
+</body></html>"""
+
+# Step 1 checks the URL over XHR, step 2 is revealed in place, and saving the details
+# reveals the final form, whose POST is what bot.py waits for.
+SUBMIT_PAGE = """<!doctype html>
+<html><head><title>Submit - {name}</title></head><body>
+<div id="step1">
+  <input type="text" id="checkUrl" name="url">
+  <button type="button" class="checkUrl">Continue</button>
+</div>
+<div id="step2" style="display:none">
+  <input type="text" id="articleTitle">
+  <select id="category">
+    <option value="">Select category</option>
+    <option value="1">Business</option>
+    <option value="2">Technology</option>
+    <option value="3">Education</option>
+    <option value="4">News</option>
+    <option value="5">Other</option>
+  </select>
+  <textarea id="description"></textarea>
+  <input type="text" id="tags">
+  <button type="button" class="saveChanges">Save changes</button>
+</div>
+<form id="step3" method="post" action="/submit" style="display:none">
+  <input type="hidden" name="_token" value="{token}">
+  <input type="hidden" name="url"><input type="hidden" name="title">
+  <input type="hidden" name="category"><input type="hidden" name="description">
+  <input type="hidden" name="tags">
+  <button type="submit" id="submit">Submit</button>
+</form>
+<script>
+const $ = (s) => document.querySelector(s);
+$(".checkUrl").addEventListener("click", async () => {{
+  const r = await fetch("/api/check-url?url=" + encodeURIComponent($("#checkUrl").value));
+  if ((await r.json()).ok) $("#step2").style.display = "block";
+}});
+$(".saveChanges").addEventListener("click", () => {{
+  const f = $("#step3");
+  f.url.value = $("#checkUrl").value; f.title.value = $("#articleTitle").value;
+  f.category.value = $("#category").value; f.description.value = $("#description").value;
+  f.tags.value = $("#tags").value;
+  $("#step2").style.display = "none"; f.style.display = "block";
+}});
+</script>
+</body></html>"""
+
+DONE_PAGE = """<!doctype html>
+<html><head><title>Submitted - {name}</title></head><body>
+<h1>Story submitted</h1><p>{url}</p>
+</body></html>"""
+
+# Request template for http_engine that submits to a mock site without a browser
+HTTP_FLOW = {
+    "login": [
+        {"name": "login_page", "method": "GET", "path": "/login"},
+        {"name": "login", "method": "POST", "path": "/login",
+         "form": {"username": "{username}", "password": "{password}"}},
+    ],
+    "submit": [
+        {"name": "submit_page", "method": "GET", "path": "/submit", "extract": {"csrf": "_token"}},
+        {"name": "check_url", "method": "GET", "path": "/api/check-url", "params": {"url": "{url}"},
+         "expect_text": "\"ok\": true", "fail_as": "form_not_revealed"},
+        # 419: the CSRF token belonged to a session that has since been replaced
+        {"name": "final_submit", "method": "POST", "path": "/submit", "expect_status": [200], "fail_as": "session_lost",
+         "form": {"_token": "{csrf}", "url": "{url}", "title": "{title}", "category": "4",
+                  "description": "{description}", "tags": "{tags}"}},
+    ],
+}
+
+class MockBookmarkingSite:
+    """
+    One fake bookmarking site on its own port.
+    latency: seconds added to every request (plus up to `jitter` more, uniformly).
+    failure_rate: share of final submissions answered with HTTP 500.
+    reveal_failure_rate: share of Continue clicks that do not reveal the details form.
+    session_ttl / expire_every: sessions expire after this many seconds / accepted submissions,
+        which sends the bot back through /login.
+    """
+    def __init__(self, host="127.0.0.1", port=0, name="mock", latency=0.0, jitter=0.0,
+                 failure_rate=0.0, reveal_failure_rate=0.0, session_ttl=None, expire_every=None, seed=None):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.reveal_failure_rate = reveal_failure_rate
+        self.session_ttl = session_ttl
+        self.expire_every = expire_every
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self.reset_stats()
+
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"requests": 0, "logins": 0, "expired_sessions": 0, "accepted": 0, "failed": 0, "reveal_failures": 0}
+            self.submissions = []
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _chance(self, rate):
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+
+    def _delay(self):
+        if self.latency or self.jitter:
+            with self._lock:
+                extra = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+            time.sleep(self.latency + extra)
+
+    def _new_session(self, user):
+        token = secrets.token_hex(16)
+        with self._lock:
+            self._sessions[token] = {"user": user, "created": time.time(), "accepted": 0, "csrf": secrets.token_hex(8)}
+            self.stats["logins"] += 1
+        return token
+
+    def _session(self, token):
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            expired = (self.session_ttl is not None and time.time() - session["created"] > self.session_ttl) or \
+                      (self.expire_every is not None and session["accepted"] >= self.expire_every)
+            if expired:
+                del self._sessions[token]
+                self.stats["expired_sessions"] += 1
+                return None
+            return session
+
+    def _handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _token(self):
+                for part in self.headers.get("Cookie", "").split(";"):
+                    key, _, value = part.strip().partition("=")
+                    if key == "session":
+                        return value
+                return None
+
+            def _send(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _redirect(self, location, headers=None):
+                self._send(302, "", headers={"Location": location, **(headers or {})})
+
+            def _form(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                fields = parse_qs(self.rfile.read(length).decode("utf-8"))
+                return {key: values[0] for key, values in fields.items()}
+
+            def do_GET(self):
+                site._count("requests")
+                site._delay()
+                parsed = urlparse(self.path)
+                session = site._session(self._token())
+
+                if parsed.path == "/login":
+                    if session:
+                        return self._redirect(f"/user/{session['user']}")
+                    return self._send(200, LOGIN_PAGE.format(name=site.name))
+                if parsed.path.startswith("/user/"):
+                    if not session:
+                        return self._redirect("/login")
+                    return self._send(200, DASHBOARD_PAGE.format(name=site.name, user=html.escape(session["user"])))
+                if parsed.path == "/submit":
+                    if not session:
+                        return self._redirect("/login?next=/submit")
+                    return self._send(200, SUBMIT_PAGE.format(name=site.name, token=session["csrf"]))
+                if parsed.path == "/api/check-url":
+                    ok = session is not None and not site._chance(site.reveal_failure_rate)
+                    if session is not None and not ok:
+                        site._count("reveal_failures")
+                    return self._send(200, json.dumps({"ok": ok}), "application/json")
+                if parsed.path.startswith("/submitted/"):
+                    url = parse_qs(parsed.query).get("url", [""])[0]
+                    return self._send(200, DONE_PAGE.format(name=site.name, url=html.escape(url)))
+                if parsed.path == "/":
+                    return self._redirect("/login")
+                self._send(404, "Not found", "text/plain")
+
+            def do_POST(self):
+                site._count("requests")
+                site._delay()
+                parsed = urlparse(self.path)
+                form = self._form()
+
+                if parsed.path == "/login":
+                    if not form.get("username") or not form.get("password"):
+                        return self._send(200, LOGIN_PAGE.format(name=site.name))
+                    token = site._new_session(form["username"])
+                    return self._redirect(f"/user/{form['username']}", {"Set-Cookie": f"session={token}; Path=/; HttpOnly"})
+                if parsed.path == "/submit":
+                    session = site._session(self._token())
+                    if session is None:
+                        return self._redirect("/login?next=/submit")
+                    if form.get("_token") != session["csrf"]:
+                        site._count("failed")
+                        return self._send(419, "CSRF token mismatch", "text/plain")
+                    if not form.get("url") or not form.get("title") or site._chance(site.failure_rate):
+                        site._count("failed")
+                        return self._send(500, "Submission failed", "text/plain")
+                    with site._lock:
+                        session["accepted"] += 1
+                        site.stats["accepted"] += 1
+                        site.submissions.append(form)
+                        story_id = len(site.submissions)
+                    return self._redirect(f"/submitted/{story_id}?url={quote(form['url'], safe='')}")
+                self._send(404, "Not found", "text/plain")
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"mock-site-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def start_sites(count, base_port=0, **options):
+    """
+    Starts `count` mock sites on consecutive ports (or free ports when base_port is 0).
+    """
+    sites = []
+    for i in range(count):
+        port = base_port + i if base_port else 0
+        sites.append(MockBookmarkingSite(port=port, name=f"mock{i + 1}", **options).start())
+    return sites
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python mock_site.py", description="Local stand-in bookmarking sites")
+    parser.add_argument("--sites", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8001, help="port of the first site")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of final submissions that fail")
+    parser.add_argument("--reveal-failure-rate", type=float, default=0.0, help="share of Continue clicks that do nothing")
+    parser.add_argument("--session-ttl", type=float, default=None, help="seconds before a login expires")
+    parser.add_argument("--expire-every", type=int, default=None, help="accepted submissions before a login expires")
+    args = parser.parse_args(argv)
+
+    sites = start_sites(
+        args.sites, args.port, latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+        reveal_failure_rate=args.reveal_failure_rate, session_ttl=args.session_ttl, expire_every=args.expire_every
+    )
+    for site in sites:
+        print(f"🧪 {site.name} listening on {site.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for site in sites:
+            site.stop()
+
+if __name__ == "__main__":
+    main()
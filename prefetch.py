@@ -0,0 +1,297 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+try:
+    import httpx  # optional; without it links are checked with urllib in worker threads
+except ImportError:
+    httpx = None
+
+# Title/description/keywords of a link, cached between batches
+METADATA_DB_PATH = os.getenv("BOOKMARK_METADATA_DB", os.path.join(os.getcwd(), "bookmark_metadata.db"))
+
+# How long a fetched page is trusted; dead links are looked at again sooner
+METADATA_TTL = 7 * 24 * 60 * 60
+DEAD_TTL = 60 * 60
+
+# Links checked at the same time, overall and per host
+CONCURRENCY = 20
+PER_HOST = 4
+TIMEOUT = 15.0
+
+# Only the start of an HTML page is read; the <head> is all we need
+MAX_BYTES = 256 * 1024
+
+# Links are checked with HEAD; these answers mean the server does not do HEAD, so a GET decides
+HEAD_UNSUPPORTED = {405, 501}
+
+# Statuses that mean the link itself is gone. Anything else (403, 429, 503, ...) may just
+# be the page refusing bots, so the link is still submitted.
+DEAD_STATUSES = {404, 410, 451}
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+Metadata = namedtuple("Metadata", ["url", "alive", "status", "final_url", "title", "description", "keywords", "error", "fetched_at"])
+
+class _HeadParser(HTMLParser):
+    """
+    <title>, meta description and keywords (plus their Open Graph / article variants).
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.meta = {}
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            name = (attrs.get("name") or attrs.get("property") or "").lower()
+            if name and attrs.get("content"):
+                if name == "article:tag":
+                    self.meta.setdefault(name, []).append(attrs["content"])
+                else:
+                    self.meta.setdefault(name, attrs["content"])
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+def parse_head(html):
+    """
+    (title, description, keywords) of an HTML page; empty strings / list when missing.
+    """
+    parser = _HeadParser()
+    try:
+        parser.feed(html)
+    except Exception:
+        pass
+    meta = parser.meta
+    title = " ".join((parser.title or meta.get("og:title", "")).split())
+    description = " ".join((meta.get("description") or meta.get("og:description") or "").split())
+    keywords = [k.strip() for k in meta.get("keywords", "").split(",") if k.strip()] or meta.get("article:tag", [])
+    return title, description, keywords
+
+def _result(url, status, final_url, body=None, error=None, dead=None):
+    title, description, keywords = parse_head(body) if body else ("", "", [])
+    alive = not dead if dead is not None else error is None and status not in DEAD_STATUSES
+    return Metadata(url, alive, status, final_url, title, description, keywords, error, time.time())
+
+def _decode(raw, content_type):
+    charset = "utf-8"
+    if "charset=" in content_type:
+        charset = content_type.split("charset=", 1)[1].split(";")[0].strip() or charset
+    try:
+        return raw.decode(charset, "replace")
+    except LookupError:
+        return raw.decode("utf-8", "replace")
+
+class MetadataCache:
+    """
+    SQLite cache of Metadata by link, with a shorter TTL for dead links.
+    """
+    def __init__(self, path=METADATA_DB_PATH, ttl=METADATA_TTL, dead_ttl=DEAD_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.dead_ttl = dead_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS metadata (url TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL)")
+        self._conn.commit()
+
+    def get_many(self, urls):
+        """
+        {url: Metadata} for the links with a fresh entry.
+        """
+        found = {}
+        now = time.time()
+        urls = list(urls)
+        with self._lock:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT data FROM metadata WHERE url IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for (data,) in rows:
+                    entry = Metadata(**json.loads(data))
+                    if now - entry.fetched_at < (self.ttl if entry.alive else self.dead_ttl):
+                        found[entry.url] = entry
+        return found
+
+    def put_many(self, entries):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata (url, data, fetched_at) VALUES (?, ?, ?)",
+                ((entry.url, json.dumps(entry._asdict()), entry.fetched_at) for entry in entries)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def _needs_get(status, content_type):
+    """
+    Whether a HEAD answer leaves anything for a GET to find: the <head> of a live HTML page,
+    or the status itself when the server does not answer HEAD.
+    """
+    if status in HEAD_UNSUPPORTED:
+        return True
+    return "html" in content_type and status not in DEAD_STATUSES and status < 400
+
+async def _fetch_httpx(client, url):
+    try:
+        response = await client.head(url)
+        content_type = response.headers.get("content-type", "")
+        if not _needs_get(response.status_code, content_type):
+            return _result(url, response.status_code, str(response.url))
+
+        async with client.stream("GET", url) as response:
+            content_type = response.headers.get("content-type", "")
+            body = None
+            if "html" in content_type:
+                raw = b""
+                async for chunk in response.aiter_bytes():
+                    raw += chunk
+                    if len(raw) >= MAX_BYTES or b"</head>" in raw.lower():
+                        break
+                body = _decode(raw[:MAX_BYTES], content_type)
+            return _result(url, response.status_code, str(response.url), body)
+    except httpx.TimeoutException as e:
+        # Slow is not dead: the link is still submitted
+        return _result(url, None, url, error=f"{type(e).__name__}: {e}"[:300], dead=False)
+    except (httpx.HTTPError, httpx.InvalidURL, ValueError) as e:
+        return _result(url, None, url, error=f"{type(e).__name__}: {e}"[:300])
+
+def _open_urllib(url, method):
+    try:
+        request = Request(url, headers={"User-Agent": USER_AGENT}, method=method)
+        with urlopen(request, timeout=TIMEOUT) as response:
+            content_type = response.headers.get("content-type", "")
+            if method == "HEAD" and _needs_get(response.status, content_type):
+                return None
+            body = _decode(response.read(MAX_BYTES), content_type) if method == "GET" and "html" in content_type else None
+            return _result(url, response.status, response.geturl(), body)
+    except HTTPError as e:
+        if method == "HEAD" and e.code in HEAD_UNSUPPORTED:
+            return None
+        return _result(url, e.code, url)
+    except TimeoutError as e:
+        return _result(url, None, url, error=f"{type(e).__name__}: {e}"[:300], dead=False)
+    except Exception as e:
+        return _result(url, None, url, error=f"{type(e).__name__}: {e}"[:300])
+
+def _fetch_urllib(url):
+    """
+    HEAD, then GET only when the answer leaves something to read (None from the HEAD).
+    """
+    return _open_urllib(url, "HEAD") or _open_urllib(url, "GET")
+
+def _host(url):
+    try:
+        return urlsplit(url).netloc.lower()
+    except ValueError:
+        # Unparseable; the fetch reports it dead
+        return ""
+
+def _by_host(urls):
+    """
+    The links reordered round-robin across hosts, so a run of links to one host does not
+    leave the workers queued on its per-host limit.
+    """
+    queues = {}
+    for url in urls:
+        queues.setdefault(_host(url), []).append(url)
+    ordered = []
+    pending = deque(iter(links) for links in queues.values())
+    while pending:
+        links = pending.popleft()
+        url = next(links, None)
+        if url is not None:
+            ordered.append(url)
+            pending.append(links)
+    return ordered
+
+async def prefetch(urls, cache=None, concurrency=CONCURRENCY, per_host=PER_HOST, progress=None):
+    """
+    Checks every link once (cached ones are not fetched again) and returns {url: Metadata}.
+    A HEAD decides whether the link is alive; only live HTML pages are fetched again with
+    GET to read their <head>. Uses one pooled httpx client when available, else urllib in
+    worker threads, with `concurrency` links in flight.
+    progress(done, total) is called as links finish.
+    """
+    urls = list(dict.fromkeys(urls))
+    results = cache.get_many(urls) if cache else {}
+    todo = [url for url in urls if url not in results]
+    if not todo:
+        return results
+
+    hosts = {}
+    fetched = []
+    # One iterator shared by a fixed number of workers, instead of a coroutine per link
+    links = iter(_by_host(todo))
+
+    async def worker(fetch):
+        for url in links:
+            async with hosts.setdefault(_host(url), asyncio.Semaphore(per_host)):
+                entry = await fetch(url)
+            results[url] = entry
+            fetched.append(entry)
+            if progress:
+                progress(len(results), len(urls))
+
+    workers = max(1, min(concurrency, len(todo)))
+    if httpx is not None:
+        async with httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT}, follow_redirects=True, timeout=TIMEOUT,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        ) as client:
+            await asyncio.gather(*(worker(lambda u: _fetch_httpx(client, u)) for _ in range(workers)))
+    else:
+        await asyncio.gather(*(worker(lambda u: asyncio.to_thread(_fetch_urllib, u)) for _ in range(workers)))
+
+    if cache:
+        cache.put_many(fetched)
+    return results
+
+_default_cache = None
+
+def default_cache():
+    """
+    The process-wide MetadataCache (opened on first use).
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = MetadataCache()
+    return _default_cache
+
+def dead_links(results):
+    """
+    The links to drop. When no link could be reached at all, the problem is our own
+    connection, not the links, and nothing is dropped.
+    """
+    dead = {url for url, entry in results.items() if not entry.alive}
+    unreachable = [entry for entry in results.values() if entry.status is None and entry.error]
+    if results and len(unreachable) == len(results):
+        return set()
+    return dead
+
+def describe(entry):
+    """
+    Why a link was dropped: "HTTP 404" or the connection error.
+    """
+    return entry.error or f"HTTP {entry.status}"
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+
+# Per-site pacing defaults; site_profiles.json "rate_limit" overrides them per site
+DEFAULT_INITIAL_RATE = 1.0   # paced actions (navigations, submits) per second
+DEFAULT_MIN_RATE = 0.1
+DEFAULT_MAX_RATE = 5.0
+DEFAULT_MAX_WINDOW = 8       # submissions in flight on one site
+
+# Statuses that mean "slow down" rather than "this URL failed"
+THROTTLE_STATUSES = {429: "rate_limited", 503: "challenge"}
+
+def throttle_reason(response):
+    """
+    "rate_limited" / "challenge" for responses that show the site pushing back, else None.
+    """
+    if response is None:
+        return None
+    reason = THROTTLE_STATUSES.get(response.status)
+    if reason is None and response.status == 403:
+        headers = response.headers
+        if "cf-mitigated" in headers or "cloudflare" in headers.get("server", "").lower():
+            reason = "challenge"
+    return reason
+
+def retry_after(response):
+    """
+    Seconds from a numeric Retry-After header, or None.
+    """
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class DomainLimiter:
+    """
+    AIMD pacing for one site: every success adds `increase` to the rate and grows the
+    in-flight window by about one per window of successes; timeouts, login redirects and
+    challenge pages halve both (at most once per `cooldown` seconds, so a burst counts once).
+    State is plain numbers behind a thread lock, so a limiter outlives the event loop of a
+    single batch and what it learned carries over to the next batch on the same site.
+    """
+    def __init__(self, key, initial_rate=DEFAULT_INITIAL_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 max_window=DEFAULT_MAX_WINDOW, increase=0.1, decrease=0.5, cooldown=5.0):
+        self.key = key
+        self.rate = float(initial_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.window = float(max_window)
+        self.max_window = max_window
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.successes = 0
+        self.throttles = {}
+        self.waited = 0.0
+        self._next_at = 0.0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Books the next paced slot and returns how many seconds to wait for it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_at, self._paused_until)
+            self._next_at = start + 1.0 / self.rate
+            self.waited += start - now
+            return start - now
+
+    async def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    async def acquire(self, poll_interval=0.05):
+        """
+        Waits for room in the in-flight window. Pair with release().
+        """
+        while True:
+            with self._lock:
+                if self.in_flight < max(1, int(self.window)):
+                    self.in_flight += 1
+                    return
+            await asyncio.sleep(poll_interval)
+
+    def release(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def success(self):
+        with self._lock:
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            self.window = min(self.max_window, self.window + 1.0 / max(1.0, self.window))
+
+    def throttle(self, reason, pause=None):
+        """
+        Backs off after a sign of overload. pause: seconds to stop sending (Retry-After).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.throttles[reason] = self.throttles.get(reason, 0) + 1
+            if now - self._last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.window = max(1.0, self.window * self.decrease)
+                self._last_decrease = now
+            if pause:
+                self._paused_until = max(self._paused_until, now + pause)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "rate": round(self.rate, 2),
+                "window": int(self.window),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "throttles": dict(self.throttles),
+                "waited": round(self.waited, 1),
+            }
+
+    def summary(self):
+        stats = self.snapshot()
+        throttled = ", ".join(f"{reason} {count}" for reason, count in stats["throttles"].items()) or "none"
+        return f"{stats['rate']:.2f}/s, window {stats['window']}, waited {stats['waited']:.1f}s, throttled: {throttled}"
+
+class Unlimited:
+    """
+    Limiter stand-in used when pacing is off.
+    """
+    def reserve(self):
+        return 0.0
+
+    async def wait(self):
+        return 0.0
+
+    async def acquire(self, poll_interval=0.05):
+        pass
+
+    def release(self):
+        pass
+
+    def success(self):
+        pass
+
+    def throttle(self, reason, pause=None):
+        pass
+
+    def snapshot(self):
+        return {}
+
+    def summary(self):
+        return "unlimited"
+
+class LimiterRegistry:
+    """
+    One DomainLimiter per site key for the whole process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limiters = {}
+
+    def get(self, key, **settings):
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = DomainLimiter(key, **settings)
+            return limiter
+
+    def snapshot(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {key: limiter.snapshot() for key, limiter in limiters.items()}
+
+    def reset(self):
+        with self._lock:
+            self._limiters.clear()
+
+# Process-wide limiters, shared by inline batches and worker slots
+limiters = LimiterRegistry()
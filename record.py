@@ -0,0 +1,338 @@
+"""
+Turns a recorded browser submission into an http_flow for http_engine.
+
+    python -m bot record https://example.com/article --site https://www.abookmarking.com
+    python record.py recordings/abookmarking.com.har            # print the derived flow
+    python record.py recordings/abookmarking.com.har --save     # store it in site_profiles.json
+
+The recording (bot.record_site_session) is a HAR file of one successful submission plus a
+<site>.json with the values that were submitted. Those values become placeholders again
+({username} {password} {url} {title} {description} {tags}); form fields, headers and
+parameters that echo a token from an earlier response become {csrf}, {csrf_2}, ... with
+an "extract" rule on the response they came from.
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+from urllib.parse import parse_qsl, quote_plus, unquote, urljoin, urlsplit
+import http_engine
+import site_profiles
+
+# Where `python -m bot record` writes by default
+RECORD_DIR = os.getenv("BOOKMARK_RECORD_DIR", "recordings")
+
+# Submitted values turned back into placeholders where a recorded value equals one of them
+PLACEHOLDERS = ("description", "title", "url", "tags", "username")
+
+# Request headers worth replaying; cookies come from the client's jar and the rest from httpx
+REPLAY_HEADERS = {"x-csrf-token", "x-xsrf-token", "x-requested-with"}
+
+# Responses that are page resources rather than steps of the flow
+STATIC_TYPES = ("image/", "font/", "text/css", "javascript", "video/", "audio/")
+
+# Looks like a CSRF / nonce token rather than ordinary form input
+TOKEN_RE = re.compile(r"^[\w\-+/=.:%]{16,}$")
+
+def load(path):
+    """
+    (entries, meta) of a recording; meta is the <site>.json next to the HAR ({} when missing).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)["log"]["entries"]
+    meta_path = os.path.splitext(path)[0] + ".json"
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    return entries, meta
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+def _is_static(entry):
+    if entry.get("_resourceType") in ("image", "font", "stylesheet", "script", "media"):
+        return True
+    mime = entry["response"].get("content", {}).get("mimeType", "")
+    return entry["request"]["method"] == "GET" and any(kind in mime for kind in STATIC_TYPES)
+
+def site_entries(entries, site_url):
+    """
+    The site's own requests, in order, without page resources, aborted requests and the
+    redirect hops httpx follows by itself. Each entry gets "_final_status": the status at
+    the end of its redirect chain.
+    """
+    host = _host(site_url)
+    kept = []
+    redirect_to = None
+    for entry in entries:
+        request, response = entry["request"], entry["response"]
+        if _host(request["url"]) != host or not response.get("status"):
+            continue
+        if redirect_to and request["method"] == "GET" and request["url"] == redirect_to:
+            # Hop of the previous request's redirect chain
+            kept[-1]["_final_status"] = response["status"]
+        elif _is_static(entry):
+            continue
+        else:
+            entry["_final_status"] = response["status"]
+            kept.append(entry)
+
+        location = response.get("redirectURL") if 300 <= response["status"] < 400 else None
+        redirect_to = urljoin(request["url"], location) if location else None
+    return kept
+
+def _body(entry):
+    """
+    ("form" | "json", {field: value}) of a request body; (None, None) when there is none.
+    """
+    post = entry["request"].get("postData")
+    if not post:
+        return None, None
+    mime = post.get("mimeType", "")
+    text = post.get("text") or ""
+    if "json" in mime:
+        try:
+            return "json", json.loads(text)
+        except ValueError:
+            return None, None
+    if post.get("params"):
+        return "form", {p["name"]: unquote(p.get("value", "")) for p in post["params"]}
+    return "form", dict(parse_qsl(text, keep_blank_values=True))
+
+def _mentions(entry, value):
+    request = entry["request"]
+    post = request.get("postData") or {}
+    haystack = request["url"] + (post.get("text") or "") + json.dumps(post.get("params", []))
+    return any(variant in haystack for variant in (value, quote_plus(value)))
+
+def split_flows(entries, meta):
+    """
+    ([login entries], [submit entries]). Login runs up to the POST carrying the password field;
+    the submit flow starts at the last load of the submit page before the request that
+    carries the submitted link, and ends with the last request that does.
+    """
+    login_end = None
+    for index, entry in enumerate(entries):
+        kind, body = _body(entry)
+        if kind and any("pass" in str(name).lower() for name in body):
+            login_end = index
+            break
+    if login_end is None:
+        login = []
+        rest = entries
+    else:
+        # The login page load (for its tokens) and the form post
+        start = login_end - 1 if login_end and entries[login_end - 1]["request"]["method"] == "GET" else login_end
+        login = entries[start:login_end + 1]
+        rest = entries[login_end + 1:]
+
+    target = meta.get("values", {}).get("url")
+    carrying = [index for index, entry in enumerate(rest) if target and _mentions(entry, target)]
+    if not carrying:
+        return login, []
+    last = carrying[-1]
+    submit_path = urlsplit(meta["submit_url"]).path if meta.get("submit_url") else None
+    start = carrying[0]
+    for index in range(carrying[0], -1, -1):
+        request = rest[index]["request"]
+        if request["method"] == "GET" and (urlsplit(request["url"]).path == submit_path or submit_path is None):
+            start = index
+            break
+    return login, rest[start:last + 1]
+
+def _escape(value):
+    return value.replace("{", "{{").replace("}", "}}")
+
+def _parameterize(field, value, values):
+    """
+    A recorded string as a template: a submitted value becomes its placeholder, and the
+    submitted link is also replaced inside longer strings (short values like tags are not).
+    When several values are equal (the title may be the link) the field name decides.
+    """
+    matches = [name for name in PLACEHOLDERS if values.get(name) and value in (values[name], quote_plus(values[name]))]
+    if matches:
+        named = [name for name in matches if name in str(field).lower()]
+        choice = named[0] if named else "url" if "url" in matches else matches[0]
+        return "{" + choice + "}"
+    template = _escape(value)
+    link = values.get("url")
+    if link:
+        for variant in (link, quote_plus(link)):
+            template = template.replace(_escape(variant), "{url}")
+    return template
+
+def _text(entry):
+    content = entry["response"].get("content", {})
+    text = content.get("text") or ""
+    if content.get("encoding") == "base64":
+        try:
+            text = base64.b64decode(text).decode("utf-8", "replace")
+        except ValueError:
+            return ""
+    return text
+
+def _token_source(token, earlier):
+    """
+    (entry, extract spec) of the latest earlier response that handed out `token`.
+    """
+    for entry in reversed(earlier):
+        content = entry["response"].get("content", {})
+        text = _text(entry)
+        for cookie in entry["response"].get("cookies", []):
+            if unquote(cookie.get("value", "")) == token:
+                return entry, f"cookie:{cookie['name']}"
+        if token not in text:
+            continue
+        if "json" in content.get("mimeType", ""):
+            path = _json_path(_loads(text), token)
+            if path:
+                return entry, "json:" + ".".join(path)
+        for name, value in http_engine.form_fields(text).items():
+            if value == token:
+                return entry, name
+        index = text.index(token)
+        before = re.escape(text[max(0, index - 30):index])
+        return entry, f"re:{before}([^\"'<&\\s]+)"
+    return None, None
+
+def _loads(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+def _json_path(value, token, path=()):
+    if value == token:
+        return list(path)
+    items = value.items() if isinstance(value, dict) else enumerate(value) if isinstance(value, list) else ()
+    for key, item in items:
+        found = _json_path(item, token, path + (str(key),))
+        if found:
+            return found
+    return None
+
+def _step_name(entry, used):
+    request = entry["request"]
+    segment = [part for part in urlsplit(request["url"]).path.split("/") if part][-1:] or ["root"]
+    name = re.sub(r"\W+", "_", f"{request['method'].lower()}_{segment[0]}").strip("_")
+    used[name] = used.get(name, 0) + 1
+    return name if used[name] == 1 else f"{name}_{used[name]}"
+
+def derive_flow(entries, meta):
+    """
+    {"login": [...], "submit": [...]} request templates for http_engine, plus a list of warnings.
+    """
+    values = dict(meta.get("values", {}))
+    if meta.get("username"):
+        values["username"] = meta["username"]
+    site_url = meta.get("site_url") or entries[0]["request"]["url"]
+    entries = site_entries(entries, site_url)
+    login, submit = split_flows(entries, meta)
+    warnings = []
+    if not login:
+        warnings.append("no login form post found; the flow assumes an already authenticated client")
+    if not submit:
+        warnings.append(f"no request carries the submitted link {values.get('url')!r}")
+
+    flows = {}
+    for flow_name, flow_entries in (("login", login), ("submit", submit)):
+        # Each flow runs with its own values, so tokens are extracted again in each
+        tokens = {}
+        templates = []
+        used = {}
+        for index, entry in enumerate(flow_entries):
+            request = entry["request"]
+            parts = urlsplit(request["url"])
+            template = {"name": _step_name(entry, used), "method": request["method"], "path": parts.path or "/"}
+
+            def convert(name, value):
+                if not isinstance(value, str):
+                    return value
+                if flow_name == "login" and "pass" in str(name).lower():
+                    return "{password}"
+                if TOKEN_RE.match(value) and value not in values.values():
+                    if value not in tokens:
+                        source, spec = _token_source(value, flow_entries[:index])
+                        if source is None:
+                            warnings.append(f"{template['name']}: {name}={value[:12]}... looks like a token but no earlier response of the {flow_name} flow has it")
+                            return _escape(value)
+                        placeholder = "csrf" if not tokens else f"csrf_{len(tokens) + 1}"
+                        tokens[value] = placeholder
+                        source_template = templates[flow_entries.index(source)]
+                        source_template.setdefault("extract", {})[placeholder] = spec
+                    return "{" + tokens[value] + "}"
+                return _parameterize(name, value, values)
+
+            params = dict(parse_qsl(parts.query, keep_blank_values=True))
+            if params:
+                template["params"] = {name: convert(name, value) for name, value in params.items()}
+            kind, body = _body(entry)
+            if kind == "json":
+                template["json"] = _convert_json(body, convert)
+            elif kind == "form":
+                template["form"] = {name: convert(name, value) for name, value in body.items()}
+            elif request.get("postData"):
+                warnings.append(f"{template['name']}: {request['postData'].get('mimeType')} body is not supported")
+            headers = {h["name"]: convert(h["name"], h["value"]) for h in request.get("headers", [])
+                       if h["name"].lower() in REPLAY_HEADERS}
+            if headers:
+                template["headers"] = headers
+            if request["method"] != "GET" and entry.get("_final_status", 0) < 400:
+                template["expect_status"] = [entry["_final_status"]]
+            templates.append(template)
+        flows[flow_name] = templates
+    return flows, warnings
+
+def _convert_json(value, convert, name=None):
+    if isinstance(value, dict):
+        return {key: _convert_json(item, convert, key) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_convert_json(item, convert, name) for item in value]
+    return convert(name, value)
+
+def save_flow(site_url, flow, path=None):
+    """
+    Stores the flow in the site's entry of the profiles file (added if missing) and switches
+    the site to the HTTP engine.
+    """
+    path = path or site_profiles.PROFILES_PATH
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    key = site_profiles.site_key(site_url)
+    entry = next((site for site in spec.setdefault("sites", []) if site_profiles.site_key(site["url"]) == key), None)
+    if entry is None:
+        entry = {"url": site_url}
+        spec["sites"].append(entry)
+    entry["engine"] = "http"
+    entry["http_flow"] = flow
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=2)
+        f.write("\n")
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python record.py", description="Derive an http_flow from a recorded submission")
+    parser.add_argument("har", help="HAR file written by `python -m bot record`")
+    parser.add_argument("--save", action="store_true", help="store the flow in the site profiles and use the HTTP engine")
+    parser.add_argument("--profiles", default=None, help="profiles file to update (default: %s)" % site_profiles.PROFILES_PATH)
+    args = parser.parse_args(argv)
+
+    entries, meta = load(args.har)
+    if not meta:
+        print(f"⚠️ No {os.path.splitext(args.har)[0]}.json next to the HAR; submitted values stay literal", file=sys.stderr)
+    flow, warnings = derive_flow(entries, meta)
+    for warning in warnings:
+        print(f"⚠️ {warning}", file=sys.stderr)
+    if args.save:
+        if not meta.get("site_url"):
+            parser.error("--save needs the recording's .json for the site URL")
+        path = save_flow(meta["site_url"], flow, args.profiles)
+        print(f"💾 Saved the flow for {meta['site_url']} to {path} (engine: http)")
+    else:
+        print(json.dumps(flow, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+import random
+import time
+from collections import deque, namedtuple
+try:
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+except ImportError:
+    # Classification and scheduling are pure logic; without Playwright nothing raises its timeout
+    class PlaywrightTimeoutError(Exception):
+        pass
+import circuit
+
+# Failure classes
+TIMEOUT = "timeout"                      # a step timed out; `step` says which one
+SESSION_LOST = "session_lost"            # sent back to /login and re-authenticating did not stick
+FORM_NOT_REVEALED = "form_not_revealed"  # Continue never revealed the details form
+SITE_DOWN = "site_down"                  # connection errors, 5xx, or the submit page never loading
+CHALLENGE = "challenge"                  # bot check the HTTP engine cannot pass; the browser takes over
+OTHER = "other"
+
+# Scheduler decisions for a failed task
+RETRY = "retry"        # requeued at the back with a delay
+GIVE_UP = "give_up"    # budget spent; the task is recorded as failed
+
+# Reasons the scheduler stops early while work is left (see RetryScheduler.stopped)
+BREAKER_OPEN = "breaker_open"
+SATISFIED = "satisfied"  # the caller got the number of successes it asked for
+
+Failure = namedtuple("Failure", ["kind", "step", "message"])
+
+# Chromium network errors that mean the site itself is unreachable
+SITE_DOWN_ERRORS = (
+    "net::ERR_CONNECTION_REFUSED", "net::ERR_CONNECTION_RESET", "net::ERR_CONNECTION_CLOSED",
+    "net::ERR_CONNECTION_TIMED_OUT", "net::ERR_NAME_NOT_RESOLVED", "net::ERR_ADDRESS_UNREACHABLE",
+    "net::ERR_TIMED_OUT", "net::ERR_EMPTY_RESPONSE", "net::ERR_SSL_PROTOCOL_ERROR",
+)
+
+# Steps where a timeout means the page did not load at all
+LOAD_STEPS = {"goto_submit", "submit_form"}
+
+# Steps of the re-login path
+SESSION_STEPS = {"relogin", "relogin_form", "login_redirect"}
+
+# HTTP answers to a form POST that mean the session (or the CSRF token it issued) went stale
+SESSION_STATUSES = {401, 419, 440}
+
+class SubmissionError(Exception):
+    """
+    A failure bot.submit_url already knows the class of (and optionally the step it happened at).
+    """
+    def __init__(self, kind, message, step=None):
+        super().__init__(message)
+        self.kind = kind
+        self.step = step
+
+def classify(error, step):
+    """
+    Failure(kind, step, message) for an exception raised during `step` of the submit flow.
+    """
+    message = str(error)
+    if isinstance(error, SubmissionError):
+        kind = error.kind
+        step = error.step or step
+    elif any(marker in message for marker in SITE_DOWN_ERRORS):
+        kind = SITE_DOWN
+    elif step in SESSION_STEPS:
+        kind = SESSION_LOST
+    elif isinstance(error, PlaywrightTimeoutError):
+        kind = SITE_DOWN if step in LOAD_STEPS else TIMEOUT
+    else:
+        kind = OTHER
+    return Failure(kind, step, message.splitlines()[0][:300] if message else type(error).__name__)
+
+def status_failure(status, step, what="Site"):
+    """
+    SubmissionError for an HTTP error answer (4xx/5xx), or None for a 2xx/3xx.
+    """
+    if status < 400:
+        return None
+    if status >= 500:
+        kind = SITE_DOWN
+    elif status in SESSION_STATUSES:
+        kind = SESSION_LOST
+    elif status in (408, 429):
+        kind = TIMEOUT
+    else:
+        kind = OTHER
+    return SubmissionError(kind, f"{what} answered HTTP {status}", step)
+
+class RetryPolicy:
+    """
+    Per-class retry budgets and exponential backoff with jitter.
+    budgets: retries allowed per task for each failure class.
+    base_delays: seconds before the first retry; doubled (backoff) for every further one, up to max_delay.
+    max_breaker_wait: how long a session waits for its open circuit breaker to allow a probe
+        before it leaves the remaining links deferred for a later run.
+    """
+    def __init__(self, budgets=None, base_delays=None, backoff=2.0, max_delay=300.0, jitter=0.5, max_breaker_wait=120.0):
+        self.budgets = {TIMEOUT: 2, SESSION_LOST: 2, FORM_NOT_REVEALED: 1, SITE_DOWN: 1, CHALLENGE: 0, OTHER: 0}
+        self.budgets.update(budgets or {})
+        self.base_delays = {TIMEOUT: 10.0, SESSION_LOST: 5.0, FORM_NOT_REVEALED: 15.0, SITE_DOWN: 60.0, OTHER: 10.0}
+        self.base_delays.update(base_delays or {})
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_breaker_wait = max_breaker_wait
+
+    def budget(self, kind):
+        return self.budgets.get(kind, 0)
+
+    def delay(self, kind, retry_number):
+        """
+        Seconds to wait before retry number `retry_number` (1-based) of a task.
+        The jitter keeps pages that failed together from retrying in lockstep.
+        """
+        delay = min(self.max_delay, self.base_delays.get(kind, 10.0) * self.backoff ** (retry_number - 1))
+        return delay * random.uniform(1 - self.jitter, 1)
+
+# Retries disabled: every failure is final
+NO_RETRY = RetryPolicy(budgets={kind: 0 for kind in (TIMEOUT, SESSION_LOST, FORM_NOT_REVEALED, SITE_DOWN, CHALLENGE, OTHER)})
+
+class RetryScheduler:
+    """
+    Work queue for the pages of one site session. Fresh URLs are served first, in order;
+    failed ones go to the back with their backoff delay, so retries never hold up healthy work.
+    With a circuit.CircuitBreaker nothing is handed out while it is open, and
+    on_breaker(breaker) is called whenever its state changes. A URL that got the breaker's
+    probe must come back through done() or hand_back(); release_probe() frees it otherwise.
+    """
+    def __init__(self, urls, policy=None, breaker=None, on_breaker=None):
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker
+        self._on_breaker = on_breaker
+        self._ready = deque(urls)
+        self._delayed = []
+        self._seq = 0
+        self._active = 0
+        # URL carrying the breaker's half-open probe, until its outcome is reported
+        self._probe = None
+        self._probing = False
+        self.failures = {}
+        self.retried = 0
+        self.stopped = None
+
+    def attempt(self, url):
+        """
+        1 for the first try of a URL, 2 for its first retry, ...
+        """
+        return sum(self.failures.get(url, {}).values()) + 1
+
+    def stop(self, reason):
+        self.stopped = reason
+
+    def hand_back(self, url):
+        """
+        Returns a URL from next() unprocessed (front of the queue, no failure counted).
+        A probe handed back is released, so the next caller can probe.
+        """
+        self._active -= 1
+        self._ready.appendleft(url)
+        if url == self._probe:
+            self.release_probe()
+
+    def release_probe(self):
+        """
+        Gives back the breaker's probe if a URL from next() still holds it (call when stopping
+        without reporting every URL), so the breaker does not stay half-open for everyone else.
+        """
+        if self._probe is None:
+            return
+        self._probe = None
+        # Back to the open state it was in before the probe, so no on_breaker call
+        self.breaker.release_probe()
+
+    def _breaker_changed(self, before):
+        if self.breaker is not None and self.breaker.state != before and self._on_breaker:
+            self._on_breaker(self.breaker)
+
+    def _allowed(self):
+        if self.breaker is None:
+            return True
+        before = self.breaker.state
+        allowed = self.breaker.allow()
+        # allow() only says yes to a non-closed breaker when it hands out the probe
+        self._probing = allowed and self.breaker.state == circuit.HALF_OPEN
+        self._breaker_changed(before)
+        return allowed
+
+    async def next(self, idle_poll=0.1):
+        """
+        Next URL to work on, waiting for a delayed retry if that is all that is left.
+        None once everything is finished (or the scheduler was stopped).
+        """
+        while not self.stopped:
+            due = self._delayed[0][0] if self._delayed else None
+            now = time.monotonic()
+            if not self._ready and due is None:
+                if self._active:
+                    # Another page may still requeue what it is working on
+                    await asyncio.sleep(idle_poll)
+                    continue
+                return None
+            if not self._ready and due > now:
+                await asyncio.sleep(min(due - now, 1.0))
+                continue
+
+            if not self._allowed():
+                wait = self.breaker.retry_in()
+                if wait > self.policy.max_breaker_wait:
+                    self.stop(BREAKER_OPEN)
+                    return None
+                await asyncio.sleep(min(max(wait, idle_poll), 1.0))
+                continue
+
+            self._active += 1
+            url = self._ready.popleft() if self._ready else heapq.heappop(self._delayed)[2]
+            if self._probing:
+                self._probe, self._probing = url, False
+            return url
+        return None
+
+    def done(self, url, failure=None):
+        """
+        Reports the outcome of a URL handed out by next(). Returns (decision, delay) for failures,
+        (None, 0) for successes.
+        """
+        self._active -= 1
+        if url == self._probe:
+            self._probe = None
+        before = self.breaker.state if self.breaker is not None else None
+        if failure is None:
+            if self.breaker is not None:
+                self.breaker.record_success()
+                self._breaker_changed(before)
+            return None, 0
+
+        if self.breaker is not None:
+            self.breaker.record_failure(failure.step)
+            self._breaker_changed(before)
+
+        counts = self.failures.setdefault(url, {})
+        counts[failure.kind] = counts.get(failure.kind, 0) + 1
+        if counts[failure.kind] > self.policy.budget(failure.kind):
+            return GIVE_UP, 0
+
+        delay = self.policy.delay(failure.kind, counts[failure.kind])
+        self._seq += 1
+        heapq.heappush(self._delayed, (time.monotonic() + delay, self._seq, url))
+        self.retried += 1
+        return RETRY, delay
+
+    def remaining(self):
+        """
+        URLs not yet finished: never started, or waiting for a retry.
+        """
+        return list(self._ready) + [url for _, _, url in sorted(self._delayed)]
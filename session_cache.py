@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import time
+
+# Where Playwright storage_state snapshots (cookies + localStorage) are kept between batches
+SESSION_DIR = os.path.join(os.getcwd(), ".sessions")
+
+# How long a saved login is trusted before we log in from scratch again
+DEFAULT_TTL = 6 * 60 * 60
+
+class SessionCache:
+    """
+    On-disk cache of authenticated sessions keyed by (site_url, username).
+    """
+    def __init__(self, directory=SESSION_DIR, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _key(self, site_url, username):
+        site = site_url.rstrip('/').lower()
+        return hashlib.sha256(f"{site}|{username}".encode("utf-8")).hexdigest()[:32]
+
+    def path_for(self, site_url, username):
+        return os.path.join(self.directory, f"{self._key(site_url, username)}.json")
+
+    def load(self, site_url, username):
+        """
+        Returns the storage_state path for a fresh cached session, or None.
+        """
+        path = self.path_for(site_url, username)
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return None
+
+        if age > self.ttl:
+            self.invalidate(site_url, username)
+            return None
+
+        # A truncated write (crash mid-save) must not break context creation
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                json.load(f)
+        except (OSError, ValueError):
+            self.invalidate(site_url, username)
+            return None
+
+        return path
+
+    async def save(self, context, site_url, username):
+        """
+        Snapshots the context's cookies and localStorage for the next batch.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(site_url, username)
+        tmp_path = f"{path}.tmp"
+        try:
+            await context.storage_state(path=tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ Could not cache session for {site_url}: {e}")
+
+    def invalidate(self, site_url, username):
+        try:
+            os.remove(self.path_for(site_url, username))
+        except OSError:
+            pass
+
+# Shared instance used by bot.py
+cache = SessionCache()
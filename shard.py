@@ -0,0 +1,198 @@
+"""
+Runs one batch on several processes at once, split by site.
+
+    python shard.py links.txt --site https://a.example --site https://b.example --processes 4
+
+One Python process drives every page of a batch through a single Playwright connection and
+runs out of CPU long before the machine does. run_sharded_batch gives each of N worker
+processes its own Playwright and browser and a share of the sites: a site is only ever
+worked on by one process, so it is logged in to once. Progress comes back over a queue
+into the usual progress_callback(current, total, message).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import sys
+import bot
+import history
+import ingest
+import job_store as jobs
+import memory
+import prefetch
+import site_profiles
+
+# Worker processes per batch; never more than there are sites
+PROCESSES = int(os.getenv("BOOKMARK_PROCESSES", str(os.cpu_count() or 1)))
+
+# Relative cost of one site when sharding: an HTTP-engine site needs no browser pages
+BROWSER_WEIGHT = 1.0
+HTTP_WEIGHT = 0.25
+
+# Seconds between checks on the worker processes while waiting for progress
+POLL_INTERVAL = 0.5
+
+def site_weight(site):
+    profile = site_profiles.get_profile(site['url'])
+    return HTTP_WEIGHT if profile.engine == "http" and profile.http_flow else BROWSER_WEIGHT
+
+def shard_sites(site_configs, processes, weights=None):
+    """
+    Splits the sites into at most `processes` groups of about the same total weight
+    (heaviest site first, each to the lightest group). weights: {site_url: weight}.
+    """
+    weights = weights or {}
+    shards = [[] for _ in range(max(1, min(processes, len(site_configs))))]
+    loads = [0.0] * len(shards)
+    ordered = sorted(site_configs, key=lambda site: weights.get(site['url'], BROWSER_WEIGHT), reverse=True)
+    for site in ordered:
+        lightest = loads.index(min(loads))
+        shards[lightest].append(site)
+        loads[lightest] += weights.get(site['url'], BROWSER_WEIGHT)
+    return [shard for shard in shards if shard]
+
+def _run_shard(index, urls, site_configs, options, job_db, batch_id, events, memory_budget_mb=None):
+    """
+    Body of one worker process: a regular run_batch_submission on its own browser, within
+    its share of the memory budget. Reports (index, current, total, message) and finally
+    (index, None, None, error).
+    """
+    if memory_budget_mb:
+        memory.governor.budget_mb = memory_budget_mb
+
+    def report(current, total, message):
+        events.put((index, current, total, message))
+
+    store = jobs.JobStore(job_db) if job_db else None
+    error = None
+    try:
+        asyncio.run(bot.run_batch_submission(
+            urls, site_configs, progress_callback=report, use_shared_browser=False,
+            job_store=store, batch_id=batch_id, **options
+        ))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        print(f"❌ Shard {index} failed: {error}")
+    finally:
+        if store:
+            store.close()
+        events.put((index, None, None, error))
+
+def run_sharded_batch(urls, site_configs, processes=PROCESSES, progress_callback=None, job_db=None,
+                      batch_id=None, check_links=True, **options):
+    """
+    run_batch_submission across worker processes, sharded by site (see shard_sites).
+    job_db: path of a job_store database shared by every process; the batch is created
+        here, so all of them work on the same batch_id, which is returned.
+    check_links: links are fetched once here, before the processes start; they then find
+        every link in the shared prefetch cache.
+    Other options are passed to run_batch_submission (use_shared_browser is always off:
+    every process launches its own browser). Blocks until every process has exited.
+    """
+    urls = history.unique(urls)
+    shards = shard_sites(site_configs, processes, {site['url']: site_weight(site) for site in site_configs})
+    if not shards:
+        print("✅ No sites to submit to.")
+        return batch_id
+
+    if job_db:
+        store = jobs.JobStore(job_db)
+        try:
+            if batch_id is None or store.batch_state(batch_id) in (None, jobs.FINISHED, jobs.CANCELLED):
+                batch_id = store.create_batch(urls, [site['url'] for site in site_configs], batch_id)
+        finally:
+            store.close()
+
+    if check_links and urls:
+        print(f"🔎 Checking {len(urls)} links before starting {len(shards)} processes...")
+        asyncio.run(prefetch.prefetch(urls, cache=prefetch.default_cache()))
+
+    options = dict(options, check_links=check_links)
+    options.pop("use_shared_browser", None)
+
+    # Every process would otherwise budget for all of the machine's memory
+    memory_budget_mb = memory.governor.budget_mb / len(shards) if memory.governor.budget_mb else None
+
+    # spawn: a fresh interpreter per process, never a fork of a running event loop or browser
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    workers = []
+    for index, shard in enumerate(shards):
+        print(f"🧩 Shard {index}: {', '.join(site['url'] for site in shard)}")
+        worker = context.Process(
+            target=_run_shard, args=(index, urls, shard, options, job_db, batch_id, events, memory_budget_mb),
+            name=f"bookmark-shard-{index}", daemon=True
+        )
+        worker.start()
+        workers.append(worker)
+
+    progress = {index: (0, 0) for index in range(len(workers))}
+    running = set(progress)
+    failures = []
+    try:
+        while running:
+            try:
+                index, current, total, message = events.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # A process that died without a word (killed, out of memory) is done too
+                for index in list(running):
+                    if not workers[index].is_alive() and workers[index].exitcode != 0:
+                        running.discard(index)
+                        failures.append(f"shard {index} exited with code {workers[index].exitcode}")
+                continue
+
+            if current is None:
+                running.discard(index)
+                if message:
+                    failures.append(f"shard {index}: {message}")
+                continue
+            progress[index] = (current, total)
+            if progress_callback:
+                progress_callback(
+                    sum(done for done, _ in progress.values()),
+                    sum(steps for _, steps in progress.values()),
+                    message
+                )
+    finally:
+        for worker in workers:
+            worker.join(timeout=None if not running else 5)
+            if worker.is_alive():
+                worker.terminate()
+        events.close()
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    print(f"🧩 {len(workers)} shards finished" + (f", {len(failures)} failed" if failures else ""))
+    return batch_id
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python shard.py", description="Submit a list of links with one process per group of sites")
+    parser.add_argument("source", help="TXT/CSV/sitemap file of links (gzip ok)")
+    parser.add_argument("--site", action="append", required=True, help="site URL to submit to (repeatable)")
+    parser.add_argument("--username", default=os.getenv("BOOKMARK_USER"), required=not os.getenv("BOOKMARK_USER"))
+    parser.add_argument("--password", default=os.getenv("BOOKMARK_PASS"), required=not os.getenv("BOOKMARK_PASS"))
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="worker processes (default: %(default)s)")
+    parser.add_argument("--pages", type=int, default=1, help="pages per site in each process")
+    parser.add_argument("--db", default=jobs.JOBS_DB_PATH, help="job database path (default: %(default)s)")
+    parser.add_argument("--no-check", action="store_true", help="do not check the links first")
+    parser.add_argument("--headful", action="store_true", help="show the browser windows")
+    args = parser.parse_args(argv)
+
+    stats = ingest.IngestStats()
+    urls = [url for chunk in ingest.pipeline(args.source, stats) for url in chunk]
+    print(f"📄 {stats}")
+    site_configs = [{"url": site, "username": args.username, "password": args.password} for site in args.site]
+
+    def report(current, total, message):
+        print(f"[{current}/{total}] {message}", file=sys.stderr)
+
+    batch_id = run_sharded_batch(
+        urls, site_configs, processes=args.processes, progress_callback=report, job_db=args.db,
+        check_links=not args.no_check, headless=not args.headful, max_pages_per_site=args.pages,
+        max_concurrent_sites=len(site_configs)
+    )
+    print(f"✅ Batch {batch_id} done")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import copy
+import json
+import os
+import threading
+from collections import namedtuple
+from urllib.parse import urlparse
+import history
+
+# Site definitions live next to the code; set BOOKMARK_SITE_PROFILES to use another file
+PROFILES_PATH = os.getenv(
+    "BOOKMARK_SITE_PROFILES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "site_profiles.json")
+)
+
+# One compiled action of a flow. `value` is a str.format template filled from the
+# current credentials / URL metadata, or the category mapping for "select" steps.
+Step = namedtuple("Step", ["name", "action", "selector", "value", "timeout", "optional"])
+
+_cache_lock = threading.Lock()
+_compiled = {}
+
+def site_key(site_url):
+    """
+    Normalized lookup key for a site: "https://www.abookmarking.com/" -> "abookmarking.com".
+    """
+    host = urlparse(site_url if "://" in site_url else f"http://{site_url}").netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+def _merge(base, override):
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+class SiteProfile:
+    """
+    Everything bot.py needs to drive one bookmarking site: URLs, selectors,
+    timeouts, category mapping and the compiled login/details steps.
+    """
+    def __init__(self, url, spec):
+        self.url = url
+        self.key = site_key(url)
+        self.name = spec.get("name") or self.key
+        self.selectors = spec["selectors"]
+        self.timeouts = spec["timeouts"]
+        self.category = spec["category"]
+        self.continue_attempts = spec["continue_attempts"]
+        self.allow_hosts = list(spec.get("allow_hosts", []))
+        # Keyword arguments for ratelimit.DomainLimiter
+        self.rate_limit = dict(spec.get("rate_limit", {}))
+        # Keyword arguments for circuit.CircuitBreaker
+        self.circuit_breaker = dict(spec.get("circuit_breaker", {}))
+        # "browser" (Playwright) or "http" (http_engine replaying http_flow, see record.py)
+        self.engine = spec.get("engine", "browser")
+        self.http_flow = spec.get("http_flow")
+        # Days before a link already submitted here is submitted again (None: never); see history.py
+        self.resubmit_after_days = spec.get("resubmit_after_days", history.RESUBMIT_AFTER_DAYS)
+
+        base = url.rstrip('/')
+        self.login_url = spec.get("login_url") or f"{base}{spec['login_path']}"
+        self.submit_url = spec.get("submit_url") or f"{base}{spec['submit_path']}"
+
+        sel, timeout = self.selectors, self.timeouts
+        self.login_steps = [
+            Step("fill_username", "fill", sel["username"], "{username}", timeout["fill"], False),
+            Step("fill_password", "fill", sel["password"], "{password}", timeout["fill"], False),
+            Step("click_login", "click", sel["login_button"], None, timeout["fill"], False),
+        ]
+        self.details_steps = [
+            Step("fill_title", "fill", sel["title"], "{title}", timeout["fill"], False),
+            Step("select_category", "select", sel["category"], self.category, timeout["fill"], False),
+            Step("fill_description", "fill", sel["description"], "{description}", timeout["fill"], False),
+            Step("fill_tags", "fill", sel["tags"], "{tags}", timeout["fill"], True),
+            Step("save_details", "click", sel["save_details"], None, timeout["fill"], False),
+        ]
+
+    def __repr__(self):
+        return f"SiteProfile({self.url!r})"
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # optional; only needed for YAML profile files
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def _compile(path):
+    raw = _read(path)
+    defaults = raw.get("defaults", {})
+    profiles = {"__defaults__": defaults}
+    for site_spec in raw.get("sites", []):
+        profile = SiteProfile(site_spec["url"], _merge(defaults, site_spec))
+        profiles[profile.key] = profile
+    return profiles
+
+def load_profiles(path=None):
+    """
+    Returns {site_key: SiteProfile}, compiled once per file version (re-read when the file changes).
+    """
+    path = path or PROFILES_PATH
+    mtime = os.path.getmtime(path)
+    with _cache_lock:
+        cached = _compiled.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, _compile(path))
+            _compiled[path] = cached
+        return cached[1]
+
+def get_profile(site_url, path=None):
+    """
+    Profile for a site; sites missing from the file get the default flow.
+    """
+    profiles = load_profiles(path)
+    profile = profiles.get(site_key(site_url))
+    if profile is None:
+        profile = SiteProfile(site_url, copy.deepcopy(profiles["__defaults__"]))
+    return profile
+
+def supported_sites(path=None):
+    return [profile.url for key, profile in load_profiles(path).items() if key != "__defaults__"]
+
+def allowlists(path=None):
+    """
+    Per-site request allowlists in the shape ag.BlockingProfile expects.
+    """
+    return {key: profile.allow_hosts for key, profile in load_profiles(path).items()
+            if key != "__defaults__" and profile.allow_hosts}
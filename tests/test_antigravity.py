@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+import antigravity as ag
+
+
+@pytest.fixture(autouse=True)
+def fresh_status(monkeypatch):
+    monkeypatch.setattr(ag, "_install_status", {"state": "not_checked", "detail": "", "checked_at": None})
+    monkeypatch.setattr(ag, "_playwright_version", lambda: "1.40.0")
+
+
+def fake_run(calls, fail=False):
+    def run(cmd, check):
+        calls.append(cmd)
+        if fail:
+            raise subprocess.CalledProcessError(1, cmd)
+    return run
+
+
+def test_marker_for_this_version_skips_the_installer(tmp_path, monkeypatch):
+    (tmp_path / "chromium-1091").mkdir()
+    (tmp_path / ag.INSTALL_MARKER).write_text(json.dumps({"playwright": "1.40.0"}))
+    calls = []
+    monkeypatch.setattr(subprocess, "run", fake_run(calls))
+
+    assert ag.ensure_browsers_installed(str(tmp_path))["state"] == "cached"
+    assert calls == []
+
+
+def test_install_writes_the_marker_once(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(subprocess, "run", fake_run(calls))
+
+    assert ag.ensure_browsers_installed(str(tmp_path))["state"] == "installed"
+    ag.ensure_browsers_installed(str(tmp_path))
+
+    assert len(calls) == 1
+    with open(os.path.join(tmp_path, ag.INSTALL_MARKER)) as f:
+        assert json.load(f)["playwright"] == "1.40.0"
+
+
+def test_failed_install_is_not_retried_on_rerun(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(subprocess, "run", fake_run(calls, fail=True))
+
+    assert ag.ensure_browsers_installed(str(tmp_path))["state"] == "failed"
+    assert ag.ensure_browsers_installed(str(tmp_path))["state"] == "failed"
+    assert len(calls) == 1
+
+    monkeypatch.setattr(subprocess, "run", fake_run(calls))
+    assert ag.ensure_browsers_installed(str(tmp_path), force=True)["state"] == "installed"
+    assert len(calls) == 2
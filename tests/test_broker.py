@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import json
+import time
+import pytest
+import bot
+import broker as brokers
+import job_store as jobs
+
+SITES = ["https://a.example", "https://b.example"]
+URLS = [f"https://example.com/articles/{i}" for i in range(6)]
+
+@pytest.fixture(params=["sqlite", "file"])
+def broker(request, tmp_path):
+    if request.param == "sqlite":
+        broker = brokers.open_broker(f"sqlite:///{tmp_path / 'broker.db'}")
+    else:
+        broker = brokers.open_broker(f"file://{tmp_path / 'queue'}")
+    yield broker
+    broker.close()
+
+def test_publish_is_idempotent(broker):
+    assert broker.publish(URLS, SITES[0], "env:BOOKMARK") == len(URLS)
+    assert broker.publish(URLS, SITES[0], "env:BOOKMARK") == 0
+    assert broker.stats()["ready"] == len(URLS)
+
+def test_a_lease_holds_one_site_and_a_site_is_leased_once(broker):
+    broker.publish(URLS, SITES[0], "env:BOOKMARK")
+    broker.publish(URLS[:2], SITES[1], "env:BOOKMARK")
+    first = broker.lease("w1", limit=4)
+    second = broker.lease("w2", limit=4)
+    assert len({task.site_url for task in first}) == 1
+    assert len({task.lease_id for task in first}) == 1
+    assert {task.site_url for task in second} == set(SITES) - {first[0].site_url}
+    # Both sites are busy
+    assert broker.lease("w3", limit=4) == []
+
+def test_expired_lease_is_requeued_and_its_late_acks_ignored(broker):
+    broker.publish(URLS[:3], SITES[0], "env:BOOKMARK")
+    tasks = broker.lease("w1", limit=3, ttl=-1)
+    assert broker.requeue_expired() == 3
+    assert not broker.heartbeat(tasks[0].lease_id)
+    broker.ack(tasks[0].lease_id, tasks[0].task_id)
+    stats = broker.stats()
+    assert (stats["ready"], stats["done"]) == (3, 0)
+
+    again = broker.lease("w2", limit=3)
+    assert {task.task_id for task in again} == {task.task_id for task in tasks}
+    assert all(task.attempts == 1 for task in again)
+
+def test_task_expiring_too_often_fails(broker):
+    broker.publish(URLS[:1], SITES[0], "env:BOOKMARK")
+    for _ in range(brokers.MAX_LEASE_ATTEMPTS):
+        assert broker.lease("w1", limit=1, ttl=-1)
+        broker.requeue_expired()
+    stats = broker.stats()
+    assert (stats["ready"], stats["failed"]) == (0, 1)
+
+def test_ack_fail_and_delayed_release(broker):
+    broker.publish(URLS[:3], SITES[0], "env:BOOKMARK")
+    done, failed, later = broker.lease("w1", limit=3)
+    broker.ack(done.lease_id, done.task_id)
+    broker.fail(failed.lease_id, failed.task_id, "other at confirmation")
+    broker.release(later.lease_id, [later.task_id], delay=60)
+    broker.end_lease(done.lease_id)
+    stats = broker.stats()
+    assert (stats["done"], stats["failed"], stats["ready"]) == (1, 1, 1)
+    # Released with a delay: not leasable yet
+    assert broker.lease("w2", limit=3) == []
+
+def test_resolve_credentials(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOOKMARK_USER", "alice")
+    monkeypatch.setenv("BOOKMARK_PASS", "secret")
+    assert brokers.resolve_credentials("env:BOOKMARK") == ("alice", "secret")
+    path = tmp_path / "creds.json"
+    path.write_text(json.dumps({"main": {"username": "bob", "password": "hunter2"}}))
+    assert brokers.resolve_credentials(f"file:{path}#main") == ("bob", "hunter2")
+    with pytest.raises(KeyError):
+        brokers.resolve_credentials("env:MISSING_CREDENTIALS")
+    with pytest.raises(KeyError):
+        brokers.resolve_credentials("vault:main")
+
+def test_lease_options_keep_only_what_run_batch_submission_takes():
+    options, dropped = bot.lease_options({"max_pages_per_site": 2, "headless": False, "batch_id": "x", "turbo": True})
+    assert options == {"max_pages_per_site": 2}
+    assert dropped == ["batch_id", "headless", "turbo"]
+
+def test_worker_reports_outcomes_and_deletes_the_lease_batch(broker, tmp_path, monkeypatch):
+    monkeypatch.setenv("BOOKMARK_USER", "alice")
+    monkeypatch.setenv("BOOKMARK_PASS", "secret")
+    broker.publish(URLS[:3], SITES[0], "env:BOOKMARK", {"max_pages_per_site": 2, "turbo": True})
+    store = jobs.JobStore(str(tmp_path / "jobs.db"))
+    calls = []
+
+    @functools.wraps(bot.run_batch_submission)
+    async def fake_run(urls, site_configs, job_store=None, batch_id=None, **options):
+        calls.append((batch_id, options))
+        site_url = site_configs[0]["url"]
+        job_store.create_batch(urls, [site_url], batch_id)
+        # The third link stays pending: it is released with a delay, so once=True stops
+        if URLS[0] in urls:
+            job_store.mark_done(batch_id, URLS[0], site_url)
+            job_store.mark_failed(batch_id, URLS[1], site_url, "other at confirmation")
+
+    monkeypatch.setattr(bot, "run_batch_submission", fake_run)
+    try:
+        asyncio.run(bot.run_broker_worker(broker, store, worker_id="w1", once=True, lease_size=3))
+        stats = broker.stats()
+        assert (stats["done"], stats["failed"], stats["ready"]) == (1, 1, 1)
+        assert calls[0][1]["max_pages_per_site"] == 2
+        assert "turbo" not in calls[0][1]
+        # The lease's batch is gone; the history of what was submitted stays
+        assert all(store.batch_state(batch_id) is None for batch_id, _ in calls)
+        assert store.batch_status(calls[0][0])["total"] == 0
+        assert store.last_submitted(URLS[0], SITES[0]) is not None
+    finally:
+        store.close()
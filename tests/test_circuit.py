@@ -0,0 +1,137 @@
+import asyncio
+import time
+import circuit
+import retry
+
+# Retry delays off, so the scheduler tests below run at once
+POLICY = retry.RetryPolicy(base_delays={kind: 0.0 for kind in (retry.TIMEOUT, retry.SESSION_LOST, retry.SITE_DOWN, retry.OTHER)}, jitter=0)
+
+def run(coroutine, timeout=2.0):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout))
+
+def open_breaker(**settings):
+    breaker = circuit.CircuitBreaker("example.com", failure_threshold=2, **settings)
+    breaker.record_failure("goto_submit")
+    breaker.record_failure("goto_submit")
+    return breaker
+
+def test_opens_after_threshold_failures_at_the_same_step():
+    breaker = circuit.CircuitBreaker("example.com", failure_threshold=2, cooldown=60)
+    breaker.record_failure("goto_submit")
+    breaker.record_failure("reveal_form")
+    assert breaker.state == circuit.CLOSED
+    breaker.record_failure("reveal_form")
+    assert breaker.state == circuit.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_in() > 0
+
+def test_single_probe_after_cooldown_and_success_closes():
+    breaker = open_breaker(cooldown=0)
+    assert breaker.allow()
+    assert breaker.state == circuit.HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == circuit.CLOSED
+    assert breaker.allow()
+
+def test_failed_probe_reopens_with_a_longer_cooldown():
+    breaker = open_breaker(cooldown=0.01)
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure("goto_submit")
+    assert breaker.state == circuit.OPEN
+    assert breaker.cooldown == 0.02
+
+def test_release_probe_reopens_with_the_cooldown_over():
+    breaker = open_breaker(cooldown=0)
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == circuit.OPEN
+    assert breaker.retry_in() == 0
+    assert breaker.allow()
+    assert breaker.state == circuit.HALF_OPEN
+
+def test_lost_probe_is_handed_out_again_after_the_probe_timeout():
+    breaker = open_breaker(cooldown=0, probe_timeout=0.01)
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(0.02)
+    assert breaker.allow()
+
+def test_registry_shares_one_breaker_per_key():
+    registry = circuit.BreakerRegistry()
+    assert registry.get("a.com") is registry.get("a.com")
+    assert registry.get("a.com") is not registry.get("b.com")
+
+def test_probe_success_closes_the_breaker():
+    breaker = open_breaker(cooldown=0)
+    async def scenario():
+        scheduler = retry.RetryScheduler(["a", "b"], POLICY, breaker)
+        assert await scheduler.next() == "a"
+        assert breaker.state == circuit.HALF_OPEN
+        scheduler.done("a")
+        assert breaker.state == circuit.CLOSED
+        assert await scheduler.next() == "b"
+    run(scenario())
+
+def test_hand_back_releases_the_probe_for_the_next_scheduler():
+    breaker = open_breaker(cooldown=0)
+    async def scenario():
+        # HTTP engine gets the probe, hits a bot check and hands its links to the browser
+        http = retry.RetryScheduler(["a", "b"], POLICY, breaker)
+        probe = await http.next()
+        http.hand_back(probe)
+        http.stop(retry.CHALLENGE)
+        assert breaker.state == circuit.OPEN
+        assert http.remaining() == ["a", "b"]
+
+        browser = retry.RetryScheduler(http.remaining(), POLICY, breaker)
+        assert await browser.next() == "a"
+        assert breaker.state == circuit.HALF_OPEN
+    run(scenario())
+
+def test_cancel_releases_the_probe():
+    breaker = open_breaker(cooldown=0)
+    async def scenario():
+        scheduler = retry.RetryScheduler(["a"], POLICY, breaker)
+        scheduler.hand_back(await scheduler.next())
+        scheduler.stop("cancelled")
+        assert breaker.state == circuit.OPEN
+        assert await retry.RetryScheduler(["a"], POLICY, breaker).next() == "a"
+    run(scenario())
+
+def test_release_probe_frees_a_probe_never_reported():
+    breaker = open_breaker(cooldown=0)
+    async def scenario():
+        scheduler = retry.RetryScheduler(["a", "b"], POLICY, breaker)
+        await scheduler.next()
+        scheduler.stop("error")
+        scheduler.release_probe()
+        assert breaker.state == circuit.OPEN
+        # Releasing a scheduler that holds no probe leaves the breaker alone
+        other = retry.RetryScheduler(["c"], POLICY, breaker)
+        assert await other.next() == "c"
+        scheduler.release_probe()
+        assert breaker.state == circuit.HALF_OPEN
+    run(scenario())
+
+def test_next_does_not_wait_forever_on_a_lost_probe():
+    breaker = circuit.CircuitBreaker("example.com", failure_threshold=1, cooldown=0, probe_timeout=0.2)
+    breaker.record_failure("goto_submit")
+    assert breaker.allow()  # a probe that will never be reported
+    async def scenario():
+        started = time.monotonic()
+        assert await retry.RetryScheduler(["a"], POLICY, breaker).next() == "a"
+        return time.monotonic() - started
+    assert run(scenario()) >= 0.2
+
+def test_breaker_open_past_max_wait_stops_the_scheduler():
+    breaker = circuit.CircuitBreaker("example.com", failure_threshold=1, cooldown=600)
+    breaker.record_failure("goto_submit")
+    async def scenario():
+        scheduler = retry.RetryScheduler(["a", "b"], retry.RetryPolicy(max_breaker_wait=60), breaker)
+        assert await scheduler.next() is None
+        assert scheduler.stopped == retry.BREAKER_OPEN
+        assert scheduler.remaining() == ["a", "b"]
+    run(scenario())
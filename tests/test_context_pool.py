@@ -0,0 +1,150 @@
+import asyncio
+
+import antigravity as ag
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+
+class FakeContext:
+    def __init__(self, browser, options):
+        self.browser = browser
+        self.options = options
+        self.pages = []
+        self.closed = False
+
+    async def new_page(self):
+        page = FakePage()
+        self.pages.append(page)
+        return page
+
+    async def close(self):
+        self.closed = True
+
+
+def make_pool(**settings):
+    browser = FakeBrowser()
+    contexts = []
+
+    async def new_context(**options):
+        contexts.append(FakeContext(browser, options))
+        return contexts[-1]
+
+    return ag.ContextPool(new_context, **settings), browser, contexts
+
+
+def run(coroutine, timeout=2.0):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout))
+
+
+def test_released_context_is_reused_warm_with_its_page():
+    pool, _, contexts = make_pool()
+
+    async def scenario():
+        first = await pool.acquire("a", storage_state="a.json")
+        page = await first.page()
+        await pool.release(first)
+
+        again = await pool.acquire("a", storage_state="ignored.json")
+        assert again is first and again.warm
+        assert await again.page() is page
+        other = await pool.acquire("b")
+        assert other.context is not first.context and not other.warm
+
+    run(scenario())
+    assert contexts[0].options == {"storage_state": "a.json"}
+    assert pool.stats["created"] == 2 and pool.stats["reused"] == 1
+
+
+def test_release_without_keep_closes_the_context():
+    pool, _, contexts = make_pool()
+
+    async def scenario():
+        await pool.release(await pool.acquire("a"), keep=False)
+        await pool.acquire("a")
+
+    run(scenario())
+    assert contexts[0].closed
+    assert pool.stats["created"] == 2
+
+
+def test_pages_are_replaced_after_page_max_uses():
+    pool, _, contexts = make_pool(page_max_uses=2)
+
+    async def scenario():
+        pooled = await pool.acquire("a")
+        page = await pooled.page()
+        assert await pooled.used(page) is page
+        replacement = await pooled.used(page)
+        assert replacement is not page and page.closed
+        pooled.recycle_pages()
+        assert await pooled.used(replacement) is not replacement
+
+    run(scenario())
+    assert pool.stats["pages_recycled"] == 2
+
+
+def test_worn_out_or_disconnected_contexts_are_not_reused():
+    pool, browser, contexts = make_pool(context_max_uses=2)
+
+    async def scenario():
+        pooled = await pool.acquire("a")
+        page = await pooled.page()
+        page = await pooled.used(page)
+        await pooled.used(page)
+        await pool.release(pooled)
+        assert contexts[0].closed
+
+        pooled = await pool.acquire("a")
+        await pool.release(pooled)
+        browser.connected = False
+        assert await pool.acquire("a") is not pooled
+
+    run(scenario())
+    assert contexts[1].closed
+
+
+def test_full_pool_closes_the_least_recently_used_idle_context():
+    pool, _, contexts = make_pool(min_size=0, max_size=2)
+
+    async def scenario():
+        a = await pool.acquire("a")
+        b = await pool.acquire("b")
+        await pool.release(a)
+        await pool.release(b)
+        await pool.acquire("c")
+
+    run(scenario())
+    assert [context.closed for context in contexts] == [True, False, False]
+
+
+def test_acquire_waits_for_a_busy_context_when_full():
+    pool, _, contexts = make_pool(max_size=1)
+
+    async def scenario():
+        a = await pool.acquire("a")
+        waiting = asyncio.ensure_future(pool.acquire("b"))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        await pool.release(a)
+        b = await waiting
+        assert b.key == "b"
+
+    run(scenario())
+    assert contexts[0].closed
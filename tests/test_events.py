@@ -0,0 +1,61 @@
+import events
+
+
+def test_since_returns_newer_events_of_the_batch():
+    bus = events.EventBus()
+    for i in range(3):
+        bus.publish("b1", "a", events.DONE, url=f"u{i}")
+    bus.publish("b2", "a", events.DONE, url="other")
+
+    assert [event.url for event in bus.since(1)] == ["u1", "u2", "other"]
+    assert [event.url for event in bus.since(0, batch_id="b1")] == ["u0", "u1", "u2"]
+    assert bus.since(bus.last_seq) == []
+
+
+def test_since_skips_what_the_ring_buffer_dropped():
+    bus = events.EventBus(size=3)
+    for i in range(5):
+        bus.publish("b1", "a", events.DONE, url=f"u{i}")
+
+    assert [event.seq for event in bus.since(0)] == [3, 4, 5]
+    assert [event.seq for event in bus.since(3)] == [4, 5]
+
+
+def test_board_folds_events_into_site_rows():
+    bus = events.EventBus()
+    bus.publish("old", "a", events.DONE)
+    board = events.SiteBoard(bus, batch_id="b1")
+    bus.publish("b1", "a", events.SESSION, count=4)
+    bus.publish("b1", "a", events.STEP, step="fill_title")
+    bus.publish("b1", "a", events.DONE, url="u1")
+    bus.publish("b1", "a", events.RETRY, url="u2")
+    bus.publish("b1", "a", events.FAILED, url="u2")
+    bus.publish("b1", "b", events.SESSION, count=2)
+    bus.publish("b1", "b", events.DEFERRED, count=2)
+    bus.publish("b2", "a", events.DONE, url="elsewhere")
+
+    assert board.update() == 7
+    assert board.update() == 0
+    rows = {row["Site"]: row for row in board.rows()}
+
+    assert (rows["a"]["Done"], rows["a"]["Failed"], rows["a"]["Retries"], rows["a"]["Left"]) == (1, 1, 1, 2)
+    assert rows["a"]["Now"] == "fill_title"
+    assert (rows["b"]["Deferred"], rows["b"]["Left"], rows["b"]["ETA"]) == (2, 0, "done")
+    assert board.totals() == (4, 6)
+
+
+def test_failing_step_is_flagged():
+    bus = events.EventBus()
+    board = events.SiteBoard(bus)
+    bus.publish("b1", "a", events.SESSION, count=1)
+    bus.publish("b1", "a", events.ERROR, step="submit_form")
+
+    board.update()
+
+    assert board.rows()[0]["Now"] == "submit_form ⚠️"
+
+
+def test_duration():
+    assert events._duration(42) == "42s"
+    assert events._duration(125) == "2m 05s"
+    assert events._duration(3 * 3600 + 60) == "3h 01m"
@@ -0,0 +1,15 @@
+import history
+
+def test_normalize_url_drops_scheme_default_port_tracking_and_fragment():
+    assert history.normalize_url("HTTPS://Example.com:443/a/?utm_source=x&b=2&a=1#top") == "example.com/a?a=1&b=2"
+    assert history.normalize_url("http://example.com/a") == history.normalize_url("https://example.com/a/")
+    assert history.normalize_url("example.com:8080/a?fbclid=1") == "example.com:8080/a"
+
+def test_normalize_url_keeps_unparseable_links_as_their_own_key():
+    assert history.normalize_url(" http://bad.com:abc/ ") == "http://bad.com:abc/"
+    assert history.normalize_url("http://[::1/") == "http://[::1/"
+    assert history.normalize_url("http://example.com:99999/") == "http://example.com:99999/"
+
+def test_unique_keeps_first_occurrence_and_survives_malformed_links():
+    urls = ["https://a.com/x?utm_medium=y", "http://a.com/x", "http://bad.com:abc/", "http://[::1/", "http://bad.com:abc/"]
+    assert history.unique(urls) == ["https://a.com/x?utm_medium=y", "http://bad.com:abc/", "http://[::1/"]
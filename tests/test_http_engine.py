@@ -0,0 +1,130 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import http_engine
+import retry
+
+
+class FakeResponse:
+    def __init__(self, text="", status_code=200, path="/", headers=None, cookies=None):
+        self.text = text
+        self.status_code = status_code
+        self.url = SimpleNamespace(path=path)
+        self.headers = {"content-type": "text/html", **(headers or {})}
+        self.cookies = cookies or {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeClient:
+    """
+    Answers requests from a list, recording what was sent.
+    """
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sent = []
+
+    async def request(self, method, path, **kwargs):
+        self.sent.append((method, path, kwargs))
+        return self.responses.pop(0)
+
+
+def engine_for(flows, responses):
+    # The engine without its httpx client, so the flow logic runs without the network
+    engine = object.__new__(http_engine.HttpSiteEngine)
+    engine.flows = flows
+    engine.client = FakeClient(responses)
+    return engine
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_form_fields_reads_inputs_meta_textarea_and_selected_option():
+    fields = http_engine.form_fields(
+        '<meta name="csrf-token" content="m1"><form><input name="_token" value="t1">'
+        '<textarea name="about">hi there</textarea>'
+        '<select name="cat"><option value="1">a</option><option value="2" selected>b</option></select>'
+    )
+    assert fields == {"csrf-token": "m1", "_token": "t1", "about": "hi there", "cat": "2"}
+
+
+def test_extract_specs():
+    response = FakeResponse('{"data": {"ids": [7, 8]}}', cookies={"XSRF-TOKEN": "a%3Db"})
+    assert http_engine.extract("json:data.ids.1", response, {}) == "8"
+    assert http_engine.extract("cookie:XSRF-TOKEN", response, {}) == "a=b"
+    assert http_engine.extract("re:ids\": \\[(\\d+)", response, {}) == "7"
+    assert http_engine.extract("_token", response, {"_token": "t"}) == "t"
+    assert http_engine.extract("json:missing", response, {}) is None
+
+
+def test_is_challenge():
+    assert http_engine.is_challenge(FakeResponse(status_code=403, headers={"server": "cloudflare"}))
+    assert http_engine.is_challenge(FakeResponse("<title>Just a moment...</title>"))
+    assert not http_engine.is_challenge(FakeResponse("<form></form>"))
+
+
+def test_flow_carries_extracted_values_into_later_requests():
+    flows = {"submit": [
+        {"name": "form", "path": "/submit", "extract": {"csrf": "_token"}},
+        {"name": "post", "method": "POST", "path": "/submit", "form": {"_token": "{csrf}", "url": "{url}"},
+         "expect_text": "Thanks"},
+    ]}
+    engine = engine_for(flows, [
+        FakeResponse('<input name="_token" value="abc">', path="/submit"),
+        FakeResponse("Thanks for sharing", path="/story/1"),
+    ])
+
+    values = run(engine.submit({"url": "https://example.com/a"}))
+
+    assert values["csrf"] == "abc"
+    assert engine.client.sent[1][0] == "POST"
+    assert engine.client.sent[1][2]["data"] == {"_token": "abc", "url": "https://example.com/a"}
+
+
+@pytest.mark.parametrize("response, kind", [
+    (FakeResponse(path="/login"), retry.SESSION_LOST),
+    (FakeResponse(status_code=502), retry.SITE_DOWN),
+    (FakeResponse(status_code=422), retry.FORM_NOT_REVEALED),
+    (FakeResponse("no luck"), retry.FORM_NOT_REVEALED),
+])
+def test_check_classifies_unmet_expectations(response, kind):
+    flows = {"submit": [{"name": "post", "method": "POST", "expect_status": [200, 302],
+                         "expect_text": "Thanks", "fail_as": retry.FORM_NOT_REVEALED}]}
+
+    with pytest.raises(retry.SubmissionError) as info:
+        run(engine_for(flows, [response]).submit({}))
+
+    assert info.value.kind == kind
+    assert info.value.step == "http_post"
+
+
+def test_bot_check_hands_over_to_the_browser():
+    engine = engine_for({"login": [{"name": "page", "path": "/login"}]}, [FakeResponse("cf-chl-bypass")])
+
+    with pytest.raises(http_engine.ChallengeDetected) as info:
+        run(engine.log_in({}))
+
+    assert info.value.step == "http_page"
+
+
+def test_login_pages_before_the_last_request_may_sit_on_login():
+    flows = {"login": [
+        {"name": "page", "path": "/login", "extract": {"csrf": "_token"}},
+        {"name": "post", "method": "POST", "path": "/login", "form": {"_token": "{csrf}"}},
+    ]}
+    engine = engine_for(flows, [
+        FakeResponse('<input name="_token" value="x">', path="/login"),
+        FakeResponse(path="/login"),
+    ])
+
+    with pytest.raises(retry.SubmissionError) as info:
+        run(engine.log_in({}))
+
+    assert info.value.kind == retry.SESSION_LOST
+    assert info.value.step == "http_post"
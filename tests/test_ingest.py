@@ -0,0 +1,24 @@
+import ingest
+
+def run(lines):
+    stats = ingest.IngestStats()
+    return list(ingest.unique_urls(ingest.valid_urls(lines, stats), stats)), stats
+
+def test_valid_urls_counts_malformed_lines_as_invalid():
+    urls, stats = run(["http://bad.com:abc/", "http://[::1/", "http://x.com:99999/", "https://ok.com/a", "ftp://ok.com/b", "not a link"])
+    assert urls == ["https://ok.com/a"]
+    assert stats.read == 6
+    assert stats.invalid == 5
+
+def test_bare_www_links_get_https_and_repeats_are_dropped():
+    urls, stats = run(["www.example.com/a", "<https://www.example.com/a/>", "\"https://www.example.com/b\""])
+    assert urls == ["https://www.example.com/a", "https://www.example.com/b"]
+    assert stats.duplicates == 1
+
+def test_pipeline_streams_a_text_file_in_chunks(tmp_path):
+    source = tmp_path / "links.txt"
+    source.write_text("\n".join(["https://a.com/1", "http://bad.com:abc/", "https://a.com/2", "https://a.com/1", "https://a.com/3"]))
+    stats = ingest.IngestStats()
+    chunks = list(ingest.pipeline(str(source), stats, chunk_size=2))
+    assert chunks == [["https://a.com/1", "https://a.com/2"], ["https://a.com/3"]]
+    assert (stats.invalid, stats.duplicates) == (1, 1)
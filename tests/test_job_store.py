@@ -0,0 +1,86 @@
+import time
+import pytest
+import job_store as jobs
+
+SITE = "https://www.example-bookmarks.com"
+URLS = [f"https://example.com/articles/{i}" for i in range(5)]
+
+@pytest.fixture
+def store(tmp_path):
+    store = jobs.JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+def finish(store, batch_id, urls):
+    for url in urls:
+        store.mark_done(batch_id, url, SITE)
+    store.finish_if_complete(batch_id)
+
+def age_history(store, days):
+    store._execute("UPDATE history SET submitted_at = submitted_at - ?", (days * 86400,))
+
+def test_create_batch_resumes_an_interrupted_batch(store):
+    batch_id = store.create_batch(URLS, [SITE])
+    store.mark_done(batch_id, URLS[0], SITE)
+    assert store.create_batch(URLS, [SITE]) == batch_id
+    assert store.pending_urls(batch_id, SITE) == URLS[1:]
+
+def test_finished_batch_created_again_restarts(store):
+    batch_id = store.create_batch(URLS, [SITE])
+    finish(store, batch_id, URLS)
+    assert store.batch_state(batch_id) == jobs.FINISHED
+
+    assert store.create_batch(URLS, [SITE]) == batch_id
+    assert store.batch_state(batch_id) == jobs.RUNNING
+    assert store.pending_urls(batch_id, SITE) == URLS
+
+def test_restart_skips_links_inside_the_resubmit_window(store):
+    batch_id = store.create_batch(URLS, [SITE])
+    finish(store, batch_id, URLS)
+    store.create_batch(URLS, [SITE])
+    assert sorted(store.skip_submitted(batch_id, SITE, 30 * 86400)) == sorted(URLS)
+    assert store.pending_urls(batch_id, SITE) == []
+
+def test_restart_resubmits_links_past_the_resubmit_window(store):
+    batch_id = store.create_batch(URLS, [SITE])
+    finish(store, batch_id, URLS)
+    age_history(store, 31)
+    store.create_batch(URLS, [SITE])
+    assert store.skip_submitted(batch_id, SITE, 30 * 86400) == []
+    assert store.pending_urls(batch_id, SITE) == URLS
+    # None means never resubmit
+    assert len(store.skip_submitted(batch_id, SITE, None)) == len(URLS)
+
+def test_skip_submitted_only_looks_at_the_given_chunk(store):
+    earlier = store.create_batch(URLS, [SITE])
+    finish(store, earlier, URLS)
+    batch_id = store.create_batch(URLS + ["https://example.com/new"], [SITE], batch_id="other")
+    chunk = store.pending_urls(batch_id, SITE, limit=2)
+    assert store.skip_submitted(batch_id, SITE, 86400, chunk) == chunk
+    assert store.batch_status(batch_id)[jobs.SKIPPED] == 2
+    # Normalized keys match: the tracking parameter does not make it a new link
+    store.add_tasks(batch_id, [URLS[3] + "?utm_source=feed"], [SITE])
+    assert store.skip_submitted(batch_id, SITE, 86400, [URLS[3] + "?utm_source=feed"]) == [URLS[3] + "?utm_source=feed"]
+
+def test_defer_leaves_finished_tasks_alone(store):
+    batch_id = store.create_batch(URLS[:3], [SITE])
+    store.mark_done(batch_id, URLS[0], SITE)
+    store.mark_failed(batch_id, URLS[1], SITE, "other at confirmation")
+    store.defer(batch_id, SITE, URLS[:3], "session failed")
+    results = store.task_results(batch_id, SITE)
+    assert [results[url][0] for url in URLS[:3]] == [jobs.DONE, jobs.FAILED, jobs.DEFERRED]
+    assert store.finished_tasks(batch_id, SITE) == 2
+
+def test_claims_keep_a_site_to_one_worker(store):
+    batch_id = store.enqueue_batch(URLS, [{"url": SITE, "username": "u", "password": "p"}])
+    assert store.claim_site("w1") == (batch_id, SITE)
+    assert store.claim_site("w2") is None
+    assert not store.claim(batch_id, SITE, "w2")
+    store.release_claim(batch_id, SITE)
+    assert store.claim(batch_id, SITE, "w2")
+
+def test_deferred_tasks_wait_before_they_are_claimable(store):
+    batch_id = store.enqueue_batch(URLS[:1], [{"url": SITE, "username": "u", "password": "p"}])
+    store.defer(batch_id, SITE, URLS[:1], "circuit open")
+    assert store.claim_site("w1") is None
+    assert store.claim_site("w1", deferred_after=-1) == (batch_id, SITE)
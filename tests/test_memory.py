@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import antigravity as ag
+import memory
+
+MB = 1_000_000
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    # Browser process tree size the governor sees, in bytes
+    current = {"value": 0}
+    monkeypatch.setattr(ag, "process_tree_rss", lambda: current["value"])
+    return current
+
+
+def governor():
+    return memory.MemoryGovernor(budget_mb=1000, high_water=0.8, shed_water=0.9, sample_interval=60)
+
+
+def test_try_admit_reserves_pages_until_the_high_water_mark(rss):
+    rss["value"] = 500 * MB
+    gov = governor()
+    gov.site_costs["a"] = 100 * MB
+
+    assert gov.try_admit("a")
+    assert gov.try_admit("a")
+    assert gov.try_admit("a")
+    # 500 MB used + 300 MB reserved reaches the 800 MB high-water mark
+    assert not gov.try_admit("a")
+    assert gov.stats["pages_denied"] == 1
+
+
+def test_unmeasured_sites_cost_the_default(rss):
+    rss["value"] = 800 * MB - memory.DEFAULT_PAGE_MB * MB
+    gov = governor()
+
+    assert gov.try_admit("new")
+    assert not gov.try_admit("new")
+
+
+def test_a_new_sample_drops_the_reservations(rss):
+    rss["value"] = 700 * MB
+    gov = governor()
+    gov.site_costs["a"] = 100 * MB
+
+    assert gov.try_admit("a")
+    assert not gov.try_admit("a")
+    # The next sample sees the admitted page in the process tree (or not at all)
+    gov.sample_interval = -1
+    rss["value"] = 600 * MB
+    assert gov.try_admit("a")
+
+
+def test_no_budget_admits_everything(rss):
+    rss["value"] = 10_000 * MB
+    gov = memory.MemoryGovernor(budget_mb=0)
+
+    assert gov.try_admit("a")
+    assert gov.suggested_pages("a") is None
+    assert not gov.over_shed_water()
+
+
+def test_suggested_pages_use_the_site_cost(rss):
+    rss["value"] = 400 * MB
+    gov = governor()
+    gov.site_costs["a"] = 150 * MB
+
+    assert gov.suggested_pages("a") == 2
+    assert gov.suggested_pages() == 2
+
+
+def test_admit_does_not_wait_when_nothing_else_runs(rss):
+    rss["value"] = 2000 * MB
+    gov = governor()
+
+    asyncio.run(asyncio.wait_for(gov.admit("a", busy=0), 1.0))
+
+    assert gov.stats["waits"] == 0
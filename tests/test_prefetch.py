@@ -0,0 +1,111 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import prefetch
+
+PAGE = (b'<html><head><title> Example   article </title>'
+        b'<meta name="description" content="About the article">'
+        b'<meta name="keywords" content="news, tech,"></head><body>...</body></html>')
+
+
+def test_parse_head():
+    title, description, keywords = prefetch.parse_head(PAGE.decode())
+    assert title == "Example article"
+    assert description == "About the article"
+    assert keywords == ["news", "tech"]
+
+
+def test_parse_head_falls_back_to_open_graph_and_article_tags():
+    title, description, keywords = prefetch.parse_head(
+        '<meta property="og:title" content="OG title"><meta property="og:description" content="OG text">'
+        '<meta property="article:tag" content="a"><meta property="article:tag" content="b">'
+    )
+    assert (title, description, keywords) == ("OG title", "OG text", ["a", "b"])
+    assert prefetch.parse_head("") == ("", "", [])
+
+
+def entry(url, status, error=None):
+    return prefetch._result(url, status, url, error=error)
+
+
+def test_dead_links():
+    results = {"a": entry("a", 200), "b": entry("b", 404), "c": entry("c", 403), "d": entry("d", None, "ConnectError")}
+    assert prefetch.dead_links(results) == {"b", "d"}
+
+
+def test_nothing_is_dropped_when_no_link_was_reachable():
+    results = {url: entry(url, None, "ConnectError") for url in ("a", "b")}
+    assert prefetch.dead_links(results) == set()
+
+
+def test_by_host_interleaves_hosts():
+    urls = ["https://a.com/1", "https://a.com/2", "https://a.com/3", "https://b.com/1", "not a url"]
+    assert prefetch._by_host(urls) == ["https://a.com/1", "https://b.com/1", "not a url", "https://a.com/2", "https://a.com/3"]
+
+
+@pytest.fixture
+def server():
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def answer(self):
+            requests.append((self.command, self.path))
+            if self.path == "/gone":
+                self.send_response(404)
+                self.end_headers()
+                return
+            if self.path == "/no-head" and self.command == "HEAD":
+                self.send_response(405)
+                self.end_headers()
+                return
+            html = self.path != "/file.pdf"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8" if html else "application/pdf")
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            if self.command == "GET":
+                self.wfile.write(PAGE)
+
+        do_HEAD = do_GET = answer
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_prefetch_reads_the_head_only_of_live_html_pages(server):
+    base, requests = server
+    urls = [f"{base}/page", f"{base}/gone", f"{base}/file.pdf", f"{base}/no-head"]
+
+    results = asyncio.run(prefetch.prefetch(urls, concurrency=2))
+
+    assert set(results) == set(urls)
+    assert results[f"{base}/page"].title == "Example article"
+    assert results[f"{base}/no-head"].title == "Example article"
+    assert not results[f"{base}/gone"].alive
+    assert results[f"{base}/file.pdf"].alive
+    gets = sorted(path for method, path in requests if method == "GET")
+    assert gets == ["/no-head", "/page"]
+
+
+def test_prefetch_uses_the_cache(server, tmp_path):
+    base, requests = server
+    cache = prefetch.MetadataCache(str(tmp_path / "metadata.db"))
+    try:
+        asyncio.run(prefetch.prefetch([f"{base}/page"], cache=cache))
+        requests.clear()
+        results = asyncio.run(prefetch.prefetch([f"{base}/page"], cache=cache))
+    finally:
+        cache.close()
+
+    assert results[f"{base}/page"].description == "About the article"
+    assert requests == []
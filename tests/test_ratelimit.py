@@ -0,0 +1,77 @@
+import pytest
+
+import ratelimit
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_success_raises_rate_and_window_up_to_the_caps(clock):
+    limiter = ratelimit.DomainLimiter("a", initial_rate=1.0, max_rate=1.25, max_window=4, increase=0.1)
+    limiter.window = 2.0
+
+    limiter.success()
+    assert limiter.rate == pytest.approx(1.1)
+    assert limiter.window == pytest.approx(2.5)
+
+    for _ in range(20):
+        limiter.success()
+    assert limiter.rate == 1.25
+    assert limiter.window == 4
+
+
+def test_throttle_halves_once_per_cooldown(clock):
+    limiter = ratelimit.DomainLimiter("a", initial_rate=2.0, max_window=8, cooldown=5.0)
+
+    limiter.throttle("rate_limited")
+    limiter.throttle("rate_limited")
+    assert limiter.rate == 1.0
+    assert limiter.window == 4.0
+    assert limiter.throttles == {"rate_limited": 2}
+
+    clock.now += 5.0
+    limiter.throttle("challenge")
+    assert limiter.rate == 0.5
+    assert limiter.window == 2.0
+
+
+def test_throttle_keeps_the_floors(clock):
+    limiter = ratelimit.DomainLimiter("a", initial_rate=0.15, min_rate=0.1, max_window=1, cooldown=0.0)
+
+    for _ in range(5):
+        clock.now += 1.0
+        limiter.throttle("challenge")
+
+    assert limiter.rate == 0.1
+    assert limiter.window == 1.0
+
+
+def test_reserve_spaces_slots_and_honours_pause(clock):
+    limiter = ratelimit.DomainLimiter("a", initial_rate=2.0)
+
+    assert limiter.reserve() == 0.0
+    assert limiter.reserve() == pytest.approx(0.5)
+
+    limiter.throttle("rate_limited", pause=30)
+    assert limiter.reserve() == pytest.approx(30.0)
+
+
+def test_registry_keeps_one_limiter_per_key():
+    registry = ratelimit.LimiterRegistry()
+    first = registry.get("a", initial_rate=3.0)
+
+    assert registry.get("a") is first
+    assert registry.get("b") is not first
+    assert set(registry.snapshot()) == {"a", "b"}
@@ -0,0 +1,58 @@
+import record
+
+SITE = "https://www.bookmarks.example"
+LOGIN_TOKEN = "LoginToken0123456789abcdef"
+SUBMIT_TOKEN = "SubmitToken0123456789abcdef"
+META = {
+    "site_url": SITE,
+    "submit_url": f"{SITE}/submit",
+    "username": "bench",
+    "values": {"url": "https://example.com/articles/1", "title": "Example article", "description": "About it", "tags": "news"},
+}
+
+def entry(method, path, status=200, html=None, form=None, redirect=None, resource="document"):
+    request = {"method": method, "url": SITE + path, "headers": []}
+    if form is not None:
+        request["postData"] = {
+            "mimeType": "application/x-www-form-urlencoded",
+            "params": [{"name": name, "value": value} for name, value in form.items()],
+        }
+    response = {"status": status, "content": {"mimeType": "text/html", "text": html or ""}, "cookies": []}
+    if redirect:
+        response["redirectURL"] = redirect
+    return {"request": request, "response": response, "_resourceType": resource}
+
+def hidden_token(token):
+    return f'<form><input type="hidden" name="_token" value="{token}"></form>'
+
+ENTRIES = [
+    entry("GET", "/login", html=hidden_token(LOGIN_TOKEN)),
+    entry("GET", "/logo.png", resource="image"),
+    entry("POST", "/login", 302, form={"_token": LOGIN_TOKEN, "username": "bench", "password": "pw"}, redirect="/dashboard"),
+    entry("GET", "/dashboard"),
+    entry("GET", "/submit", html=hidden_token(SUBMIT_TOKEN)),
+    entry("POST", "/submit", 302, form={"_token": SUBMIT_TOKEN, "url": "https://example.com/articles/1", "title": "Example article"},
+          redirect="/submitted"),
+    entry("GET", "/submitted"),
+]
+
+def test_derive_flow_turns_values_and_tokens_into_placeholders():
+    flow, warnings = record.derive_flow([dict(e) for e in ENTRIES], META)
+    assert warnings == []
+
+    get_login, post_login = flow["login"]
+    assert get_login["extract"] == {"csrf": "_token"}
+    assert post_login["form"] == {"_token": "{csrf}", "username": "{username}", "password": "{password}"}
+    # The redirect hop to /dashboard is followed, so its status is the one expected
+    assert post_login["expect_status"] == [200]
+
+    get_submit, post_submit = flow["submit"]
+    assert get_submit["path"] == "/submit"
+    assert get_submit["extract"] == {"csrf": "_token"}
+    assert post_submit["form"] == {"_token": "{csrf}", "url": "{url}", "title": "{title}"}
+
+def test_derive_flow_warns_when_no_request_carries_the_link():
+    meta = dict(META, values=dict(META["values"], url="https://example.com/other"))
+    flow, warnings = record.derive_flow([dict(e) for e in ENTRIES], meta)
+    assert flow["submit"] == []
+    assert any("no request carries" in warning for warning in warnings)
@@ -0,0 +1,42 @@
+import asyncio
+import pytest
+
+import retry
+
+POLICY = retry.RetryPolicy(base_delays={kind: 0.0 for kind in (retry.TIMEOUT, retry.SESSION_LOST, retry.SITE_DOWN, retry.OTHER)}, jitter=0)
+
+def run(coroutine, timeout=2.0):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout))
+
+def test_classify():
+    assert retry.classify(Exception("net::ERR_CONNECTION_REFUSED at https://a.com"), "login_page").kind == retry.SITE_DOWN
+    assert retry.classify(retry.SubmissionError(retry.FORM_NOT_REVEALED, "no form"), "reveal_form").kind == retry.FORM_NOT_REVEALED
+    assert retry.classify(Exception("boom"), "relogin").kind == retry.SESSION_LOST
+    assert retry.classify(Exception("boom"), "fill_title").kind == retry.OTHER
+
+def test_classify_timeouts_by_step():
+    timeout = retry.PlaywrightTimeoutError("Timeout 30000ms exceeded")
+    assert retry.classify(timeout, "goto_submit").kind == retry.SITE_DOWN
+    assert retry.classify(timeout, "reveal_form") == retry.Failure(retry.TIMEOUT, "reveal_form", "Timeout 30000ms exceeded")
+
+@pytest.mark.parametrize("status, kind", [
+    (200, None), (302, None), (419, retry.SESSION_LOST), (429, retry.TIMEOUT), (422, retry.OTHER), (503, retry.SITE_DOWN),
+])
+def test_status_failure(status, kind):
+    error = retry.status_failure(status, "confirmation")
+    assert (error.kind if error else None) == kind
+    if error:
+        assert retry.classify(error, "confirmation").step == "confirmation"
+
+def test_failed_urls_are_retried_after_fresh_ones_then_given_up():
+    async def scenario():
+        scheduler = retry.RetryScheduler(["a", "b"], POLICY)
+        first = await scheduler.next()
+        assert scheduler.done(first, retry.Failure(retry.TIMEOUT, "submit_form", "slow"))[0] == retry.RETRY
+        assert await scheduler.next() == "b"
+        scheduler.done("b")
+        assert await scheduler.next() == "a"
+        assert scheduler.attempt("a") == 2
+        assert scheduler.done("a", retry.Failure(retry.OTHER, "confirmation", "HTTP 422"))[0] == retry.GIVE_UP
+        assert await scheduler.next() is None
+    run(scenario())
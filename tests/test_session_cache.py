@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+import time
+import session_cache
+
+SITE = "https://www.bookmarks.example/"
+
+class FakeContext:
+    def __init__(self, state=None, error=None):
+        self.state = state or {"cookies": [{"name": "sid", "value": "1"}], "origins": []}
+        self.error = error
+
+    async def storage_state(self, path=None):
+        if self.error:
+            raise self.error
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        return self.state
+
+def test_saved_session_loads_for_the_same_site_and_user(tmp_path):
+    cache = session_cache.SessionCache(str(tmp_path))
+    assert cache.load(SITE, "alice") is None
+    asyncio.run(cache.save(FakeContext(), SITE, "alice"))
+    path = cache.load("https://www.BOOKMARKS.example", "alice")
+    assert path is not None and json.load(open(path))["cookies"][0]["name"] == "sid"
+    assert cache.load(SITE, "bob") is None
+
+def test_expired_session_is_dropped(tmp_path):
+    cache = session_cache.SessionCache(str(tmp_path), ttl=60)
+    asyncio.run(cache.save(FakeContext(), SITE, "alice"))
+    path = cache.path_for(SITE, "alice")
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert cache.load(SITE, "alice") is None
+    assert not os.path.exists(path)
+
+def test_truncated_session_is_dropped(tmp_path):
+    cache = session_cache.SessionCache(str(tmp_path))
+    os.makedirs(tmp_path, exist_ok=True)
+    with open(cache.path_for(SITE, "alice"), "w") as f:
+        f.write('{"cookies": [')
+    assert cache.load(SITE, "alice") is None
+
+def test_failed_save_keeps_nothing(tmp_path):
+    cache = session_cache.SessionCache(str(tmp_path))
+    asyncio.run(cache.save(FakeContext(error=RuntimeError("context closed")), SITE, "alice"))
+    assert cache.load(SITE, "alice") is None
+
+def test_invalidate(tmp_path):
+    cache = session_cache.SessionCache(str(tmp_path))
+    asyncio.run(cache.save(FakeContext(), SITE, "alice"))
+    cache.invalidate(SITE, "alice")
+    cache.invalidate(SITE, "alice")
+    assert cache.load(SITE, "alice") is None
@@ -0,0 +1,44 @@
+import shard
+
+
+def sites(*names):
+    return [{"url": f"https://{name}.example", "username": "u", "password": "p"} for name in names]
+
+
+def urls(shards):
+    return [[site["url"] for site in group] for group in shards]
+
+
+def test_never_more_shards_than_sites():
+    assert len(shard.shard_sites(sites("a", "b"), 8)) == 2
+    assert len(shard.shard_sites(sites("a", "b", "c"), 0)) == 1
+    assert shard.shard_sites([], 4) == []
+
+
+def test_every_site_goes_to_exactly_one_shard():
+    configs = sites(*"abcdefg")
+    shards = shard.shard_sites(configs, 3)
+    assigned = [url for group in urls(shards) for url in group]
+    assert sorted(assigned) == sorted(site["url"] for site in configs)
+    assert sorted(map(len, shards)) == [2, 2, 3]
+
+
+def test_light_http_sites_fill_in_around_browser_sites():
+    configs = sites("b1", "b2", "h1", "h2", "h3", "h4")
+    weights = {site["url"]: shard.HTTP_WEIGHT for site in configs if "//h" in site["url"]}
+
+    shards = shard.shard_sites(configs, 2, weights)
+
+    assert urls(shards) == [
+        ["https://b1.example", "https://h1.example", "https://h3.example"],
+        ["https://b2.example", "https://h2.example", "https://h4.example"],
+    ]
+
+
+def test_a_heavy_site_gets_a_shard_to_itself():
+    configs = sites("big", "s1", "s2", "s3")
+    weights = {"https://big.example": 3.0}
+
+    shards = shard.shard_sites(configs, 2, weights)
+
+    assert urls(shards) == [["https://big.example"], ["https://s1.example", "https://s2.example", "https://s3.example"]]
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+import tracing
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert tracing.percentile(values, 50) == 50
+    assert tracing.percentile(values, 95) == 95
+    assert tracing.percentile(values, 100) == 100
+    assert tracing.percentile([7], 99) == 7
+    assert tracing.percentile([], 50) == 0.0
+
+
+def test_summarize_groups_by_site_and_step():
+    records = [
+        {"site": "a", "step": "login", "duration": d, "status": "ok"} for d in (3.0, 1.0, 2.0)
+    ] + [
+        {"site": "a", "step": "submit", "duration": 5.0, "status": "error"},
+        {"site": "b", "step": "login", "duration": 4.0, "status": "ok"},
+    ]
+
+    summary = tracing.summarize(records)
+
+    assert summary[("a", "login")]["count"] == 3
+    assert summary[("a", "login")]["p50"] == 2.0
+    assert summary[("a", "login")]["max"] == 3.0
+    assert summary[("a", "login")]["total"] == 6.0
+    assert summary[("a", "submit")]["errors"] == 1
+    assert summary[("b", "login")]["count"] == 1
+
+
+def test_summarize_status_filter_still_counts_errors():
+    records = [
+        {"site": "a", "step": "submit", "duration": 1.0, "status": "ok"},
+        {"site": "a", "step": "submit", "duration": 30.0, "status": "error"},
+    ]
+
+    stats = tracing.summarize(records, status="ok")[("a", "submit")]
+
+    assert stats["count"] == 1
+    assert stats["max"] == 1.0
+    assert stats["errors"] == 1
+
+
+def test_span_records_errors_and_reloads(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = tracing.open_tracer(str(path))
+
+    async def run():
+        async with tracer.span("login", "a", url="u1"):
+            pass
+        with pytest.raises(ValueError):
+            async with tracer.span("submit", "a", url="u1"):
+                raise ValueError("boom")
+
+    asyncio.run(run())
+    tracer.close()
+
+    records = list(tracing.load(str(path)))
+    assert [r["status"] for r in records] == ["ok", "error"]
+    assert records[1]["error"] == "ValueError"
+    assert records[0]["end"] >= records[0]["start"]
@@ -0,0 +1,141 @@
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+# Set to a file path to trace every batch (the worker and the panel pick it up too)
+TRACE_FILE = os.getenv("BOOKMARK_TRACE_FILE")
+
+class Tracer:
+    """
+    Writes one JSON line per finished step: step, site, url, start/end timestamps,
+    duration and status. Safe to share between the pages and sites of a batch.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def emit(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    @asynccontextmanager
+    async def span(self, step, site, url=None, **fields):
+        record = {"step": step, "site": site, "url": url, "start": time.time(), **fields}
+        started = time.perf_counter()
+        try:
+            yield record
+            record["status"] = "ok"
+        except BaseException as e:
+            record["status"] = "error"
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            record["duration"] = round(time.perf_counter() - started, 4)
+            record["end"] = record["start"] + record["duration"]
+            self.emit(record)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class NullTracer:
+    """
+    Tracer stand-in used when tracing is off.
+    """
+    path = None
+
+    def emit(self, record):
+        pass
+
+    @asynccontextmanager
+    async def span(self, step, site, url=None, **fields):
+        yield {}
+
+    def close(self):
+        pass
+
+def open_tracer(path=None):
+    path = path or TRACE_FILE
+    return Tracer(path) if path else NullTracer()
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(records, status=None):
+    """
+    {(site, step): {"count", "p50", "p95", "p99", "max", "total", "errors"}} from trace records.
+    """
+    durations = {}
+    errors = {}
+    for record in records:
+        key = (record.get("site"), record["step"])
+        if record.get("status") == "error":
+            errors[key] = errors.get(key, 0) + 1
+        if status and record.get("status") != status:
+            continue
+        durations.setdefault(key, []).append(record["duration"])
+
+    summary = {}
+    for key in set(durations) | set(errors):
+        values = sorted(durations.get(key, []))
+        summary[key] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1] if values else 0.0,
+            "total": sum(values),
+            "errors": errors.get(key, 0),
+        }
+    return summary
+
+def format_summary(summary):
+    """
+    Text table, sites in order of total time spent and steps slowest first within a site.
+    """
+    site_totals = {}
+    for (site, _), stats in summary.items():
+        site_totals[site] = site_totals.get(site, 0.0) + stats["total"]
+
+    lines = [f"{'site':<32} {'step':<24} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'total':>9} {'err':>5}"]
+    for site in sorted(site_totals, key=site_totals.get, reverse=True):
+        steps = [(step, stats) for (s, step), stats in summary.items() if s == site]
+        for step, stats in sorted(steps, key=lambda item: item[1]["total"], reverse=True):
+            lines.append(
+                f"{str(site)[:32]:<32} {step[:24]:<24} {stats['count']:>6} {stats['p50']:>8.2f} {stats['p95']:>8.2f} "
+                f"{stats['p99']:>8.2f} {stats['max']:>8.2f} {stats['total']:>9.1f} {stats['errors']:>5}"
+            )
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python tracing.py", description="Latency breakdown of bot trace files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("summarize", help="p50/p95/p99 per step per site")
+    report.add_argument("trace_file")
+    report.add_argument("--ok-only", action="store_true", help="ignore durations of failed steps")
+    args = parser.parse_args(argv)
+
+    if args.command == "summarize":
+        print(format_summary(summarize(load(args.trace_file), status="ok" if args.ok_only else None)))
+
+if __name__ == "__main__":
+    main()
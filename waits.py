@@ -0,0 +1,108 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+from retry import PlaywrightTimeoutError
+
+class WaitTimer:
+    """
+    Accumulates how long each named step spent waiting, so slow steps are visible per site.
+    """
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+
+    @asynccontextmanager
+    async def measure(self, step):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(step, time.perf_counter() - started)
+
+    def add(self, step, seconds):
+        self.totals[step] = self.totals.get(step, 0.0) + seconds
+        self.counts[step] = self.counts.get(step, 0) + 1
+
+    def merge(self, other):
+        for step, seconds in other.totals.items():
+            self.totals[step] = self.totals.get(step, 0.0) + seconds
+            self.counts[step] = self.counts.get(step, 0) + other.counts[step]
+
+    def summary(self):
+        """
+        One-line breakdown, slowest step first: "goto_submit 3.2s (2x), reveal_form 1.1s (2x)".
+        """
+        steps = sorted(self.totals, key=self.totals.get, reverse=True)
+        return ", ".join(f"{step} {self.totals[step]:.1f}s ({self.counts[step]}x)" for step in steps)
+
+async def _first_completed(tasks, timeout_ms, what):
+    """
+    Returns the index of the first task to succeed; failures only count once every task failed.
+    """
+    pending = set(tasks)
+    deadline = time.monotonic() + timeout_ms / 1000
+    last_error = None
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return tasks.index(task)
+                last_error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+        # Collect every outcome so losing waiters never log "exception was never retrieved"
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if last_error is not None and not isinstance(last_error, PlaywrightTimeoutError):
+        raise last_error
+    raise PlaywrightTimeoutError(f"Timeout {timeout_ms}ms exceeded waiting for {what}")
+
+async def race_selectors(page, selectors, timeout=15000, state="visible"):
+    """
+    Waits until any of the selectors reaches `state` and returns the one that won.
+    """
+    tasks = [asyncio.ensure_future(page.wait_for_selector(selector, state=state, timeout=timeout)) for selector in selectors]
+    index = await _first_completed(tasks, timeout, " / ".join(selectors))
+    return selectors[index]
+
+def is_form_post(response, site_url):
+    """
+    Response predicate for a form POST back to the bookmarking site itself.
+    """
+    request = response.request
+    return request.method == "POST" and urlparse(request.url).netloc == urlparse(site_url).netloc
+
+async def click_and_wait_for_submit(page, selector, site_url, timeout=15000):
+    """
+    Clicks a submit control and returns once the site answered the POST or the main frame
+    navigated, whichever comes first. Returns the POST's response (its status is for the
+    caller to judge), or None when only the navigation was seen.
+    """
+    old_url = page.url
+    outcome = asyncio.get_running_loop().create_future()
+
+    # Listeners are attached before the click so a fast response cannot slip past
+    def on_response(response):
+        if not outcome.done() and is_form_post(response, site_url):
+            outcome.set_result(response)
+
+    def on_navigated(frame):
+        if not outcome.done() and frame == page.main_frame and frame.url != old_url:
+            outcome.set_result(None)
+
+    page.on("response", on_response)
+    page.on("framenavigated", on_navigated)
+    try:
+        await page.click(selector)
+        return await asyncio.wait_for(outcome, timeout / 1000)
+    except asyncio.TimeoutError:
+        raise PlaywrightTimeoutError(f"Timeout {timeout}ms exceeded waiting for submit response after clicking {selector}")
+    finally:
+        page.remove_listener("response", on_response)
+        page.remove_listener("framenavigated", on_navigated)